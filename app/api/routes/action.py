@@ -1,12 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 import logging
 from api.routes.user import current_user_info
 from typing import Literal, Optional
 from datetime import datetime
 from database_utils import get_db_cursor, get_placeholder
 from pydantic import BaseModel
-from langchain_community.chat_models import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
+from api.utils.openai_client import achat_text
 
 
 router = APIRouter()
@@ -228,6 +228,40 @@ def _build_human(question: str, answer: str, ui_lang: str) -> str:
     return (answer or "").strip()
 
 
+def _persist_action_result(user_id: int, thread_id: Optional[int], q_text: str, result: str) -> int:
+    """thread_qa に action の結果を保存し、使ったスレッド ID を返す"""
+    assigned_thread_id = None
+    ph = get_placeholder()
+    with get_db_cursor() as (cur, conn):
+        # Ensure thread
+        if thread_id is not None:
+            cur.execute(f"SELECT id, user_id FROM threads WHERE id = {ph}", (thread_id,))
+            row = cur.fetchone()
+            if row:
+                    if int(row['user_id']) == int(user_id):
+                        assigned_thread_id = int(row['id'])
+
+        if assigned_thread_id is None:
+            cur.execute(
+                f"INSERT INTO threads (user_id, last_updated) VALUES ({ph}, {ph})",
+                (user_id, datetime.now()),
+            )
+            assigned_thread_id = cur.lastrowid
+
+        cur.execute(
+            f"""
+            INSERT INTO thread_qa (thread_id, question, answer, rag_qa, type)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+            """,
+            (assigned_thread_id, q_text, result, "[]", "action"),
+        )
+        cur.execute(
+            f"UPDATE threads SET last_updated = {ph} WHERE id = {ph}",
+            (datetime.now(), assigned_thread_id),
+        )
+        conn.commit()
+    return assigned_thread_id
+
 @router.post("/apply")
 async def apply_action(payload: ActionPayload, current_user: dict = Depends(current_user_info)):
     # Determine UI language from user profile
@@ -250,7 +284,7 @@ async def apply_action(payload: ActionPayload, current_user: dict = Depends(curr
 
     # Choose a lightweight, separate model from RAG generation
     # Some hosted models only accept the default temperature (1). Set explicitly to avoid 400 errors.
-    llm = ChatOpenAI(model="gpt-4.1-nano", temperature=1)
+    model = "gpt-4.1-nano"
     sys = _build_system_prompt(payload.action, payload.target_lang, ui_lang)
 
     try:
@@ -267,8 +301,10 @@ async def apply_action(payload: ActionPayload, current_user: dict = Depends(curr
         except Exception:
             pass
 
-        resp = llm.invoke([SystemMessage(content=sys), HumanMessage(content=human)])
-        result = (resp.content or "").strip()
+        result = await achat_text(
+            [{"role": "system", "content": sys}, {"role": "user", "content": human}],
+            model=model, temperature=1, timeout_s=60,
+        )
         # If simplify produced an output identical to the input answer, retry with a stronger instruction
         if payload.action == "simplify" and answer and result.strip() == answer.strip():
             sys2 = sys + (
@@ -276,79 +312,20 @@ async def apply_action(payload: ActionPayload, current_user: dict = Depends(curr
                 "shorten sentences, use more common words, and preserve meaning. Output only the rewritten Answer."
             )
             try:
-                resp2 = llm.invoke([SystemMessage(content=sys2), HumanMessage(content=human)])
-                result2 = (resp2.content or "").strip()
+                result2 = await achat_text(
+                    [{"role": "system", "content": sys2}, {"role": "user", "content": human}],
+                    model=model, temperature=1, timeout_s=60,
+                )
                 if result2 and result2 != result:
                     result = result2
             except Exception:
                 # Ignore retry errors and keep original result
                 pass
-        # Persist into thread history
-        user_id = current_user["id"]
-        assigned_thread_id = None
-        ph = get_placeholder()
-        with get_db_cursor() as (cur, conn):
-            # Ensure thread
-            if payload.thread_id is not None:
-                cur.execute(f"SELECT id, user_id FROM threads WHERE id = {ph}", (payload.thread_id,))
-                row = cur.fetchone()
-                if row:
-                        if int(row['user_id']) == int(user_id):
-                            assigned_thread_id = int(row['id'])
-
-            if assigned_thread_id is None:
-                cur.execute(
-                    f"INSERT INTO threads (user_id, last_updated) VALUES ({ph}, {ph})",
-                    (user_id, datetime.now()),
-                )
-                assigned_thread_id = cur.lastrowid
-
-            # Ensure columns exist: rag_qa, type
-            try:
-                    # Check if columns exist in MySQL
-                    cur.execute("""
-                        SELECT COUNT(*) FROM information_schema.COLUMNS 
-                        WHERE TABLE_SCHEMA = DATABASE() 
-                        AND TABLE_NAME = 'thread_qa' 
-                        AND COLUMN_NAME = 'rag_qa'
-                    """)
-                    row = cur.fetchone()
-                    cnt = row['COUNT(*)'] if isinstance(row, dict) and 'COUNT(*)' in row else (list(row.values())[0] if isinstance(row, dict) else row[0])
-                    if cnt == 0:
-                        cur.execute("ALTER TABLE thread_qa ADD COLUMN rag_qa TEXT")
-                    cur.execute("""
-                        SELECT COUNT(*) FROM information_schema.COLUMNS 
-                        WHERE TABLE_SCHEMA = DATABASE() 
-                        AND TABLE_NAME = 'thread_qa' 
-                        AND COLUMN_NAME = 'type'
-                    """)
-                    row = cur.fetchone()
-                    cnt = row['COUNT(*)'] if isinstance(row, dict) and 'COUNT(*)' in row else (list(row.values())[0] if isinstance(row, dict) else row[0])
-                    if cnt == 0:
-                        cur.execute("ALTER TABLE thread_qa ADD COLUMN type TEXT")
-                    conn.commit()
-            except Exception:
-                pass
-
-            q_text = (payload.action_label or f"Action: {payload.action}").strip()
-            try:
-                cur.execute(
-                    f"""
-                    INSERT INTO thread_qa (thread_id, question, answer, rag_qa, type)
-                    VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
-                    """,
-                    (assigned_thread_id, q_text, result, "[]", "action"),
-                )
-            except Exception:
-                cur.execute(
-                    f"INSERT INTO thread_qa (thread_id, question, answer) VALUES ({ph}, {ph}, {ph})",
-                    (assigned_thread_id, q_text, result),
-                )
-            cur.execute(
-                f"UPDATE threads SET last_updated = {ph} WHERE id = {ph}",
-                (datetime.now(), assigned_thread_id),
-            )
-            conn.commit()
+        # Persist into thread history (pymysql はブロッキングなのでスレッドで実行)
+        q_text = (payload.action_label or f"Action: {payload.action}").strip()
+        assigned_thread_id = await run_in_threadpool(
+            _persist_action_result, current_user["id"], payload.thread_id, q_text, result,
+        )
 
         return {"result": result, "thread_id": assigned_thread_id}
     except Exception as e:
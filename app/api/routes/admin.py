@@ -1,12 +1,15 @@
 from datetime import datetime,timedelta
 from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from api.routes.user import current_user_info
 from api.utils.translator import question_translate, answer_translate
 from config import language_mapping
-from database_utils import get_db_cursor, get_placeholder
+from database_utils import get_db_cursor, get_placeholder, pool_stats
 from api.utils.translator import translate
 from models.schemas import QuestionRequest, moveCategoryRequest, RegisterQuestionRequest
-from api.utils.RAG import append_qa_to_vector_index, append_qa_to_vector_index_for_languages, add_qa_id_to_ignore, ignore_current_vectors_for_qa_languages
+from api.utils.RAG import append_qa_to_vector_index, append_qa_to_vector_index_for_languages, remove_qa_from_vector_index, compact_vector_indexes
+from api.utils import RAG
+from api.utils import vector_store, embedding_cache, answer_cache, lexical
 
 router = APIRouter()
 
@@ -48,8 +51,6 @@ def _register_question_background(
             # 通知（全体）
             try:
                 snippet_length = 50
-                _ensure_system_user()
-                _ensure_notifications_question_id()
                 try:
                     cursor.execute(
                         f"INSERT INTO notifications (user_id, is_read, time, global_read_users, question_id) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})",
@@ -122,113 +123,8 @@ def _register_question_background(
         # ベクトル
         try:
             append_qa_to_vector_index(question_id, answer_id)
-        except Exception:
-            pass
-    except Exception:
-        pass
-def _ensure_system_user() -> None:
-    """Ensure a special system user with id = -1 exists for global notifications.
-    Some code uses user_id = -1 to mark global notifications; satisfy FK.
-    """
-    try:
-        ph = get_placeholder()
-        with get_db_cursor() as (cur, conn):
-            cur.execute(f"SELECT id FROM user WHERE id = {ph}", (-1,))
-            row = cur.fetchone()
-            if not row:
-                try:
-                    # Insert minimal row. Adjust columns as per existing schema.
-                    cur.execute(
-                        f"INSERT INTO user (id, name, password, spoken_language) VALUES ({ph}, {ph}, {ph}, {ph})",
-                        (-1, "__system__", "", "English"),
-                    )
-                    conn.commit()
-                except Exception:
-                    # If insertion fails (e.g., different schema), skip; caller may handle differently.
-                    pass
-    except Exception:
-        pass
-def _ensure_answer_translation_history() -> None:
-    try:
-        with get_db_cursor() as (cur, conn):
-            cur.execute("""
-                    CREATE TABLE IF NOT EXISTS answer_translation_history (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        answer_id INT NOT NULL,
-                        language_id INT NOT NULL,
-                        texts TEXT NOT NULL,
-                        edited_at DATETIME NOT NULL,
-                        editor_user_id INT,
-                        editor_name TEXT,
-                        INDEX idx_ath_answer_lang (answer_id, language_id)
-                    )
-                """)
-            conn.commit()
-    except Exception:
-        pass
-
-def _ensure_question_grammar_check_table():
-    try:
-        with get_db_cursor() as (cur, conn):
-            cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS question_grammar_check (
-                        question_id INT NOT NULL,
-                        language_id INT NOT NULL,
-                        grammar_check_enabled BOOLEAN DEFAULT FALSE,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        PRIMARY KEY (question_id, language_id),
-                        FOREIGN KEY (question_id) REFERENCES question (question_id),
-                        FOREIGN KEY (language_id) REFERENCES language (id)
-                    )
-                    """
-                )
-            conn.commit()
-    except Exception:
-        pass
-
-def _ensure_notifications_question_id():
-    try:
-        with get_db_cursor() as (cur, conn):
-                cur.execute("""
-                    SELECT COUNT(*) FROM information_schema.COLUMNS 
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND TABLE_NAME = 'notifications' 
-                    AND COLUMN_NAME = 'question_id'
-                """)
-                row = cur.fetchone()
-                cnt = row['COUNT(*)'] if isinstance(row, dict) and 'COUNT(*)' in row else (list(row.values())[0] if isinstance(row, dict) else row[0])
-                if cnt == 0:
-                    cur.execute("ALTER TABLE notifications ADD COLUMN question_id INT")
-                    conn.commit()
-    except Exception:
-        pass
-
-def _ensure_question_editor_columns():
-    try:
-        with get_db_cursor() as (cur, conn):
-                cur.execute("""
-                    SELECT COUNT(*) FROM information_schema.COLUMNS 
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND TABLE_NAME = 'question' 
-                    AND COLUMN_NAME IN ('last_editor_id', 'last_edited_at')
-                """)
-                row = cur.fetchone()
-                existing_cols = row['COUNT(*)'] if isinstance(row, dict) and 'COUNT(*)' in row else (list(row.values())[0] if isinstance(row, dict) else row[0])
-                if existing_cols < 2:
-                    cur.execute("""
-                        SELECT COLUMN_NAME FROM information_schema.COLUMNS 
-                        WHERE TABLE_SCHEMA = DATABASE() 
-                        AND TABLE_NAME = 'question' 
-                        AND COLUMN_NAME IN ('last_editor_id', 'last_edited_at')
-                    """)
-                    cols = [r['COLUMN_NAME'] for r in cur.fetchall()]
-                    if "last_editor_id" not in cols:
-                        cur.execute("ALTER TABLE question ADD COLUMN last_editor_id INT")
-                    if "last_edited_at" not in cols:
-                        cur.execute("ALTER TABLE question ADD COLUMN last_edited_at DATETIME")
-                    conn.commit()
+        except Exception as e:
+            print(f"ベクトル更新エラー: {str(e)}")
     except Exception:
         pass
 
@@ -259,7 +155,6 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
             question_id = row['question_id']
 
             # 🔍 `question` テーブルから 投稿者 と 直近編集者 を取得
-            _ensure_question_editor_columns()
             cursor.execute(f"SELECT user_id, COALESCE(last_editor_id, user_id) FROM question WHERE question_id = {ph}", (question_id,))
             row = cursor.fetchone()
             if row is None:
@@ -270,7 +165,6 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
             # ベクトルの無効化は言語確定後に実行
 
             # 🔄 `answer_translation` テーブルを更新（履歴保存付き）
-            _ensure_answer_translation_history()
 
             # まず、編集対象言語の現行テキストを履歴へ保存（差分があるときのみ）
             try:
@@ -329,9 +223,6 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
 
             # 4. 文法チェック機能
             if translate_to_all:
-                # 文法チェック設定テーブルを確保
-                _ensure_question_grammar_check_table()
-                
                 # 現在編集中の言語の文法チェックが有効かチェック
                 cursor.execute(
                     f"SELECT grammar_check_enabled FROM question_grammar_check WHERE question_id = {ph} AND language_id = {ph}",
@@ -409,7 +300,6 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
             else:
                 # 単一言語編集時：編集中の自言語のみチェックを有効化（他言語は変更しない）
                 try:
-                    _ensure_question_grammar_check_table()
                     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     cursor.execute(
                         f"SELECT grammar_check_enabled FROM question_grammar_check WHERE question_id = {ph} AND language_id = {ph}",
@@ -451,7 +341,6 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
 
             # 🔖 最終編集者を更新（回答編集時）
             try:
-                _ensure_question_editor_columns()
                 cursor.execute(
                     f"UPDATE question SET last_editor_id = {ph}, last_edited_at = {ph} WHERE question_id = {ph}",
                     (operator_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id)
@@ -467,10 +356,7 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
                     # 編集言語のみベクトル更新
                     updated_languages = [language_label_to_code.get(spoken_language, "ja")]
                     
-                    # 更新対象言語の現在のベクトルを無効化
-                    ignore_current_vectors_for_qa_languages(question_id, answer_id, updated_languages)
-                    
-                    # 新しいベクトルを追加
+                    # 同じ QA.id の古いベクトルを置き換える
                     append_qa_to_vector_index_for_languages(question_id, answer_id, updated_languages)
                 except Exception as e:
                     print(f"ベクトル更新エラー(編集言語のみ): {str(e)}")
@@ -478,7 +364,6 @@ async def answer_edit(request: dict, background_tasks: BackgroundTasks, current_
             # 📢 【通知の登録】直近編集者に個人通知（自分以外）
             if prev_editor_id and operator_id != prev_editor_id:
                 # 🔹 `notifications` に通知を追加
-                _ensure_notifications_question_id()
                 cursor.execute(
                     f"INSERT INTO notifications (user_id, is_read, time, question_id) VALUES ({ph}, {ph}, {ph}, {ph})",
                     (prev_editor_id, False, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id),
@@ -556,7 +441,6 @@ async def get_answer_history(
     try:
         ph = get_placeholder()
         with get_db_cursor() as (cursor, conn):
-            _ensure_answer_translation_history()
             # Resolve language_id: explicit 'lang' param takes precedence
             if lang:
                 language_id = _code_to_language_id(lang)
@@ -607,7 +491,6 @@ async def official_question(request: dict, current_user: dict = Depends(current_
         with get_db_cursor() as (cursor, conn):
 
             # 🔍 投稿者と直近編集者を取得
-            _ensure_question_editor_columns()
             cursor.execute(f"SELECT user_id, COALESCE(last_editor_id, user_id) FROM question WHERE question_id = {ph}", (question_id,))
             row = cursor.fetchone()
 
@@ -622,7 +505,6 @@ async def official_question(request: dict, current_user: dict = Depends(current_
             conn.commit()
             # mark last editor
             try:
-                _ensure_question_editor_columns()
                 cursor.execute(
                     f"UPDATE question SET last_editor_id = {ph}, last_edited_at = {ph} WHERE question_id = {ph}",
                     (operator_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id)
@@ -638,7 +520,6 @@ async def official_question(request: dict, current_user: dict = Depends(current_
                 )
 
                 # 🔹 `notifications` に通知を追加
-                _ensure_notifications_question_id()
                 cursor.execute(
                     f"INSERT INTO notifications (user_id, is_read, time, question_id) VALUES ({ph}, {ph}, {ph}, {ph})",
                     (prev_editor_id, False, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id),
@@ -694,7 +575,6 @@ async def delete_question(request: QuestionRequest, current_user: dict = Depends
         with get_db_cursor() as (cursor, conn):
 
             # 🔍 質問の投稿者・直近編集者を取得
-            _ensure_question_editor_columns()
             cursor.execute(f"SELECT user_id, COALESCE(last_editor_id, user_id) FROM question WHERE question_id = {ph}", (question_id,))
             row = cursor.fetchone()
 
@@ -714,21 +594,11 @@ async def delete_question(request: QuestionRequest, current_user: dict = Depends
             qa_id = qa_row['id']
             answer_id = qa_row['answer_id']
 
-            # 🧹 ベクトルをグローバルに無効化（QA IDベース）
+            # 🔥 ベクトルインデックスから削除（QA IDベース）
             try:
-                add_qa_id_to_ignore(qa_id)
-            except Exception:
-                pass
-
-            # 🔥 ベクトルインデックスから削除（QA削除前にqa_idを取得）
-            try:
-                cursor.execute(f"SELECT id FROM QA WHERE question_id = {ph} AND answer_id = {ph}", (question_id, answer_id))
-                qa_row = cursor.fetchone()
-                if qa_row:
-                    qa_id = qa_row['id']
-                    add_qa_id_to_ignore(qa_id)  # ベクトル検索時に無視リストに追加
-            except Exception:
-                pass
+                remove_qa_from_vector_index(qa_id)
+            except Exception as e:
+                print(f"ベクトル削除エラー: {str(e)}")
 
             # 🔹 データ削除処理（トランザクション処理を使用）
             cursor.execute(f"DELETE FROM question WHERE question_id = {ph}", (question_id,))
@@ -741,7 +611,6 @@ async def delete_question(request: QuestionRequest, current_user: dict = Depends
 
             # 🔥 関連する既存通知をクリーンアップ（削除通知を新規作成する前に）
             try:
-                _ensure_notifications_question_id()
                 cursor.execute(f"SELECT id FROM notifications WHERE question_id = {ph}", (question_id,))
                 old_notifs = [r['id'] for r in cursor.fetchall()]
                 if old_notifs:
@@ -756,7 +625,6 @@ async def delete_question(request: QuestionRequest, current_user: dict = Depends
                 notification_message = f"あなたの質問（ID: {question_id}）が管理者({operator_id})により削除されました。"
 
                 # 🔹 `notifications` に通知を追加
-                _ensure_notifications_question_id()
                 cursor.execute(
                     f"INSERT INTO notifications (user_id, is_read, time, question_id) VALUES ({ph}, {ph}, {ph}, {ph})",
                     (prev_editor_id, False, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id),
@@ -811,7 +679,6 @@ async def change_category(request: moveCategoryRequest, current_user: dict = Dep
         with get_db_cursor() as (cursor, conn):
 
             # 🔍 質問の投稿者・直近編集者 と 元のカテゴリIDを取得
-            _ensure_question_editor_columns()
             cursor.execute(f"SELECT user_id, COALESCE(last_editor_id, user_id), category_id FROM question WHERE question_id = {ph}", (question_id,))
             row = cursor.fetchone()
 
@@ -835,7 +702,6 @@ async def change_category(request: moveCategoryRequest, current_user: dict = Dep
             
             # mark last editor
             try:
-                _ensure_question_editor_columns()
                 cursor.execute(
                     f"UPDATE question SET last_editor_id = {ph}, last_edited_at = {ph} WHERE question_id = {ph}",
                     (operator_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id)
@@ -847,7 +713,6 @@ async def change_category(request: moveCategoryRequest, current_user: dict = Dep
             # 📢 【通知の登録】直近編集者に通知（自分以外）
             if prev_editor_id and operator_id != prev_editor_id:
                 # 🔹 `notifications` に通知を追加
-                _ensure_notifications_question_id()
                 cursor.execute(
                     f"INSERT INTO notifications (user_id, is_read, time, question_id) VALUES ({ph}, {ph}, {ph}, {ph})",
                     (prev_editor_id, False, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), question_id),
@@ -924,7 +789,6 @@ async def register_question(
         conn.commit()  # 質問挿入後にコミット
         # initialize last editor as creator at creation time
         try:
-            _ensure_question_editor_columns()
             cursor.execute(
                 f"UPDATE question SET last_editor_id = {ph}, last_edited_at = {ph} WHERE question_id = {ph}",
                 (user_id, japan_time, question_id)
@@ -977,7 +841,6 @@ async def register_question(
 
         # 📌 新規質問登録時の文法チェック設定初期化（登録言語のみ有効、他言語は無効）
         try:
-            _ensure_question_grammar_check_table()
             # 全ての言語に対して文法チェック設定を作成
             for lang_id in languages:
                 # 登録された言語（人間が入力したオリジナル言語）のみ有効、他は無効
@@ -1037,8 +900,6 @@ async def get_grammar_check_setting(question_id: int, language_id: int = None, c
     try:
         ph = get_placeholder()
         with get_db_cursor() as (cursor, conn):
-            _ensure_question_grammar_check_table()
-            
             cursor.execute(f"SELECT grammar_check_enabled FROM question_grammar_check WHERE question_id = {ph} AND language_id = {ph}", (question_id, language_id))
             row = cursor.fetchone()
             
@@ -1075,8 +936,6 @@ async def set_grammar_check_setting(request: dict, current_user: dict = Depends(
     try:
         ph = get_placeholder()
         with get_db_cursor() as (cursor, conn):
-            _ensure_question_grammar_check_table()
-            
             # 既存の設定をチェック
             cursor.execute(f"SELECT question_id FROM question_grammar_check WHERE question_id = {ph} AND language_id = {ph}", (question_id, language_id))
             exists = cursor.fetchone()
@@ -1112,8 +971,6 @@ async def initialize_all_grammar_check(current_user: dict = Depends(current_user
     try:
         ph = get_placeholder()
         with get_db_cursor() as (cursor, conn):
-            _ensure_question_grammar_check_table()
-            
             # 全ての質問IDと言語IDを取得
             cursor.execute("SELECT question_id FROM question")
             all_questions = [r['question_id'] for r in cursor.fetchall()]
@@ -1147,6 +1004,33 @@ async def initialize_all_grammar_check(current_user: dict = Depends(current_user
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"データベースエラー: {str(e)}")
 
+@router.post("/compact_vectors")
+async def compact_vectors(language_code: str = None, current_user: dict = Depends(current_user_info)):
+    """ ベクトルストアを生きている QA だけで詰め直す（再埋め込みなし・稼働中でも実行可） """
+    try:
+        language_codes = [language_code.lower()] if language_code else None
+        report = await run_in_threadpool(compact_vector_indexes, language_codes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"コンパクションに失敗しました: {str(e)}")
+
+    return {
+        "message": "ベクトルストアのコンパクションが完了しました",
+        "languages": report,
+        "removed_total": sum(r["removed"] for r in report.values()),
+    }
+
+@router.get("/runtime_stats")
+async def runtime_stats(current_user: dict = Depends(current_user_info)):
+    """ 応答したワーカープロセスのキャッシュ統計（ベクトルストア・埋め込み・回答キャッシュ・BM25・DB 接続プール・会話要約） """
+    return {
+        "db_pool": pool_stats(),
+        "rag": RAG.stats(),
+        "vector_store": vector_store.cache_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "lexical": lexical.stats(),
+    }
+
 # ----- Background task helpers -------------------------------------------------
 def _background_translate_all_languages(
     answer_id: int,
@@ -1226,7 +1110,6 @@ def _background_translate_all_languages(
             # ベクトル更新（全言語）
             try:
                 updated_languages = list(language_label_to_code.values())
-                ignore_current_vectors_for_qa_languages(question_id, answer_id, updated_languages)
                 append_qa_to_vector_index_for_languages(question_id, answer_id, updated_languages)
             except Exception as e:
                 print(f"ベクトル更新エラー: {str(e)}")
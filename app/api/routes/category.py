@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 import openai  as oepnai
 import numpy as np
-from typing import Tuple
+from typing import Optional, Tuple
 from sklearn.metrics.pairwise import cosine_similarity
 from config import language_mapping
-from database_utils import get_db_cursor, get_placeholder
+from database_utils import get_db_cursor, get_async_db_cursor, get_placeholder
 from api.routes.user import current_user_info
+from api.utils.pagination import encode_cursor, parse_cursor, clamp_limit, SNIPPET_CHARS, snippet as snippet_text
 
 router = APIRouter()
 
@@ -35,70 +36,111 @@ async def get_translated_category(
         }
 
 
+CATEGORY_MAX_LIMIT = 500
+
 @router.get("/category/{category_id}")
 async def get_category_questions(
     category_id: int,
+    limit: Optional[int] = Query(None, description=f"1 ページの件数（省略時は全件、最大 {CATEGORY_MAX_LIMIT}）"),
+    after: Optional[str] = Query(None, description="前ページの next_cursor（time,QA.id）"),
+    snippet: bool = Query(False, description=f"質問文・回答文を先頭 {SNIPPET_CHARS} 文字に切り詰めて返す"),
     current_user: dict = Depends(current_user_info)
 ):
     """
     指定されたカテゴリIDに基づいて質問と回答を取得します。
     ユーザーのspoken_languageを基に言語を動的に切り替えます。
+    limit を指定すると新しい順に limit 件ずつ返し、続きは next_cursor を after に渡して取得します。
     """
     spoken_language = current_user["spoken_language"]
     language_id = language_mapping.get(spoken_language)
-    
+    try:
+        cursor_key = parse_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page_size = clamp_limit(limit, 0, CATEGORY_MAX_LIMIT)  # 0 = 全件
+
     ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
+    keyset, keyset_params = "", []
+    if cursor_key:
+        keyset = f"AND (question.time < {ph} OR (question.time = {ph} AND QA.id < {ph}))"
+        keyset_params = [cursor_key[0], cursor_key[0], cursor_key[1]]
+    question_column = f"LEFT(question_translation.texts, {SNIPPET_CHARS + 1})" if snippet else "question_translation.texts"
+    answer_column = f"LEFT(answer_translation.texts, {SNIPPET_CHARS + 1})" if snippet else "answer_translation.texts"
+    page_clause, page_params = "", []
+    if page_size:
+        page_clause, page_params = f"LIMIT {ph}", [page_size + 1]  # 次ページの有無を知るため 1 件多く取る
+
+    async with get_async_db_cursor() as (cursor, conn):
         # カテゴリ名を取得
-        cursor.execute(f"SELECT description FROM category WHERE id = {ph}", (category_id,))
-        category_row = cursor.fetchone()
+        await cursor.execute(f"SELECT description FROM category WHERE id = {ph}", (category_id,))
+        category_row = await cursor.fetchone()
         if not category_row:
             raise HTTPException(status_code=404, detail="カテゴリが見つかりませんでした。")
         
         category_name = category_row['description']
         
-        # 質問と回答を取得
-        cursor.execute(
+        # 質問と回答を取得（ページの行はインデックスと主キーだけで決め、本文はそのページ分だけ読む）
+        await cursor.execute(
             f"""
+            WITH page AS (
+                SELECT QA.id AS qa_id, question.time
+                FROM question
+                JOIN QA ON QA.question_id = question.question_id
+                JOIN question_translation ON question.question_id = question_translation.question_id
+                    AND question_translation.language_id = {ph}
+                JOIN answer_translation ON QA.answer_id = answer_translation.answer_id
+                    AND answer_translation.language_id = {ph}
+                WHERE question.category_id = {ph} AND
+                question.public = {ph}
+                {keyset}
+                ORDER BY question.time DESC, QA.id DESC
+                {page_clause}
+            )
             SELECT 
+                page.qa_id,
                 question.question_id AS question_id,
                 QA.answer_id,
-                question_translation.texts AS question_text,
-                answer_translation.texts AS answer_text,
+                {question_column} AS question_text,
+                {answer_column} AS answer_text,
                 question.title AS question_title,
                 question.time AS time
-            FROM QA
+            FROM page
+            JOIN QA ON QA.id = page.qa_id
             JOIN question ON QA.question_id = question.question_id
-            JOIN answer ON QA.answer_id = answer.id
             JOIN question_translation ON question.question_id = question_translation.question_id
-            JOIN answer_translation ON answer.id = answer_translation.answer_id
-            WHERE question.category_id = {ph} AND 
-            question_translation.language_id = {ph} AND 
-            answer_translation.language_id = {ph} AND
-            question.public = {ph}
+                AND question_translation.language_id = {ph}
+            JOIN answer_translation ON QA.answer_id = answer_translation.answer_id
+                AND answer_translation.language_id = {ph}
+            ORDER BY page.time DESC, page.qa_id DESC
             """,
-            (category_id, language_id, language_id, 1)
+            (language_id, language_id, category_id, 1, *keyset_params, *page_params, language_id, language_id)
         )
-        qa_list = cursor.fetchall()
-
-        if not qa_list:
-            raise HTTPException(status_code=404, detail="該当する質問と回答が見つかりませんでした。")
-
-        results = [
-            {
-                "question_id": qa['question_id'],
-                "answer_id": qa['answer_id'],
-                "質問": qa['question_text'],
-                "回答": qa['answer_text'],
-                "title": qa['question_title'],
-                "time": qa['time']
-            }
-            for qa in qa_list
-        ]
+        qa_list = await cursor.fetchall()
+
+    if not qa_list and not cursor_key:
+        raise HTTPException(status_code=404, detail="該当する質問と回答が見つかりませんでした。")
+
+    next_cursor = None
+    if page_size and len(qa_list) > page_size:
+        qa_list = qa_list[:page_size]
+        next_cursor = encode_cursor(qa_list[-1]['time'], qa_list[-1]['qa_id'])
+
+    results = [
+        {
+            "question_id": qa['question_id'],
+            "answer_id": qa['answer_id'],
+            "質問": snippet_text(qa['question_text']) if snippet else qa['question_text'],
+            "回答": snippet_text(qa['answer_text']) if snippet else qa['answer_text'],
+            "title": qa['question_title'],
+            "time": qa['time']
+        }
+        for qa in qa_list
+    ]
 
     return {
         "category_name": category_name,
-        "questions": results
+        "questions": results,
+        "next_cursor": next_cursor,
     }
 
 @router.get("/category_admin/{category_id}")
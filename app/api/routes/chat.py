@@ -1,19 +1,18 @@
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import List, Tuple
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 
 from database_utils import get_db_cursor, get_placeholder
 from models.schemas import Question
 from api.routes.user import current_user_info
-from api.routes.question import get_answer as backend_get_answer
+from api.routes.question import get_answer as backend_get_answer, _resolve_thread
 from api.utils.reactive import (
     classify_intent,
     resolve_target_text,
     _detect_target_lang,
-    translate_text,
-    summarize_text,
-    rewrite_text,
+    arun_task,
 )
 
 router = APIRouter()
@@ -40,6 +39,23 @@ def _get_last_5_history(thread_id: int) -> List[Tuple[str, str]]:
     return result
 
 
+def _save_reactive_answer(thread_id: int, question_text: str, answer_text: str) -> None:
+    ph = get_placeholder()
+    with get_db_cursor() as (cursor, conn):
+        cursor.execute(
+            f"""
+            INSERT INTO thread_qa (thread_id, question, answer, rag_qa)
+            VALUES ({ph}, {ph}, {ph}, {ph})
+            """,
+            (thread_id, question_text, answer_text, None),
+        )
+        cursor.execute(
+            f"UPDATE threads SET last_updated = {ph} WHERE id = {ph}",
+            (datetime.now(), thread_id),
+        )
+        conn.commit()
+
+
 @router.post("/respond")
 async def respond(request: Question, current_user: dict = Depends(current_user_info)):
     """
@@ -51,33 +67,13 @@ async def respond(request: Question, current_user: dict = Depends(current_user_i
     user_id = current_user["id"]
     user_lang = current_user.get("spoken_language", "ja")
 
-    # Thread handling (align with question.get_answer)
-    ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        assigned_thread_id: Optional[int] = None
-
-        if request.thread_id is not None:
-            cursor.execute(f"SELECT id, user_id FROM threads WHERE id = {ph}", (request.thread_id,))
-            row = cursor.fetchone()
-            if row:
-                row_user_id = row['user_id']
-                   
-                if row_user_id != user_id:
-                    raise HTTPException(status_code=403, detail="このスレッドにアクセスする権限がありません")
-                assigned_thread_id = request.thread_id
-
-        if assigned_thread_id is None:
-            cursor.execute(
-                f"INSERT INTO threads (user_id, last_updated) VALUES ({ph}, {ph})",
-                (user_id, datetime.now()),
-            )
-            assigned_thread_id = cursor.lastrowid
-            conn.commit()
+    # Thread handling (same as question.get_answer; pymysql runs in the threadpool)
+    assigned_thread_id = await run_in_threadpool(_resolve_thread, user_id, request.thread_id)
 
     # Load last 5 turns for routing
-    history_qa = _get_last_5_history(assigned_thread_id)
+    history_qa = await run_in_threadpool(_get_last_5_history, assigned_thread_id)
 
-    # Intent classification (conservative)
+    # Intent classification (conservative; rule-based, no API call)
     intent = classify_intent(question_text)
     if intent is None:
         # Delegate to backend (RAG)
@@ -101,17 +97,13 @@ async def respond(request: Question, current_user: dict = Depends(current_user_i
         backend_result.update({"route": "backend", "reason": "insufficient_reactive_context"})
         return backend_result
 
-    # Decide target/output language (for translate/summarize/rewrite)
+    # Decide target/output language for the task
     # Default to user's spoken language when unspecified.
     target_lang_code = _detect_target_lang(question_text, fallback=user_lang.lower())
 
     try:
-        if task_type == "translate":
-            answer_text = translate_text(target_text, target_lang_code)
-        elif task_type == "summarize":
-            answer_text = summarize_text(target_text, target_lang_code)
-        else:  # rewrite
-            answer_text = rewrite_text(target_text, target_lang_code)
+        # Every task type (translate/summarize/bullets/format/...) awaits the async client
+        answer_text = await arun_task(task_type, target_text, target_lang_code, question_text)
     except Exception as e:
         # On LLM error, fallback to backend
         backend_result = await backend_get_answer(
@@ -121,20 +113,7 @@ async def respond(request: Question, current_user: dict = Depends(current_user_i
         backend_result.update({"route": "backend", "reason": f"reactive_error:{str(e)}"})
         return backend_result
     
-    ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        cursor.execute(
-            f"""
-            INSERT INTO thread_qa (thread_id, question, answer, rag_qa)
-            VALUES ({ph}, {ph}, {ph}, {ph})
-            """,
-            (assigned_thread_id, question_text, answer_text, None),
-        )
-        cursor.execute(
-            f"UPDATE threads SET last_updated = {ph} WHERE id = {ph}",
-            (datetime.now(), assigned_thread_id),
-        )
-        conn.commit()
+    await run_in_threadpool(_save_reactive_answer, assigned_thread_id, question_text, answer_text)
 
     return {
         "route": "frontend",
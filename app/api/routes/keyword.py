@@ -1,19 +1,46 @@
-from fastapi import APIRouter, HTTPException, Depends
+import re
+from typing import List, Dict, Any, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query
 from database_utils import get_db_cursor, get_placeholder
 from api.routes.user import current_user_info
+from api.utils.pagination import clamp_limit
 
 router = APIRouter()
 
-@router.get("/search_with_language")
-async def search_keywords(keywords: str, current_user: dict = Depends(current_user_info)):
-    
-    results = []
-    keyword_list = []
+# MySQL の ngram パーサのトークン長（サーバ設定 ngram_token_size、既定 2）。これより短いキーワードは
+# FULLTEXT では引けないので LIKE で補う
+NGRAM_TOKEN_SIZE = 2
+MAX_LIMIT = 200
+
+# FULLTEXT インデックスは migrations.py（バージョン 9）で張る。張れていない環境では最初の検索で
+# エラーになるので、以降はプロセス内で LIKE だけで検索する
+_fulltext_available = True
+ER_FT_MATCHING_KEY_NOT_FOUND = 1191
 
+def _split_keywords(keywords: str) -> List[str]:
+    # 半角/全角スペース区切り。重複と空文字は除く（順序は保つ）
+    return list(dict.fromkeys(k for k in re.split(r"[ 　]+", keywords.strip()) if k))
+
+def _boolean_query(keyword_list: List[str]) -> str:
+    # 各キーワードをフレーズとして OR 検索（ngram ではフレーズ = 部分文字列一致に近い）
+    return " ".join('"{}"'.format(k.replace('"', " ")) for k in keyword_list)
+
+@router.get("/search_with_language")
+async def search_keywords(
+    keywords: str,
+    limit: Optional[int] = Query(None, description=f"1 ページの件数（省略時は全件、最大 {MAX_LIMIT}）"),
+    offset: int = 0,
+    current_user: dict = Depends(current_user_info),
+):
+    """ キーワードを含む QA をユーザーの言語で検索する（関連度順。limit を指定すると limit/offset でページング） """
     # ユーザーのspoken_languageを取得
     spoken_language = current_user["spoken_language"]
     print(f"spoken_language: {spoken_language}")  # デバッグ用ログ
 
+    limit = clamp_limit(limit, 0, MAX_LIMIT)  # 0 = 全件
+    offset = max(0, offset) if limit else 0
+
     # spoken_languageからlanguage_idを取得
     ph = get_placeholder()
     with get_db_cursor() as (cursor, conn):
@@ -25,81 +52,130 @@ async def search_keywords(keywords: str, current_user: dict = Depends(current_us
 
         language_id = language_row['id']
 
-    # キーワードを分割
-    tmp_keyword_list = keywords.split(" ")
-    for keyword in tmp_keyword_list:
-        keyword_list.extend(keyword.split("　"))
-
-    # キーワードの言語で検索を実行
-    for keyword in keyword_list:
-        results.extend(search_keyword(keyword, language_id))
-
-    # 検出された文を処理する
-    if results:
-        for result in results:
-            combined_text = result["question_text"] + result["answer_text"]
-            match_count = sum(keyword in combined_text for keyword in keyword_list)
-            result["match_count"] = match_count
-            for keyword in keyword_list:
-                result["question_text"] = result["question_text"].replace(keyword, f"<strong>{keyword}</strong>")
-                result["answer_text"] = result["answer_text"].replace(keyword, f"<strong>{keyword}</strong>")
-        sorted_results = sorted(results, key=lambda x: x["match_count"], reverse=True)
-
-        # 重複する結果を削除
-        unique_results = []
-        seen = set()
-        for result in sorted_results:
-            key = (result["question_id"], result["answer_id"])
-            if key not in seen:
-                unique_results.append(result)
-                seen.add(key)
-        sorted_results = unique_results
-
-    else:
-        sorted_results = []
-
-    return sorted_results
-
-def search_keyword(keyword: str, language_id: int):
+    keyword_list = _split_keywords(keywords)
+    if not keyword_list:
+        return []
+
+    results = search_keywords_in_language(keyword_list, language_id, limit, offset)
+
+    # 強調表示とヒットしたキーワード数は 1 件につき 1 回の正規表現で求める（長いキーワードを優先）
+    pattern = re.compile(
+        "|".join(re.escape(k) for k in sorted(keyword_list, key=len, reverse=True)),
+        re.IGNORECASE,
+    )
+    for result in results:
+        matched = set()
+
+        def _highlight(m):
+            matched.add(m.group(0).casefold())
+            return f"<strong>{m.group(0)}</strong>"
+
+        result["question_text"] = pattern.sub(_highlight, result["question_text"] or "")
+        result["answer_text"] = pattern.sub(_highlight, result["answer_text"] or "")
+        result["match_count"] = len(matched)
+
+    return results
+
+def search_keywords_in_language(keyword_list: List[str], language_id: int, limit: int = 0, offset: int = 0) -> List[Dict[str, Any]]:
     """
-    キーワードと言語IDを基にQA情報を検索する。
+    キーワード（いずれかを含む）と言語IDを基にQA情報を 1 クエリで検索する。limit=0 は全件。
+
+    質問文・回答文それぞれの FULLTEXT（ngram）で候補と関連度を求め、QA ごとに合算して並べる。
+    ngram のトークン長より短いキーワードと、FULLTEXT が使えない環境では LIKE で補う。
     """
-    keyword = f"%{keyword}%"
-    results = []
-    
+    global _fulltext_available
+    if _fulltext_available:
+        try:
+            return _search(keyword_list, language_id, limit, offset, use_fulltext=True)
+        except Exception as e:
+            # 1191: Can't find FULLTEXT index matching the column list（それ以外のエラーはそのまま返す）
+            if not e.args or e.args[0] != ER_FT_MATCHING_KEY_NOT_FOUND:
+                raise
+            print(f"FULLTEXT インデックスを利用できないため LIKE で検索します: {e}")
+            _fulltext_available = False
+    return _search(keyword_list, language_id, limit, offset, use_fulltext=False)
+
+def _search(keyword_list: List[str], language_id: int, limit: int, offset: int, use_fulltext: bool) -> List[Dict[str, Any]]:
     ph = get_placeholder()
+    long_keywords = [k for k in keyword_list if len(k) >= NGRAM_TOKEN_SIZE] if use_fulltext else []
+    like_keywords = [k for k in keyword_list if k not in long_keywords]
+
+    branches, params = [], []
+    if long_keywords:
+        boolean_query = _boolean_query(long_keywords)
+        branches.append(f"""
+            SELECT QA.id AS qa_id, MATCH(qtr.texts) AGAINST ({ph} IN BOOLEAN MODE) AS score
+            FROM question_translation qtr
+            JOIN QA ON QA.question_id = qtr.question_id
+            WHERE qtr.language_id = {ph} AND MATCH(qtr.texts) AGAINST ({ph} IN BOOLEAN MODE)
+        """)
+        params += [boolean_query, language_id, boolean_query]
+        branches.append(f"""
+            SELECT QA.id AS qa_id, MATCH(atr.texts) AGAINST ({ph} IN BOOLEAN MODE) AS score
+            FROM answer_translation atr
+            JOIN QA ON QA.answer_id = atr.answer_id
+            WHERE atr.language_id = {ph} AND MATCH(atr.texts) AGAINST ({ph} IN BOOLEAN MODE)
+        """)
+        params += [boolean_query, language_id, boolean_query]
+    for keyword in like_keywords:
+        # 1 キーワード一致を 1 点として扱う
+        branches.append(f"""
+            SELECT QA.id AS qa_id, 1 AS score
+            FROM QA
+            JOIN question_translation qtr ON QA.question_id = qtr.question_id AND qtr.language_id = {ph}
+            JOIN answer_translation atr ON QA.answer_id = atr.answer_id AND atr.language_id = {ph}
+            WHERE qtr.texts LIKE {ph} OR atr.texts LIKE {ph}
+        """)
+        params += [language_id, language_id, f"%{keyword}%", f"%{keyword}%"]
+
+    page_clause, page_params = "", []
+    if limit:
+        page_clause, page_params = f"LIMIT {ph} OFFSET {ph}", [limit, offset]
+
+    results = []
     with get_db_cursor() as (cursor, conn):
         cursor.execute(f"""
-            SELECT QA.question_id, 
-                   question_translation.texts AS question_text, 
-                   QA.answer_id, 
+            WITH hits AS ({" UNION ALL ".join(branches)}),
+            scored AS (SELECT qa_id, SUM(score) AS score FROM hits GROUP BY qa_id)
+            SELECT QA.question_id,
+                   question_translation.texts AS question_text,
+                   QA.answer_id,
                    answer_translation.texts AS answer_text,
-                   answer.time, 
-                   category.id AS category_id, 
-                   category.description AS category_description, 
-                   question.title
-            FROM QA
+                   answer.time,
+                   category.id AS category_id,
+                   category.description AS category_description,
+                   question.title,
+                   scored.score
+            FROM scored
+            JOIN QA ON QA.id = scored.qa_id
             JOIN answer ON QA.answer_id = answer.id
             JOIN answer_translation ON QA.answer_id = answer_translation.answer_id AND answer_translation.language_id = {ph}
             JOIN question_translation ON QA.question_id = question_translation.question_id AND question_translation.language_id = {ph}
             JOIN question ON QA.question_id = question.question_id
             JOIN category ON question.category_id = category.id
-            WHERE question_translation.texts LIKE {ph} OR answer_translation.texts LIKE {ph}
-        """, (language_id, language_id, keyword, keyword))
+            ORDER BY scored.score DESC, QA.id DESC
+            {page_clause}
+        """, (*params, language_id, language_id, *page_params))
         search_results = cursor.fetchall()
-        
-        if search_results:
-            for search_result in search_results:
-                results.append({
-                    "category_id": search_result['category_id'],
-                    "category_text": search_result['category_description'],
-                    "question_id": search_result['question_id'],
-                    "question_text": search_result['question_text'],
-                    "answer_id": search_result['answer_id'],
-                    "answer_text": search_result['answer_text'],
-                    "language_id": language_id,
-                    "update_time": search_result['time'],
-                    "title": search_result['title']
-                })
-            
+
+    # 同じ (question_id, answer_id) を指す QA が複数あっても 1 件にまとめる
+    seen = set()
+    for search_result in search_results:
+        key = (search_result['question_id'], search_result['answer_id'])
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append({
+            "category_id": search_result['category_id'],
+            "category_text": search_result['category_description'],
+            "question_id": search_result['question_id'],
+            "question_text": search_result['question_text'],
+            "answer_id": search_result['answer_id'],
+            "answer_text": search_result['answer_text'],
+            "language_id": language_id,
+            "update_time": search_result['time'],
+            "title": search_result['title'],
+            "score": float(search_result['score'] or 0),
+        })
+
     return results
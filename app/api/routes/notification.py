@@ -1,7 +1,7 @@
 import json
 from fastapi import APIRouter, HTTPException, Depends
 from config import language_mapping
-from database_utils import get_db_cursor, get_placeholder
+from database_utils import get_db_cursor, get_async_db_cursor, get_placeholder
 from api.routes.user import current_user_info
 from models.schemas import NotificationRequest
 
@@ -22,9 +22,9 @@ async def get_notifications(current_user: dict = Depends(current_user_info)):
         
         
         ph = get_placeholder()
-        with get_db_cursor() as (cursor, conn):
+        async with get_async_db_cursor() as (cursor, conn):
             # 🔍 指定ユーザーの未読通知を取得（`notifications_translation` から翻訳を取得）
-            cursor.execute(f"""
+            await cursor.execute(f"""
                 SELECT n.id, 
                        COALESCE(nt.messages, (SELECT messages FROM notifications_translation 
                                               WHERE notification_id = n.id AND language_id = 2)) AS message, 
@@ -38,7 +38,7 @@ async def get_notifications(current_user: dict = Depends(current_user_info)):
                 ORDER BY n.time DESC
             """, (language_id, user_id))
             
-            notifications = cursor.fetchall()
+            notifications = await cursor.fetchall()
 
             if not notifications:
                 return {"notifications": []}  # 通知がない場合は空のリストを返す
@@ -90,8 +90,8 @@ async def get_notifications_global(current_user: dict = Depends(current_user_inf
     language_id = language_mapping.get(spoken_language, 2)  # デフォルトは英語 (2)
     
     ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        cursor.execute(f"""
+    async with get_async_db_cursor() as (cursor, conn):
+        await cursor.execute(f"""
             SELECT n.id, 
                    COALESCE(nt.messages, (SELECT messages FROM notifications_translation 
                                           WHERE notification_id = n.id AND language_id = 2)) AS message, 
@@ -107,7 +107,7 @@ async def get_notifications_global(current_user: dict = Depends(current_user_inf
         
         notifications = []
         
-        for row in cursor.fetchall():
+        for row in await cursor.fetchall():
             notification_id = row['id']
             message = row['message']
             global_read_users = row['global_read_users']
@@ -1,59 +1,25 @@
 from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from config import language_mapping
-from database_utils import get_db_cursor, get_placeholder
+from database_utils import get_db_cursor, get_async_db_cursor, get_placeholder
 from api.routes.user import current_user_info
 from models.schemas import Question
+from api.utils import thread_summary
+from api.utils.pagination import encode_cursor, parse_cursor, clamp_limit, SNIPPET_CHARS, snippet as snippet_text
 from api.utils.RAG import (
     LanguageDetectionError,
     UnsupportedLanguageError,
-    answer_with_rag,
+    answer_with_rag_async,
+    answer_with_rag_stream_async,
 )
+import asyncio
 import json
 
 router = APIRouter()
 
-# --- Helpers ---------------------------------------------------------------
-def _ensure_thread_qa_has_rag_column() -> None:
-    """Ensure thread_qa table has a rag_qa TEXT column to store JSON.
-    Safe to call often; adds the column only if missing.
-    """
-    try:
-        with get_db_cursor() as (cursor, conn):
-            cursor.execute("""
-                SELECT COUNT(*) FROM information_schema.COLUMNS 
-                WHERE TABLE_SCHEMA = DATABASE() 
-                AND TABLE_NAME = 'thread_qa' 
-                AND COLUMN_NAME = 'rag_qa'
-            """)
-            row = cursor.fetchone()
-            cnt = row['COUNT(*)'] if isinstance(row, dict) and 'COUNT(*)' in row else (list(row.values())[0] if isinstance(row, dict) else row[0])
-            if cnt == 0:
-                cursor.execute("ALTER TABLE thread_qa ADD COLUMN rag_qa TEXT")
-                conn.commit()
-    
-    except Exception:
-        # Don't crash API path if migration fails; let main ops proceed.
-        pass
-
-def _ensure_thread_qa_has_type_column() -> None:
-    """Ensure thread_qa table has a type TEXT column to store action type (e.g., 'rag')."""
-    try:
-        with get_db_cursor() as (cursor, conn):
-            cursor.execute("""
-                SELECT COUNT(*) FROM information_schema.COLUMNS 
-                WHERE TABLE_SCHEMA = DATABASE() 
-                AND TABLE_NAME = 'thread_qa' 
-                AND COLUMN_NAME = 'type'
-            """)
-            row = cursor.fetchone()
-            cnt = row['COUNT(*)'] if isinstance(row, dict) and 'COUNT(*)' in row else (list(row.values())[0] if isinstance(row, dict) else row[0])
-            if cnt == 0:
-                cursor.execute("ALTER TABLE thread_qa ADD COLUMN type TEXT")
-                conn.commit()
-    except Exception:
-        pass
-
 @router.get("/get_translated_question")
 async def get_translated_question(question_id: int, language_id: int, current_user: dict = Depends(current_user_info)):
     """
@@ -138,64 +104,94 @@ async def create_thread(current_user: dict = Depends(current_user_info)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DBエラー: {str(e)}")
 
+def _resolve_thread(user_id: int, req_thread_id) -> int:
+    """既存スレッドの検証 or 新規作成（AUTOINCREMENT）"""
+    ph = get_placeholder()
+    with get_db_cursor() as (cursor, conn):
+        if req_thread_id is not None:
+            cursor.execute(f"SELECT id, user_id FROM threads WHERE id = {ph}", (req_thread_id,))
+            row = cursor.fetchone()
+            if row:
+                if row['user_id'] != user_id:
+                    raise HTTPException(status_code=403, detail="このスレッドにアクセスする権限がありません")
+                return req_thread_id
+
+        cursor.execute(
+            f"INSERT INTO threads (user_id, last_updated) VALUES ({ph}, {ph})",
+            (user_id, datetime.now()),
+        )
+        assigned_thread_id = cursor.lastrowid
+        conn.commit()
+    return assigned_thread_id
+
+def _fetch_history(thread_id: int) -> list:
+    """直近の履歴（[(user, bot), ...] の昇順）"""
+    ph = get_placeholder()
+    with get_db_cursor() as (cursor, conn):
+        cursor.execute(f"""
+            SELECT question, answer FROM thread_qa
+            WHERE thread_id = {ph}
+            ORDER BY created_at DESC
+            LIMIT 6
+        """, (thread_id,))
+        past_qa_rows = cursor.fetchall()
+    # RAG 側はタプル (question, answer) として展開する
+    return [(row['question'], row['answer']) for row in reversed(past_qa_rows)]
+
+def _similarity_threshold(request: Question) -> float:
+    # UIから受け取った similarity_threshold（未指定時は 0.3）を適用
+    sim_th = request.similarity_threshold if (hasattr(request, 'similarity_threshold') and request.similarity_threshold is not None) else 0.3
+    try:
+        return max(0.0, min(1.0, float(sim_th)))
+    except Exception:
+        return 0.3
+
+def _save_thread_qa(thread_id: int, question_text: str, answer_text: str, rag_qa: list, action_type: str) -> None:
+    """thread_qa に rag_qa も入れて保存し、スレッドの更新時刻を進める"""
+    ph = get_placeholder()
+    with get_db_cursor() as (cursor, conn):
+        cursor.execute(
+            f"""
+            INSERT INTO thread_qa (thread_id, question, answer, rag_qa, type)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+            """,
+            (thread_id, question_text, answer_text, json.dumps(rag_qa, ensure_ascii=False), action_type),
+        )
+        cursor.execute(
+            f"UPDATE threads SET last_updated = {ph} WHERE id = {ph}",
+            (datetime.now(), thread_id),
+        )
+        conn.commit()
+
+# モデルとreasoning_effortは固定（ユーザー選択を無効化）
+ANSWER_MODEL = "gpt-5-nano"
+ANSWER_REASONING_EFFORT = "minimal"
+
 @router.post("/get_answer")
 async def get_answer(request: Question, current_user: dict = Depends(current_user_info)):
     question_text = request.text
-    req_thread_id = request.thread_id
     user_id = current_user["id"]
 
-    ph = get_placeholder()
     try:
-        # ---- 既存スレッドの検証 or 新規作成（AUTOINCREMENT） --------------------
-        with get_db_cursor() as (cursor, conn):
-            assigned_thread_id = None
-
-            if req_thread_id is not None:
-                cursor.execute(f"SELECT id, user_id FROM threads WHERE id = {ph}", (req_thread_id,))
-                row = cursor.fetchone()
-                if row:
-                    if row['user_id'] != user_id:
-                        raise HTTPException(status_code=403, detail="このスレッドにアクセスする権限がありません")
-                    assigned_thread_id = req_thread_id
-
-            if assigned_thread_id is None:
-                cursor.execute(
-                    f"INSERT INTO threads (user_id, last_updated) VALUES ({ph}, {ph})",
-                    (user_id, datetime.now()),
-                )
-                assigned_thread_id = cursor.lastrowid
-                conn.commit()
-
-        # ---- 履歴の取得（逐次フローの reactive で参照するので先に取る） ----------
-        with get_db_cursor() as (cursor, conn):
-            cursor.execute(f"""
-                SELECT question, answer FROM thread_qa
-                WHERE thread_id = {ph}
-                ORDER BY created_at DESC
-                LIMIT 6
-            """, (assigned_thread_id,))
-            past_qa_rows = cursor.fetchall()
-        history_qa = list(reversed(past_qa_rows))  # [(user, bot), ...] の昇順に
-
-        # ---- 回答生成：RAG 専用に固定 ---------------------------------------
-        # UIから受け取った similarity_threshold（未指定時は 0.3）を適用
-        sim_th = request.similarity_threshold if (hasattr(request, 'similarity_threshold') and request.similarity_threshold is not None) else 0.3
-        try:
-            sim_th = max(0.0, min(1.0, float(sim_th)))
-        except Exception:
-            sim_th = 0.3
-
-        # モデルとreasoning_effortは固定（ユーザー選択を無効化）
-        model = "gpt-5-nano"
-        reasoning_effort = "minimal"
+        # ---- 既存スレッドの検証 or 新規作成 ------------------------------------
+        # pymysql はブロッキングなのでスレッドで実行し、イベントループを塞がない
+        assigned_thread_id = await run_in_threadpool(_resolve_thread, user_id, request.thread_id)
+
+        # ---- 履歴と保存済みのスレッド要約の取得（並行して読む） ------------------
+        history_qa, cached_summary = await asyncio.gather(
+            run_in_threadpool(_fetch_history, assigned_thread_id),
+            run_in_threadpool(thread_summary.load_fresh, assigned_thread_id),
+        )
 
-        resp = answer_with_rag(
+        # ---- 回答生成：RAG 専用に固定（AsyncOpenAI で待つ） ---------------------
+        resp = await answer_with_rag_async(
             question_text=question_text,
             history_qa=history_qa,
-            similarity_threshold=sim_th,
+            similarity_threshold=_similarity_threshold(request),
             max_history_in_prompt=6,
-            model=model,
-            reasoning_effort=reasoning_effort,
+            model=ANSWER_MODEL,
+            reasoning_effort=ANSWER_REASONING_EFFORT,
+            cached_summary=cached_summary,
         )
 
         # RAG専用応答を展開
@@ -208,32 +204,9 @@ async def get_answer(request: Question, current_user: dict = Depends(current_use
         rag_qa = references if isinstance(references, list) else []
 
         # ---- DB 保存（thread_qa に rag_qa も入れる） ----------------------------
-        with get_db_cursor() as (cursor, conn):
-            _ensure_thread_qa_has_rag_column()  # 既存のマイグレーションヘルパ
-            _ensure_thread_qa_has_type_column() # 新規：type列
-            # 必要なら「type」カラムを追加しても良い（下記コメント参照）
-            try:
-                cursor.execute(
-                    f"""
-                    INSERT INTO thread_qa (thread_id, question, answer, rag_qa, type)
-                    VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
-                    """,
-                    (assigned_thread_id, question_text, answer_text, json.dumps(rag_qa, ensure_ascii=False), action_type),
-                )
-            except Exception:
-                # 互換性: type列がない古い環境
-                cursor.execute(
-                    f"""
-                    INSERT INTO thread_qa (thread_id, question, answer, rag_qa)
-                    VALUES ({ph}, {ph}, {ph}, {ph})
-                    """,
-                    (assigned_thread_id, question_text, answer_text, json.dumps(rag_qa, ensure_ascii=False)),
-                )
-            cursor.execute(
-                f"UPDATE threads SET last_updated = {ph} WHERE id = {ph}",
-                (datetime.now(), assigned_thread_id),
-            )
-            conn.commit()
+        await run_in_threadpool(_save_thread_qa, assigned_thread_id, question_text, answer_text, rag_qa, action_type)
+        # 次の質問に備えてスレッド要約に今回のターンを畳み込む（応答は待たせない）
+        thread_summary.schedule_refresh(assigned_thread_id, meta.get("lang") if isinstance(meta, dict) else None)
 
         # ---- レスポンス -----------------------------------------------------------
         return {
@@ -264,6 +237,89 @@ async def get_answer(request: Question, current_user: dict = Depends(current_use
         print(f"❌ {error_detail}")
         raise HTTPException(status_code=500, detail=error_detail)
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/get_answer_stream")
+async def get_answer_stream(request: Question, current_user: dict = Depends(current_user_info)):
+    """ get_answer のストリーミング版（Server-Sent Events）
+
+    event: references → 検索結果（生成開始前に 1 回）
+    event: delta      → 回答本文の差分 {"text": ...}
+    event: done       → get_answer と同じ形の最終応答（thread_qa へ保存した後に送る）
+    event: error      → {"status": 400|500, "detail": ...}
+    """
+    question_text = request.text
+    user_id = current_user["id"]
+
+    # スレッドの権限エラーなどはストリーム開始前に通常の HTTP エラーとして返す
+    assigned_thread_id = await run_in_threadpool(_resolve_thread, user_id, request.thread_id)
+    history_qa, cached_summary = await asyncio.gather(
+        run_in_threadpool(_fetch_history, assigned_thread_id),
+        run_in_threadpool(thread_summary.load_fresh, assigned_thread_id),
+    )
+    sim_th = _similarity_threshold(request)
+
+    async def event_stream():
+        # 検索・生成とも AsyncOpenAI の経路で待つ（スレッドプールのワーカーを 1 本占有しない）
+        resp = None
+        try:
+            async for event, payload in answer_with_rag_stream_async(
+                question_text,
+                history_qa,
+                similarity_threshold=sim_th,
+                max_history_in_prompt=6,
+                model=ANSWER_MODEL,
+                reasoning_effort=ANSWER_REASONING_EFFORT,
+                cached_summary=cached_summary,
+            ):
+                if event == "references":
+                    yield _sse("references", {"thread_id": assigned_thread_id, **payload})
+                elif event == "delta":
+                    yield _sse("delta", {"text": payload})
+                elif event == "done":
+                    resp = payload
+        except UnsupportedLanguageError as e:
+            error_detail = f"Unsupported language detected: {str(e)}"
+            print(f"❌ {error_detail}")
+            yield _sse("error", {"status": 400, "detail": error_detail})
+            return
+        except LanguageDetectionError as e:
+            error_detail = f"Language detection failed: {str(e)}"
+            print(f"❌ {error_detail}")
+            yield _sse("error", {"status": 400, "detail": error_detail})
+            return
+        except Exception as e:
+            error_detail = f"内部エラー: {str(e)}"
+            print(f"❌ {error_detail}")
+            yield _sse("error", {"status": 500, "detail": error_detail})
+            return
+
+        answer_text = (resp or {}).get("text", "").strip()
+        meta = (resp or {}).get("meta", {}) or {}
+        references = meta.get("references", []) if isinstance(meta, dict) else []
+        try:
+            await run_in_threadpool(_save_thread_qa, assigned_thread_id, question_text, answer_text, references if isinstance(references, list) else [], "rag")
+        except Exception as e:
+            print(f"❌ thread_qa 保存エラー: {e}")
+            yield _sse("error", {"status": 500, "detail": f"内部エラー: {str(e)}"})
+            return
+        thread_summary.schedule_refresh(assigned_thread_id, meta.get("lang") if isinstance(meta, dict) else None)
+        yield _sse("done", {
+            "thread_id": assigned_thread_id,
+            "question": question_text,
+            "answer": answer_text,
+            "type": "rag",
+            "meta": meta,
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # nginx のバッファリングを無効にしてトークンをそのまま流す
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/get_translated_answer")
 async def get_translated_answer(
     answer_id: int = Query(..., description="Answer ID"),
@@ -360,14 +416,20 @@ async def get_qa(
         "answers": answer_data
     }
 
+QA_LIST_DEFAULT_LIMIT = 50
+QA_LIST_MAX_LIMIT = 200
 @router.get("/get_qa_list")
 async def get_qa_list(
     mine: bool = Query(False, description="自分の質問のみを取得するかどうか"),
     category_id: int = Query(None, description="カテゴリIDでフィルタリング"),
+    limit: int = Query(QA_LIST_DEFAULT_LIMIT, description=f"1 ページの件数（最大 {QA_LIST_MAX_LIMIT}）"),
+    after: Optional[str] = Query(None, description="前ページの next_cursor（time,question_id）"),
+    snippet: bool = Query(False, description=f"質問文を先頭 {SNIPPET_CHARS} 文字に切り詰めて返す"),
     current_user: dict = Depends(current_user_info)
 ):
     """
     質問の一覧を追加日順で取得（オプションで自分の質問のみ、カテゴリ絞り込み）
+    limit 件ずつのキーセットページング。続きは next_cursor を after に渡して取得する
     """
     spoken_language = current_user["spoken_language"]
     user_id = current_user["id"]
@@ -378,92 +440,141 @@ async def get_qa_list(
             status_code=400,
             detail=f"Unsupported spoken language: {spoken_language}"
         )
+    try:
+        cursor_key = parse_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page_size = clamp_limit(limit, QA_LIST_DEFAULT_LIMIT, QA_LIST_MAX_LIMIT)
 
     ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        # SQL構築
-        query = f"""
-            SELECT q.question_id, qt.texts, q.title, q.time, c.description
-            FROM question q
-            JOIN question_translation qt ON q.question_id = qt.question_id
+    # ページの行はインデックス（question の複合インデックス + question_translation の主キー）だけで決め、
+    # 本文などはそのページの行についてだけ結合する
+    where, params = f"qt.language_id = {ph}", [language_id]
+    if mine:
+        where += f" AND q.user_id = {ph}"
+        params.append(user_id)
+    if category_id is not None:
+        where += f" AND q.category_id = {ph}"
+        params.append(category_id)
+    if cursor_key:
+        where += f" AND (q.time < {ph} OR (q.time = {ph} AND q.question_id < {ph}))"
+        params += [cursor_key[0], cursor_key[0], cursor_key[1]]
+    params.append(page_size + 1)  # 次ページの有無を知るため 1 件多く取る
+    text_column = f"LEFT(qt.texts, {SNIPPET_CHARS + 1})" if snippet else "qt.texts"
+
+    async with get_async_db_cursor() as (cursor, conn):
+        await cursor.execute(f"""
+            WITH page AS (
+                SELECT q.question_id, q.time
+                FROM question q
+                JOIN question_translation qt ON q.question_id = qt.question_id
+                WHERE {where}
+                ORDER BY q.time DESC, q.question_id DESC
+                LIMIT {ph}
+            )
+            SELECT q.question_id, {text_column} AS texts, q.title, q.time, c.description
+            FROM page
+            JOIN question q ON q.question_id = page.question_id
+            JOIN question_translation qt ON qt.question_id = page.question_id AND qt.language_id = {ph}
             JOIN category c ON q.category_id = c.id
-            WHERE qt.language_id = {ph}
-        """
-        params = [language_id]
-
-        if mine:
-            query += f" AND q.user_id = {ph}"
-            params.append(user_id)
-
-        if category_id is not None:
-            query += f" AND q.category_id = {ph}"
-            params.append(category_id)
-
-        query += " ORDER BY q.time DESC"
-
-        cursor.execute(query, tuple(params))
-        rows = cursor.fetchall()
-
-        qa_list = []
-        for row in rows:
-            qa_list.append({
-                "question_id": row['question_id'],
-                "text": row['texts'],
-                "title": row['title'],
-                "time": row['time'],
-                "category": row['description']
-            })
+            ORDER BY page.time DESC, page.question_id DESC
+        """, (*params, language_id))
+        rows = await cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]['time'], rows[-1]['question_id'])
+
+    qa_list = []
+    for row in rows:
+        qa_list.append({
+            "question_id": row['question_id'],
+            "text": snippet_text(row['texts']) if snippet else row['texts'],
+            "title": row['title'],
+            "time": row['time'],
+            "category": row['description']
+        })
             
-    return {"qa_list": qa_list}
+    return {"qa_list": qa_list, "next_cursor": next_cursor}
+
+THREAD_TITLE_CHARS = 50
+MAX_THREADS_PAGE = 200
 
 @router.get("/get_user_threads")
-async def get_user_threads(current_user: dict = Depends(current_user_info)):
+async def get_user_threads(
+    limit: Optional[int] = Query(None, description="1 ページの件数（省略時は全件）"),
+    after: Optional[str] = Query(None, description="前ページの next_cursor（last_updated,id）"),
+    current_user: dict = Depends(current_user_info),
+):
     """
-    ユーザーのスレッド一覧を最新順で取得
+    ユーザーのスレッド一覧を最新順で取得（タイトル = 最初の質問。件数によらず 1 クエリ）
+    limit を指定するとキーセットページングになり、続きは next_cursor を after に渡して取得する
     """
     user_id = current_user["id"]
-    
+    try:
+        cursor_key = parse_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page_size = clamp_limit(limit, 0, MAX_THREADS_PAGE)  # 0 = 全件
+
     ph = get_placeholder()
+    where, params = f"user_id = {ph}", [user_id]
+    if cursor_key:
+        where += f" AND (last_updated < {ph} OR (last_updated = {ph} AND id < {ph}))"
+        params += [cursor_key[0], cursor_key[0], cursor_key[1]]
+    page_clause = ""
+    if page_size:
+        # 次ページの有無を知るため 1 件多く取る
+        page_clause = f"LIMIT {ph}"
+        params.append(page_size + 1)
+
     try:
-        with get_db_cursor() as (cursor, conn):
-            cursor.execute(f"""
-                SELECT id, last_updated FROM threads
-                WHERE user_id = {ph}
-                ORDER BY last_updated DESC
-            """, (user_id,))
-            threads_data = cursor.fetchall()
-            
-            threads = []
-            for thread_data in threads_data:
-                thread_id = thread_data['id']
-                last_updated = thread_data['last_updated']
-                
-                # 各スレッドの最初の質問を取得してタイトルにする
-                cursor.execute(f"""
-                    SELECT question FROM thread_qa
-                    WHERE thread_id = {ph}
-                    ORDER BY created_at ASC
-                    LIMIT 1
-                """, (thread_id,))
-                first_question = cursor.fetchone()
-                
-                if first_question:
-                    q_text = first_question['question']
-                    title = q_text[:50] + "..." if len(q_text) > 50 else q_text
-                else:
-                    title = "無題のスレッド"
-                
-                threads.append({
-                    "thread_id": thread_id,
-                    "title": title,
-                    "last_updated": last_updated
-                })
-            
-            return {"threads": threads}
-            
+        async with get_async_db_cursor() as (cursor, conn):
+            # ページ内のスレッドだけについて、最初の質問をウィンドウ関数で 1 件ずつ選ぶ
+            await cursor.execute(f"""
+                WITH page AS (
+                    SELECT id, last_updated FROM threads
+                    WHERE {where}
+                    ORDER BY last_updated DESC, id DESC
+                    {page_clause}
+                ),
+                firsts AS (
+                    SELECT qa.thread_id,
+                           LEFT(qa.question, {THREAD_TITLE_CHARS + 1}) AS question,
+                           ROW_NUMBER() OVER (PARTITION BY qa.thread_id ORDER BY qa.created_at, qa.id) AS rn
+                    FROM thread_qa qa
+                    JOIN page ON page.id = qa.thread_id
+                )
+                SELECT page.id, page.last_updated, firsts.question
+                FROM page
+                LEFT JOIN firsts ON firsts.thread_id = page.id AND firsts.rn = 1
+                ORDER BY page.last_updated DESC, page.id DESC
+            """, tuple(params))
+            threads_data = await cursor.fetchall()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DBエラー: {str(e)}")
 
+    next_cursor = None
+    if page_size and len(threads_data) > page_size:
+        threads_data = threads_data[:page_size]
+        next_cursor = encode_cursor(threads_data[-1]['last_updated'], threads_data[-1]['id'])
+
+    threads = []
+    for thread_data in threads_data:
+        q_text = thread_data['question']
+        if q_text:
+            title = q_text[:THREAD_TITLE_CHARS] + "..." if len(q_text) > THREAD_TITLE_CHARS else q_text
+        else:
+            title = "無題のスレッド"
+        threads.append({
+            "thread_id": thread_data['id'],
+            "title": title,
+            "last_updated": thread_data['last_updated'],
+        })
+
+    return {"threads": threads, "next_cursor": next_cursor}
+
 @router.get("/get_thread_messages/{thread_id}")
 async def get_thread_messages(thread_id: str, current_user: dict = Depends(current_user_info)):
     """
@@ -473,13 +584,10 @@ async def get_thread_messages(thread_id: str, current_user: dict = Depends(curre
     
     ph = get_placeholder()
     try:
-        with get_db_cursor() as (cursor, conn):
-            _ensure_thread_qa_has_rag_column()
-            _ensure_thread_qa_has_type_column()
-            
+        async with get_async_db_cursor() as (cursor, conn):
             # スレッドの所有者確認
-            cursor.execute(f"SELECT user_id FROM threads WHERE id = {ph}", (thread_id,))
-            thread_data = cursor.fetchone()
+            await cursor.execute(f"SELECT user_id FROM threads WHERE id = {ph}", (thread_id,))
+            thread_data = await cursor.fetchone()
             
             if not thread_data:
                 raise HTTPException(status_code=404, detail="スレッドが見つかりません")
@@ -488,7 +596,7 @@ async def get_thread_messages(thread_id: str, current_user: dict = Depends(curre
                 raise HTTPException(status_code=403, detail="このスレッドにアクセスする権限がありません")
         
             # メッセージ履歴を取得（rag_qa も返す）
-            cursor.execute(
+            await cursor.execute(
                 f"""
                 SELECT question, answer, created_at, rag_qa, COALESCE(type, '') as type
                 FROM thread_qa
@@ -497,7 +605,7 @@ async def get_thread_messages(thread_id: str, current_user: dict = Depends(curre
                 """,
                 (thread_id,),
             )
-            messages_data = cursor.fetchall()
+            messages_data = await cursor.fetchall()
             
             messages = []
             for row in messages_data:
@@ -523,6 +631,8 @@ async def get_thread_messages(thread_id: str, current_user: dict = Depends(curre
             
             return {"messages": messages}
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"内部エラー: {str(e)}")
 
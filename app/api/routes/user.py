@@ -5,7 +5,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from api.utils.security import ALGORITHM, hash_password, verify_password, create_access_token, oauth2_scheme
 from models.schemas import User, UserLogin
 from config import SECRET_KEY
-from database_utils import get_db_cursor, get_placeholder
+from database_utils import get_db_cursor, get_async_db_cursor, get_placeholder
 
 router = APIRouter()
 
@@ -51,10 +51,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 
 @router.get("/current_user")
 async def current_user_info(current_user: dict = Depends(get_current_user)):
+    # 全リクエストの依存関係なので、イベントループを塞がない非同期接続で引く
     ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        cursor.execute(f"SELECT * FROM user WHERE id = {ph}", (current_user["id"],))
-        user = cursor.fetchone()
+    async with get_async_db_cursor() as (cursor, conn):
+        await cursor.execute(f"SELECT id, name, spoken_language FROM user WHERE id = {ph}", (current_user["id"],))
+        user = await cursor.fetchone()
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1,17 +1,22 @@
 import os
-import pickle
 import json
+import time
+import asyncio
 import hashlib
+import threading
 from pathlib import Path
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from typing import Optional, List, Dict, Tuple, Any
 import re
 import dotenv
 import numpy as np
 import faiss
+import tiktoken
 from tqdm import tqdm
 from database_utils import get_db_cursor, get_placeholder
-from openai import OpenAI
+from api.utils import vector_store, embedding_cache, answer_cache, lexical
+from api.utils.vector_store import VECTOR_DIR
+from api.utils.openai_client import client, async_client
 from lingua import LanguageDetectorBuilder
 
 # ----------------------------------------------------------------------------
@@ -30,14 +35,61 @@ class UnsupportedLanguageError(ValueError):
 # ----------------------------------------------------------------------------
 
 dotenv.load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
-
-VECTOR_DIR = Path("./api/utils/vectors")
-VECTOR_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_ISO = {"ja", "en", "vi", "zh", "ko", "pt", "es", "tl", "id"}
 
+# 全言語をまとめた統合ストア（vectors_all）で検索する。言語判定は検索先の選択には使わず、
+# 質問と同じ言語の行に LANG_BOOST を加点するためだけに使う
+UNIFIED_INDEX = os.getenv("RAG_UNIFIED_INDEX", "0").lower() in ("1", "true", "yes")
+LANG_BOOST = float(os.getenv("RAG_LANG_BOOST", "0.05"))
+
+# ベクトル検索と BM25（api/utils/lexical.py）の順位を RRF で統合する。固有名詞や番号の完全一致を拾うため。
+# BM25 の上位 LEXICAL_KEEP 件は類似度が「閾値 - LEXICAL_MARGIN」以上なら閾値を下回っていても結果に残す
+# （CJK は文字 bigram なのでほぼどの質問でも何かしらヒットする。下限なしで残すと無関係な QA が混ざる）
+HYBRID_RETRIEVAL = os.getenv("RAG_HYBRID", "0").lower() in ("1", "true", "yes")
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+LEXICAL_KEEP = int(os.getenv("RAG_LEXICAL_KEEP", "3"))
+LEXICAL_MARGIN = float(os.getenv("RAG_LEXICAL_MARGIN", "0.1"))
+
+# 履歴付きの質問では、会話要約（LLM）の完了を待つ間に元の質問で先に検索しておき、要約が返ったら拡張クエリの結果と統合する。
+# 要約が必要な質問（「それの費用は？」など）は元の質問だけでは引けないので、既定（0）では要約を必ず待つ。
+# 正の値にしたときだけ、要約の投入からその秒数で打ち切って先行検索の結果だけで答える（負荷時の遅延上限。追い質問の精度は落ちる）
+SUMMARY_PIPELINE = os.getenv("RAG_SUMMARY_PIPELINE", "1").lower() in ("1", "true", "yes")
+SUMMARY_TIMEOUT = float(os.getenv("RAG_SUMMARY_TIMEOUT", "0"))
+# 前の会話を指す語を含まない十分長い質問は要約自体を省略する
+SKIP_SELF_CONTAINED_SUMMARY = os.getenv("RAG_SKIP_SELF_CONTAINED_SUMMARY", "1").lower() in ("1", "true", "yes")
+SELF_CONTAINED_MIN_CHARS = int(os.getenv("RAG_SELF_CONTAINED_MIN_CHARS", "15"))
+
+# 回答生成プロンプトのトークン予算。参照は類似度の低いものから切り詰め/除外し、履歴は古いターンから落とす
+PROMPT_TOKEN_BUDGET = int(os.getenv("RAG_PROMPT_TOKEN_BUDGET", "6000"))
+REFERENCE_MAX_TOKENS = int(os.getenv("RAG_REFERENCE_MAX_TOKENS", "1500"))
+REFERENCE_MIN_TOKENS = 120
+HISTORY_TOKEN_BUDGET = int(os.getenv("RAG_HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_TURN_MAX_TOKENS = 400
+# 回答文の文字 3-gram の Jaccard 係数がこれ以上の参照は重複とみなす
+REFERENCE_DEDUPE_JACCARD = float(os.getenv("RAG_REFERENCE_DEDUPE_JACCARD", "0.9"))
+
+_SUMMARY_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-summary")
+_BACKGROUND_TASKS: set = set()
+
+# 会話要約の扱いの内訳（/admin/runtime_stats の rag）
+_STATS = {"summary_skipped": 0, "summary_cached": 0, "summary_generated": 0, "summary_empty": 0, "summary_fallbacks": 0}
+_STATS_LOCK = threading.Lock()
+
+def _count(name: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[name] += n
+
+def stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+def _summary_wait(submitted_at: float) -> Optional[float]:
+    # 要約を待てる残り時間（SUMMARY_TIMEOUT が 0 以下なら None = 完了まで待つ）
+    if SUMMARY_TIMEOUT <= 0:
+        return None
+    return max(0.0, SUMMARY_TIMEOUT - (time.time() - submitted_at))
+
 # ----------------------------------------------------------------------------
 # Lang detection
 # ----------------------------------------------------------------------------
@@ -70,12 +122,86 @@ def detect_lang(text: str) -> str:
 # Embeddings
 # ----------------------------------------------------------------------------
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+def _request_embeddings(texts: List[str], retries: int = 3) -> List[List[float]]:
+    """複数テキストを 1 回の API 呼び出しで埋め込む（入力順に返す）。一時的な失敗は指数バックオフで再試行"""
+    for attempt in range(retries):
+        try:
+            resp = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+        except Exception as e:  # 必要なら型を絞る
+            if attempt == retries - 1:
+                raise RuntimeError(f"Embedding取得に失敗: {e}") from e
+            time.sleep(2 ** attempt)
+
+async def _arequest_embeddings(texts: List[str], retries: int = 3) -> List[List[float]]:
+    """_request_embeddings の非同期版"""
+    for attempt in range(retries):
+        try:
+            resp = await async_client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+        except Exception as e:
+            if attempt == retries - 1:
+                raise RuntimeError(f"Embedding取得に失敗: {e}") from e
+            await asyncio.sleep(2 ** attempt)
+
+def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """埋め込みキャッシュ (model, sha256) を先に引き、無いものだけ API に問い合わせる"""
+    keys = [embedding_cache.content_key(t) for t in texts]
+    try:
+        found = embedding_cache.get_many(EMBEDDING_MODEL, keys)
+    except Exception as e:
+        # キャッシュが壊れていても埋め込み自体は続ける
+        print(f"埋め込みキャッシュ読み込みエラー: {e}")
+        found = {}
+    missing = list({k: i for i, k in enumerate(keys) if k not in found}.values())
+    if missing:
+        fresh = _request_embeddings([texts[i] for i in missing])
+        new_items = {keys[i]: vec for i, vec in zip(missing, fresh)}
+        try:
+            embedding_cache.put_many(EMBEDDING_MODEL, new_items)
+        except Exception as e:
+            print(f"埋め込みキャッシュ書き込みエラー: {e}")
+        found.update({k: np.asarray(v, dtype="float32") for k, v in new_items.items()})
+    return [found[k].tolist() for k in keys]
+
 def get_embedding(text: str):
+    return get_embeddings([text])[0]
+
+def get_query_embedding(text: str) -> np.ndarray:
+    """検索クエリ用。正規化したクエリ文をキーに TTL 付きキャッシュを引き、ヒットすれば API を呼ばない"""
+    key = embedding_cache.query_key(text)
+    try:
+        vec = embedding_cache.get_query(EMBEDDING_MODEL, key)
+    except Exception as e:
+        print(f"クエリ埋め込みキャッシュ読み込みエラー: {e}")
+        vec = None
+    if vec is not None:
+        return vec
+    vec = np.asarray(_request_embeddings([text])[0], dtype="float32")
+    try:
+        embedding_cache.put_query(EMBEDDING_MODEL, key, vec)
+    except Exception as e:
+        print(f"クエリ埋め込みキャッシュ書き込みエラー: {e}")
+    return vec
+
+async def aget_query_embedding(text: str) -> np.ndarray:
+    """get_query_embedding の非同期版（キャッシュは SQLite のローカル読み書きなのでそのまま呼ぶ）"""
+    key = embedding_cache.query_key(text)
     try:
-        resp = client.embeddings.create(input=[text], model="text-embedding-3-small")
-    except Exception as e:  # 必要なら型を絞る
-        raise RuntimeError(f"Embedding取得に失敗: {e}") from e
-    return resp.data[0].embedding
+        vec = embedding_cache.get_query(EMBEDDING_MODEL, key)
+    except Exception as e:
+        print(f"クエリ埋め込みキャッシュ読み込みエラー: {e}")
+        vec = None
+    if vec is not None:
+        return vec
+    vec = np.asarray((await _arequest_embeddings([text]))[0], dtype="float32")
+    try:
+        embedding_cache.put_query(EMBEDDING_MODEL, key, vec)
+    except Exception as e:
+        print(f"クエリ埋め込みキャッシュ書き込みエラー: {e}")
+    return vec
 
 # ----------------------------------------------------------------------------
 # DB helpers
@@ -88,188 +214,133 @@ def get_language_map() -> Dict[int, str]:
         rows = cursor.fetchall()
         return {row['id']: row['code'].lower() for row in rows}
 
+_LANGUAGE_MAP_CACHE: Dict[int, str] = {}
+
+def _cached_language_map() -> Dict[int, str]:
+    """検索経路用。language テーブルはほぼ変わらないのでプロセス内に保持する"""
+    if not _LANGUAGE_MAP_CACHE:
+        _LANGUAGE_MAP_CACHE.update(get_language_map())
+    return _LANGUAGE_MAP_CACHE
+
 # ----------------------------------------------------------------------------
-# Incremental update (append) helpers
+# Incremental update (upsert / remove) helpers
 # ----------------------------------------------------------------------------
 
-def _ensure_index_for_lang(dim: int, lang_code: str) -> Optional[faiss.IndexFlatIP]:
-    """Load existing FAISS index for a language or create a new one with given dim.
+def _upsert_into_store(
+    lang_code: str, qa_id: Optional[int], emb: np.ndarray, meta_row: tuple, text_row: tuple, lang_id: Optional[int] = None,
+) -> bool:
+    """Replace the rows of qa_id in a language store with one normalized vector (+ sidecar rows).
 
-    If an existing index is found but its dimension mismatches, return None to avoid corruption.
+    編集時に古いベクトルが残らないよう、同じ QA.id の既存行は削除してから追加する。
+    統合ストアが有効なら、そちらの同じ QA.id × 言語の行も置き換える。
+    Returns False if the existing store has an incompatible dimension (likely model changed).
     """
-    base_path = VECTOR_DIR / f"vectors_{lang_code}"
-    faiss_path = base_path.with_suffix(".faiss")
-    if faiss_path.exists():
-        index = faiss.read_index(str(faiss_path))
-        try:
-            if index.d != dim:
-                # Dimension changed (likely model changed). Skip to avoid breaking existing index.
-                return None
-        except Exception:
-            return None
-    else:
-        index = faiss.IndexFlatIP(dim)
-    return index
-
-def _load_sidecar_lists(lang_code: str) -> Tuple[list, list]:
-    """Load meta/texts sidecar files (return empty lists if missing)."""
-    base_path = VECTOR_DIR / f"vectors_{lang_code}"
-    meta_path = base_path.with_suffix(".meta.pkl")
-    texts_path = base_path.with_suffix(".texts.pkl")
-
-    meta: list = []
-    texts: list = []
-    if meta_path.exists():
-        try:
-            with open(meta_path, "rb") as f:
-                meta = pickle.load(f) or []
-        except Exception:
-            meta = []
-    if texts_path.exists():
-        try:
-            with open(texts_path, "rb") as f:
-                texts = pickle.load(f) or []
-        except Exception:
-            texts = []
-    return meta, texts
-
-def _save_index_and_sidecars(index: faiss.IndexFlatIP, meta: list, texts: list, lang_code: str) -> None:
-    base_path = VECTOR_DIR / f"vectors_{lang_code}"
-    faiss_path = base_path.with_suffix(".faiss")
-    meta_path = base_path.with_suffix(".meta.pkl")
-    texts_path = base_path.with_suffix(".texts.pkl")
-    faiss.write_index(index, str(faiss_path))
-    with open(meta_path, "wb") as f:
-        pickle.dump(meta, f)
-    with open(texts_path, "wb") as f:
-        pickle.dump(texts, f)
-
-# ----------------------------------------------------------------------------
-# Ignore lists (masking old/deleted entries without rebuild)
-# ----------------------------------------------------------------------------
+    with vector_store.write_lock(lang_code):
+        # Keep the same structure as initial build: (qa_id, question_id)
+        ok = vector_store.upsert_locked(lang_code, qa_id, emb, [meta_row], [text_row])
+    touched = [lang_code]
+    if ok and UNIFIED_INDEX and lang_id is not None and vector_store.read_manifest(vector_store.UNIFIED_STORE):
+        with vector_store.write_lock(vector_store.UNIFIED_STORE):
+            vector_store.upsert_locked(
+                vector_store.UNIFIED_STORE, qa_id, emb, [tuple(meta_row) + (lang_id,)], [text_row], lang_id=lang_id,
+            )
+        touched.append(vector_store.UNIFIED_STORE)
+    _invalidate_answer_cache([qa_id])
+    _refresh_lexical(touched)
+    return ok
 
-_GLOBAL_QA_IGNORE = VECTOR_DIR / "vectors_ignore_qa.json"  # [qa_id, ...]
+def _invalidate_answer_cache(qa_ids: list) -> None:
+    # 内容が変わった QA を参照しているキャッシュ済み回答を捨てる
+    try:
+        answer_cache.invalidate_qa_ids(qa_ids)
+    except Exception as e:
+        print(f"回答キャッシュ無効化エラー: {e}")
 
-def _load_global_qa_ignore() -> set:
-    if _GLOBAL_QA_IGNORE.exists():
+def _refresh_lexical(store_names: list) -> None:
+    # BM25 インデックスに変更分を取り込む（他のワーカーは次の検索時に変更ログから追いつく）
+    if not HYBRID_RETRIEVAL:
+        return
+    for store_name in store_names:
         try:
-            with open(_GLOBAL_QA_IGNORE, "r", encoding="utf-8") as f:
-                return set(json.load(f) or [])
-        except Exception:
-            return set()
-    return set()
+            lexical.refresh(store_name)
+        except Exception as e:
+            print(f"BM25 インデックス更新エラー ({store_name}): {e}")
 
-def _save_global_qa_ignore(s: set) -> None:
-    with open(_GLOBAL_QA_IGNORE, "w", encoding="utf-8") as f:
-        json.dump(sorted(list(s)), f, ensure_ascii=False)
+def remove_qa_from_vector_index(qa_id: int, language_codes: list = None) -> int:
+    """Physically remove every vector of a QA (keyed by QA.id) from the language stores.
 
-def add_qa_id_to_ignore(qa_id: int) -> None:
-    s = _load_global_qa_ignore()
-    s.add(int(qa_id))
-    _save_global_qa_ignore(s)
+    Args:
+        qa_id: The QA.id to remove
+        language_codes: List of language codes (e.g., ['ja', 'en']). If None, removes from all stores.
 
-def _payload_hash(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    Returns the number of rows removed across languages.
+    """
+    if language_codes is None:
+        language_codes = vector_store.stored_languages()
+    removed = 0
+    for lang_code in language_codes:
+        with vector_store.write_lock(lang_code):
+            removed += vector_store.remove_locked(lang_code, [qa_id])
+    _invalidate_answer_cache([qa_id])
+    _refresh_lexical(language_codes)
+    return removed
 
-def _lang_hash_path(lang_code: str) -> Path:
-    return VECTOR_DIR / f"vectors_{lang_code}.ignore_hash.json"
+# ----------------------------------------------------------------------------
+# Legacy ignore lists (一度だけ物理削除に変換して廃止する)
+# ----------------------------------------------------------------------------
 
-def _load_lang_hash_ignores(lang_code: str) -> set:
-    p = _lang_hash_path(lang_code)
-    if p.exists():
-        try:
-            with open(p, "r", encoding="utf-8") as f:
-                return set(json.load(f) or [])
-        except Exception:
-            return set()
-    return set()
+_GLOBAL_QA_IGNORE = VECTOR_DIR / "vectors_ignore_qa.json"  # [qa_id, ...]
+_legacy_ignores_retired = False
 
-def _save_lang_hash_ignores(lang_code: str, s: set) -> None:
-    p = _lang_hash_path(lang_code)
-    with open(p, "w", encoding="utf-8") as f:
-        json.dump(sorted(list(s)), f, ensure_ascii=False)
+def _load_json_set(path: Path) -> set:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return set(json.load(f) or [])
+    except Exception:
+        return set()
 
-def ignore_current_vectors_for_qa_languages(question_id: int, answer_id: int, language_codes: list = None) -> int:
-    """Record hash ignores for current QA payloads for specific languages only.
+def _payload_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    Args:
-        question_id: The question ID
-        answer_id: The answer ID
-        language_codes: List of language codes to ignore (e.g., ['ja', 'en']). If None, ignores all languages.
+def retire_legacy_ignore_lists() -> int:
+    """以前の無視リスト（vectors_ignore_qa.json / vectors_{lang}.ignore_hash.json）に載っている行を
+    ストアから物理削除し、リストファイルを消す。ファイルが無ければ何もしない。
 
-    Returns the number of language hashes added.
+    Returns the number of rows removed.
     """
-    ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        LANGUAGE_MAP = get_language_map()  # {id: 'ja', ...}
-        
-        # Filter to only specified languages if provided
-        if language_codes is not None:
-            language_codes_set = set(language_codes)
-            filtered_language_map = {lang_id: lang_code for lang_id, lang_code in LANGUAGE_MAP.items() 
-                                   if lang_code in language_codes_set}
-        else:
-            filtered_language_map = LANGUAGE_MAP
-
-        count = 0
-        for lang_id, lang_code in filtered_language_map.items():
-            cursor.execute(
-                f"SELECT texts FROM question_translation WHERE question_id = {ph} AND language_id = {ph}",
-                (question_id, lang_id),
-            )
-            qrow = cursor.fetchone()
-            cursor.execute(
-                f"SELECT texts FROM answer_translation WHERE answer_id = {ph} AND language_id = {ph}",
-                (answer_id, lang_id),
-            )
-            arow = cursor.fetchone()
-            if not (qrow and arow):
-                continue
-            q_text = qrow['texts']
-            a_text = arow['texts']
-            payload = f"Q: {q_text}\nA: {a_text}"
-            h = _payload_hash(payload)
-            s = _load_lang_hash_ignores(lang_code)
-            if h not in s:
-                s.add(h)
-                _save_lang_hash_ignores(lang_code, s)
-                count += 1
-
-        return count
-
-def ignore_current_vectors_for_qa(question_id: int, answer_id: int) -> int:
-    """Record hash ignores for current QA payloads across all languages.
-
-    Returns the number of language hashes added.
-    """
-    ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        LANGUAGE_MAP = get_language_map()  # {id: 'ja', ...}
-        count = 0
-        for lang_id, lang_code in LANGUAGE_MAP.items():
-            cursor.execute(
-                f"SELECT texts FROM question_translation WHERE question_id = {ph} AND language_id = {ph}",
-                (question_id, lang_id),
-            )
-            qrow = cursor.fetchone()
-            cursor.execute(
-                f"SELECT texts FROM answer_translation WHERE answer_id = {ph} AND language_id = {ph}",
-                (answer_id, lang_id),
-            )
-            arow = cursor.fetchone()
-            if not (qrow and arow):
-                continue
-            q_text = qrow['texts']
-            a_text = arow['texts']
-            payload = f"Q: {q_text}\nA: {a_text}"
-            h = _payload_hash(payload)
-            s = _load_lang_hash_ignores(lang_code)
-            if h not in s:
-                s.add(h)
-                _save_lang_hash_ignores(lang_code, s)
-                count += 1
-
-        return count
+    global _legacy_ignores_retired
+    if _legacy_ignores_retired:
+        return 0
+
+    hash_files = {p.name[len("vectors_"):-len(".ignore_hash.json")]: p for p in VECTOR_DIR.glob("vectors_*.ignore_hash.json")}
+    ignored_qa_ids = _load_json_set(_GLOBAL_QA_IGNORE) if _GLOBAL_QA_IGNORE.exists() else set()
+    removed = 0
+    if hash_files or ignored_qa_ids:
+        for lang_code in sorted(set(vector_store.stored_languages()) | set(hash_files)):
+            ignored_hashes = _load_json_set(hash_files[lang_code]) if lang_code in hash_files else set()
+            with vector_store.write_lock(lang_code):
+                vectors, meta, texts = vector_store.load_for_update(lang_code)
+                if vectors is not None:
+                    keep = [
+                        not ((row[0] is not None and int(row[0]) in ignored_qa_ids)
+                             or _payload_hash(f"Q: {trow[0]}\nA: {trow[1]}") in ignored_hashes)
+                        for row, trow in zip(meta, texts)
+                    ]
+                    if not all(keep):
+                        vector_store.write_store(
+                            lang_code,
+                            vectors[np.asarray(keep, dtype=bool)],
+                            [row for row, k in zip(meta, keep) if k],
+                            [row for row, k in zip(texts, keep) if k],
+                        )
+                        removed += len(keep) - sum(keep)
+            if lang_code in hash_files:
+                hash_files[lang_code].unlink(missing_ok=True)
+        _GLOBAL_QA_IGNORE.unlink(missing_ok=True)
+        print(f"無視リストを物理削除に移行しました（{removed} 行削除）")
+
+    _legacy_ignores_retired = True
+    return removed
 
 def append_qa_to_vector_index_for_languages(question_id: int, answer_id: int, language_codes: list = None) -> int:
     """Append a single QA pair to vector indexes for specific languages only.
@@ -279,7 +350,9 @@ def append_qa_to_vector_index_for_languages(question_id: int, answer_id: int, la
         answer_id: The answer ID  
         language_codes: List of language codes to update (e.g., ['ja', 'en']). If None, updates all languages.
 
+    Rows already stored for the same QA.id are replaced, so this is also the edit path.
     Returns the count of vectors appended across specified languages.
+    Raises RuntimeError (after trying every language) if any language store could not be updated.
     """
     ph = get_placeholder()
     with get_db_cursor() as (cursor, conn):
@@ -304,6 +377,7 @@ def append_qa_to_vector_index_for_languages(question_id: int, answer_id: int, la
             filtered_language_map = LANGUAGE_MAP
 
         appended = 0
+        failed = []
         for lang_id, lang_code in filtered_language_map.items():
             # Fetch translations for this language
             cursor.execute(
@@ -327,34 +401,29 @@ def append_qa_to_vector_index_for_languages(question_id: int, answer_id: int, la
             emb = np.array(get_embedding(payload)).astype("float32").reshape(1, -1)
             faiss.normalize_L2(emb)
 
-            # Load or create index and sidecars
-            index = _ensure_index_for_lang(emb.shape[1], lang_code)
-            if index is None:
-                # Skip this language if existing index has incompatible dim
-                continue
-            meta_list, texts_list = _load_sidecar_lists(lang_code)
-
-            # Append
+            # Replace (upsert) and persist as a new store generation
             try:
-                index.add(emb)
-            except Exception:
-                # Append failed, skip to keep existing index intact.
+                if not _upsert_into_store(lang_code, qa_id, emb, (qa_id, question_id), (question_text, answer_text, time_val), lang_id):
+                    # 既存ストアと次元が違う（埋め込みモデルが変わった）。全件再構築が必要
+                    print(f"ベクトル追加スキップ（{lang_code}）: 既存ストアと次元が異なります。全件再構築してください (QA.id={qa_id})")
+                    failed.append(lang_code)
+                    continue
+            except Exception as e:
+                # 既存のストアはそのまま残る。他の言語は続けて更新し、最後にまとめて失敗を伝える
+                print(f"ベクトル追加エラー（{lang_code}）: QA.id={qa_id}: {e}")
+                failed.append(lang_code)
                 continue
-
-            # Keep the same structure as initial build: (qa_id, question_id)
-            meta_list.append((qa_id, question_id))
-            texts_list.append((question_text, answer_text, time_val))
-
-            # Persist
-            _save_index_and_sidecars(index, meta_list, texts_list, lang_code)
             appended += 1
 
+        if failed:
+            raise RuntimeError(f"ベクトルストアに反映できなかった言語があります: {', '.join(failed)} (QA.id={qa_id})")
         return appended
 
 def append_qa_to_vector_index(question_id: int, answer_id: int) -> int:
     """Append a single QA pair (all available languages) to vector indexes.
 
     Returns the count of vectors appended across languages.
+    Raises RuntimeError (after trying every language) if any language store could not be updated.
     """
     ph = get_placeholder()
     with get_db_cursor() as (cursor, conn):
@@ -371,6 +440,7 @@ def append_qa_to_vector_index(question_id: int, answer_id: int) -> int:
         LANGUAGE_MAP = get_language_map()  # {id: 'ja'/'en'/...}
 
         appended = 0
+        failed = []
         for lang_id, lang_code in LANGUAGE_MAP.items():
             # Fetch translations for this language
             cursor.execute(
@@ -394,101 +464,209 @@ def append_qa_to_vector_index(question_id: int, answer_id: int) -> int:
             emb = np.array(get_embedding(payload)).astype("float32").reshape(1, -1)
             faiss.normalize_L2(emb)
 
-            # Load or create index and sidecars
-            index = _ensure_index_for_lang(emb.shape[1], lang_code)
-            if index is None:
-                # Skip this language if existing index has incompatible dim
-                continue
-            meta_list, texts_list = _load_sidecar_lists(lang_code)
-
-            # Append
+            # Replace (upsert) and persist as a new store generation
             try:
-                index.add(emb)
-            except Exception:
-                # Append failed, skip to keep existing index intact.
+                if not _upsert_into_store(lang_code, qa_id, emb, (qa_id, question_id), (question_text, answer_text, time_val), lang_id):
+                    # 既存ストアと次元が違う（埋め込みモデルが変わった）。全件再構築が必要
+                    print(f"ベクトル追加スキップ（{lang_code}）: 既存ストアと次元が異なります。全件再構築してください (QA.id={qa_id})")
+                    failed.append(lang_code)
+                    continue
+            except Exception as e:
+                # 既存のストアはそのまま残る。他の言語は続けて更新し、最後にまとめて失敗を伝える
+                print(f"ベクトル追加エラー（{lang_code}）: QA.id={qa_id}: {e}")
+                failed.append(lang_code)
                 continue
-
-            # Keep the same structure as initial build: (qa_id, question_id)
-            meta_list.append((qa_id, question_id))
-            texts_list.append((question_text, answer_text, time_val))
-
-            # Persist
-            _save_index_and_sidecars(index, meta_list, texts_list, lang_code)
             appended += 1
 
+        if failed:
+            raise RuntimeError(f"ベクトルストアに反映できなかった言語があります: {', '.join(failed)} (QA.id={qa_id})")
         return appended
 
 # ----------------------------------------------------------------------------
-# Index build
+# Compaction
 # ----------------------------------------------------------------------------
 
-def generate_and_save_vectors():
-    ph = get_placeholder()
+def compact_vector_indexes(language_codes: list = None) -> Dict[str, Dict[str, Any]]:
+    """Rebuild each language store from live QA rows only, reusing the stored vectors.
+
+    各言語は write_lock の中で新しい世代として書き出し manifest を差し替えるため、
+    検索トラフィックを止めずに実行できる（読み手は切り替わるまで旧世代を読み続ける）。
+    Returns {lang: {"before": {"rows", "bytes"}, "after": {...}, "removed": n}}.
+    """
+    # 旧形式の無視リストが残っていれば先に物理削除へ変換する
+    retire_legacy_ignore_lists()
+
     with get_db_cursor() as (cursor, conn):
-        print("ベクトル生成開始...")
-        cursor.execute("SELECT id, question_id, answer_id FROM QA")
-        qa_rows = cursor.fetchall()
-        print(f"総QA数: {len(qa_rows)} 件")
-
-        LANGUAGE_MAP = get_language_map()  # {id:'ja', ...}
-        print(f"対応言語: {list(set(LANGUAGE_MAP.values()))}")
-
-        lang_text_map: Dict[str, list] = defaultdict(list)
-
-        for qa_row in tqdm(qa_rows, desc="ベクトル生成中"):
-            qa_id = qa_row['id']
-            qid = qa_row['question_id']
-            aid = qa_row['answer_id']
-            
-            for lang_id, lang_code in LANGUAGE_MAP.items():
-                cursor.execute(
-                    f"SELECT texts FROM question_translation WHERE question_id={ph} AND language_id={ph}",
-                    (qid, lang_id)
-                )
-                qrow = cursor.fetchone()
-
-                cursor.execute(
-                    f"SELECT texts FROM answer_translation WHERE answer_id={ph} AND language_id={ph}",
-                    (aid, lang_id)
-                )
-                arow = cursor.fetchone()
-
-                cursor.execute(f"SELECT time FROM question WHERE question_id={ph}", (qid,))
-                trow = cursor.fetchone()
-
-                if qrow and arow and trow:
-                    question_text = qrow['texts']
-                    answer_text = arow['texts']
-                    time_val = trow['time']
-                    text = f"Q: {question_text}\nA: {answer_text}"
-                    embedding = get_embedding(text)
-                    lang_text_map[lang_code].append(
-                        (embedding, (qa_id, qid), (question_text, answer_text, time_val))
-                    )
-
-        # 言語ごとにFAISSへ投入して保存
-        for lang_code, data in lang_text_map.items():
-            if not data:
-                print(f"{lang_code} のデータが空なのでスキップ")
-                continue
+        cursor.execute("SELECT id FROM QA")
+        live_qa_ids = {int(row['id']) for row in cursor.fetchall()}
+
+    if language_codes is None:
+        language_codes = vector_store.stored_languages()
+
+    report: Dict[str, Dict[str, Any]] = {}
+    for lang_code in language_codes:
+        with vector_store.write_lock(lang_code):
+            report[lang_code] = vector_store.compact_locked(lang_code, live_qa_ids)
+        r = report[lang_code]
+        print(
+            f"コンパクション完了: vectors_{lang_code} "
+            f"{r['before']['rows']}→{r['after']['rows']} 件, {r['before']['bytes']}→{r['after']['bytes']} bytes"
+        )
+    return report
 
-            vectors = np.array([x[0] for x in data]).astype("float32")
-            faiss.normalize_L2(vectors)
-            meta = [x[1] for x in data]
-            texts = [x[2] for x in data]
+# ----------------------------------------------------------------------------
+# Index build
+# ----------------------------------------------------------------------------
 
-            index = faiss.IndexFlatIP(vectors.shape[1])
-            index.add(vectors)
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "128"))
+EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", "4"))
+
+_REBUILD_STATE = VECTOR_DIR / "rebuild_state.json"  # {"started_at": ..., "done": [lang, ...]}
+
+def _load_rebuild_state() -> Dict[str, Any]:
+    try:
+        with open(_REBUILD_STATE, "r", encoding="utf-8") as f:
+            return json.load(f) or {}
+    except Exception:
+        return {}
 
-            faiss.write_index(index, str(VECTOR_DIR / f"vectors_{lang_code}.faiss"))
-            with open(VECTOR_DIR / f"vectors_{lang_code}.meta.pkl", "wb") as f:
-                pickle.dump(meta, f)
-            with open(VECTOR_DIR / f"vectors_{lang_code}.texts.pkl", "wb") as f:
-                pickle.dump(texts, f)
+def _save_rebuild_state(state: Dict[str, Any]) -> None:
+    tmp_path = _REBUILD_STATE.with_name(f".{_REBUILD_STATE.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, _REBUILD_STATE)
 
-            print(f"保存完了: vectors_{lang_code}.*（{len(data)} 件）")
+def _fetch_language_rows(cursor, lang_id: int) -> List[Dict[str, Any]]:
+    """1 言語分の QA 翻訳を 1 回の JOIN で取得する"""
+    ph = get_placeholder()
+    cursor.execute(
+        f"""
+        SELECT QA.id AS qa_id, QA.question_id AS question_id,
+               qtr.texts AS question_text, atr.texts AS answer_text, q.time AS time
+        FROM QA
+        JOIN question q ON q.question_id = QA.question_id
+        JOIN question_translation qtr ON qtr.question_id = QA.question_id AND qtr.language_id = {ph}
+        JOIN answer_translation atr ON atr.answer_id = QA.answer_id AND atr.language_id = {ph}
+        ORDER BY QA.id
+        """,
+        (lang_id, lang_id),
+    )
+    return cursor.fetchall()
+
+def _rebuild_language(lang_code: str, rows: List[Dict[str, Any]], batch_size: int, concurrency: int) -> Dict[str, Any]:
+    started = time.time()
+    payloads = [f"Q: {r['question_text']}\nA: {r['answer_text']}" for r in rows]
+    keys = [embedding_cache.content_key(p) for p in payloads]
+
+    # 埋め込みキャッシュにある内容は API を呼ばない（クラッシュ後の再開もここで効く）
+    done = embedding_cache.get_many(EMBEDDING_MODEL, keys)
+    pending = list({k: i for i, k in enumerate(keys) if k not in done}.values())  # 同一内容は 1 回だけ
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    def _embed(batch: List[int]) -> Tuple[List[int], np.ndarray]:
+        return batch, np.array(_request_embeddings([payloads[i] for i in batch]), dtype="float32")
+
+    with tqdm(total=len(rows), initial=len(rows) - len(pending), desc=f"ベクトル生成中 ({lang_code})") as bar:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            # 投入順に受け取り、バッチごとにキャッシュへ書き込む
+            for batch, emb in pool.map(_embed, batches):
+                new_items = {keys[i]: emb[j] for j, i in enumerate(batch)}
+                embedding_cache.put_many(EMBEDDING_MODEL, new_items)
+                done.update(new_items)
+                bar.update(len(batch))
+
+    vectors = np.array([done[k] for k in keys], dtype="float32")
+    faiss.normalize_L2(vectors)
+    meta = [(r['qa_id'], r['question_id']) for r in rows]
+    texts = [(r['question_text'], r['answer_text'], r['time']) for r in rows]
+    with vector_store.write_lock(lang_code):
+        generation = vector_store.write_store(lang_code, vectors, meta, texts)
+
+    elapsed = time.time() - started
+    return {
+        "rows": len(rows),
+        "embedded": len(pending),
+        "cached": len(rows) - len(pending),
+        "api_calls": len(batches),
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(len(pending) / elapsed, 1) if elapsed > 0 else None,
+        "generation": generation,
+    }
 
-        print("全ベクトル保存完了")
+def build_unified_store(language_map: Dict[int, str] = None) -> int:
+    """言語別ストアの行（埋め込みを含む）を連結して統合ストア vectors_all を作り直す。再埋め込みはしない。
+
+    Returns the number of rows written.
+    """
+    language_map = language_map or get_language_map()
+    parts_vec, meta, texts = [], [], []
+    for lang_id, lang_code in language_map.items():
+        with vector_store.write_lock(lang_code):
+            vectors, lang_meta, lang_texts = vector_store.load_for_update(lang_code)
+        if vectors is None or not len(vectors):
+            continue
+        parts_vec.append(vectors)
+        meta.extend(tuple(row[:2]) + (lang_id,) for row in lang_meta)
+        texts.extend(lang_texts)
+    if not parts_vec:
+        return 0
+    with vector_store.write_lock(vector_store.UNIFIED_STORE):
+        vector_store.write_store(vector_store.UNIFIED_STORE, np.vstack(parts_vec), meta, texts)
+    print(f"統合ストア保存完了: vectors_{vector_store.UNIFIED_STORE}.*（{len(meta)} 件）")
+    return len(meta)
+
+def generate_and_save_vectors(
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    resume: bool = True,
+) -> Dict[str, Dict[str, Any]]:
+    """全 QA × 全言語のベクトルを作り直す。
+
+    言語ごとに翻訳を 1 クエリで取得し、埋め込みキャッシュに無いものだけを batch_size 件ずつ
+    最大 concurrency 並列で埋め込み、言語が終わるたびにストアを書き出す。途中で落ちた場合は
+    resume=True で再実行すると、書き出し済みの言語を飛ばし、埋め込み済みの内容はキャッシュから再開する。
+    Returns per-language throughput stats.
+    """
+    started = time.time()
+    print("ベクトル生成開始...")
+    state = _load_rebuild_state() if resume else {}
+    if not state:
+        state = {"started_at": started, "done": []}
+        _save_rebuild_state(state)
+    elif state.get("done"):
+        print(f"前回の再構築を再開します（完了済み: {state['done']}）")
+
+    LANGUAGE_MAP = get_language_map()  # {id:'ja', ...}
+    print(f"対応言語: {list(set(LANGUAGE_MAP.values()))}")
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for lang_id, lang_code in LANGUAGE_MAP.items():
+        if lang_code in state["done"]:
+            continue
+        with get_db_cursor() as (cursor, conn):
+            rows = _fetch_language_rows(cursor, lang_id)
+        if not rows:
+            print(f"{lang_code} のデータが空なのでスキップ")
+            continue
+
+        stats[lang_code] = _rebuild_language(lang_code, rows, batch_size, concurrency)
+        state["done"].append(lang_code)
+        _save_rebuild_state(state)
+        st = stats[lang_code]
+        print(f"保存完了: vectors_{lang_code}.*（{st['rows']} 件, {st['api_calls']} リクエスト, {st['seconds']}s, {st['rows_per_sec']} 件/s）")
+
+    if UNIFIED_INDEX:
+        build_unified_store(LANGUAGE_MAP)
+    _REBUILD_STATE.unlink(missing_ok=True)
+    # BM25 インデックスも新しい世代から作っておく（全体の書き直しは変更ログで追えないため）
+    _refresh_lexical(list(stats) + ([vector_store.UNIFIED_STORE] if UNIFIED_INDEX else []))
+    try:
+        answer_cache.clear()
+    except Exception as e:
+        print(f"回答キャッシュ削除エラー: {e}")
+    total_rows = sum(st["embedded"] for st in stats.values())
+    elapsed = time.time() - started
+    print(f"全ベクトル保存完了（{total_rows} 件を {elapsed:.1f}s で埋め込み, {total_rows / elapsed if elapsed else 0:.1f} 件/s）")
+    return stats
 
 # ----------------------------------------------------------------------------
 # Retrieval
@@ -499,163 +677,409 @@ def _generate_conversation_summary(history_qa: List[Tuple[str, str]], lang: str
     会話履歴から検索用の要約文を生成する
     既存のreactive.pyのsummarize_text関数を活用
     """
-    if not history_qa or len(history_qa) == 0:
+    conversation_text = _conversation_text(history_qa)
+    if not conversation_text:
         return ""
-    
+
+    try:
+        # 既存のsummarize_text関数を使用
+        from api.utils.reactive import summarize_text
+        return _clip_summary(summarize_text(conversation_text, lang))
+    except Exception as e:
+        print(f"会話要約生成エラー: {e}")
+        return ""
+
+async def _agenerate_conversation_summary(history_qa: List[Tuple[str, str]], lang: str = "ja") -> str:
+    """_generate_conversation_summary の非同期版"""
+    conversation_text = _conversation_text(history_qa)
+    if not conversation_text:
+        return ""
+
+    try:
+        from api.utils.reactive import asummarize_text
+        return _clip_summary(await asummarize_text(conversation_text, lang))
+    except Exception as e:
+        print(f"会話要約生成エラー: {e}")
+        return ""
+
+def _conversation_text(history_qa: List[Tuple[str, str]]) -> str:
     # 会話履歴が短すぎる場合は要約しない
-    if len(history_qa) < 2:
+    if not history_qa or len(history_qa) < 2:
         return ""
-    
+
     # 会話履歴をテキストに変換（最新3件のみ）
     conversation_text = ""
     for i, (q, a) in enumerate(history_qa[-3:], 1):
         conversation_text += f"Q{i}: {q}\nA{i}: {a}\n"
-    
+    return conversation_text
+
+def _clip_summary(summary: str) -> str:
+    # 検索用に短縮（100文字以内）
+    if summary and len(summary) > 100:
+        summary = summary[:100] + "..."
+    return summary.strip() if summary else ""
+
+
+def _fetch_hit_details(qa_ids: List[int], question_ids: List[int]) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+    """検索ヒットの category_id / answer_time を 1 回の往復で取得する。
+
+    qa_id を持たない古い行は question_id で引く。
+    Returns ({qa_id: row}, {question_id: row}).
+    """
+    if not qa_ids and not question_ids:
+        return {}, {}
+    ph = get_placeholder()
+    conditions, params = [], []
+    if qa_ids:
+        conditions.append(f"QA.id IN ({', '.join([ph] * len(qa_ids))})")
+        params.extend(qa_ids)
+    if question_ids:
+        conditions.append(f"QA.question_id IN ({', '.join([ph] * len(question_ids))})")
+        params.extend(question_ids)
     try:
-        # 既存のsummarize_text関数を使用
-        from api.utils.reactive import summarize_text
-        summary = summarize_text(conversation_text, lang)
-        
-        # 検索用に短縮（100文字以内）
-        if len(summary) > 100:
-            summary = summary[:100] + "..."
-        
-        return summary.strip() if summary else ""
+        with get_db_cursor() as (cursor, conn):
+            cursor.execute(
+                f"""
+                SELECT QA.id AS qa_id, QA.question_id AS question_id,
+                       q.category_id AS category_id, a.time AS answer_time
+                FROM QA
+                JOIN question q ON q.question_id = QA.question_id
+                LEFT JOIN answer a ON a.id = QA.answer_id
+                WHERE {' OR '.join(conditions)}
+                """,
+                tuple(params),
+            )
+            rows = cursor.fetchall()
     except Exception as e:
-        print(f"会話要約生成エラー: {e}")
-        return ""
+        print(f"検索結果のメタデータ取得エラー: {e}")
+        return {}, {}
+    return {row['qa_id']: row for row in rows}, {row['question_id']: row for row in rows}
 
+def _search_unified(snapshot, query_vec: np.ndarray, lang: Optional[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """統合ストアを検索し、QA ごとに最良の 1 行（質問と同じ言語の行を LANG_BOOST だけ優先）にまとめる。
 
-def rag(question: str, similarity_threshold: float = 0.3, history_qa: List[Tuple[str, str]] = None) -> Dict[int, Dict[str, Any]]:
-    """
-    言語検出に失敗/未対応の場合は例外を投げる
-    成功時は rank-> [answer, question, time, similarity] を返す。
-    similarity_threshold以下のスコアの結果は除外される。
-    history_qaが提供された場合、会話要約も検索クエリに含める。
+    同じ QA の各言語訳が上位を埋めないよう、候補は言語数倍取る。返すスコアは加点前の類似度。
     """
-    import time
-    start_time = time.time()
-    
-    # 言語検出（Linguaのみ、未対応/検出不可は例外）
-    lang = detect_lang(question)  # 'ja' / 'en' / 'vi' / 'zh' / 'ko'
-    print(f"[{time.time()-start_time:.2f}s] 検出言語: {lang}")
-
-    # 会話要約を生成（履歴がある場合）
-    conversation_summary = ""
-    if history_qa and len(history_qa) > 0:
-        summary_start = time.time()
-        conversation_summary = _generate_conversation_summary(history_qa, lang)
-        print(f"[{time.time()-start_time:.2f}s] 会話要約完了 (所要時間: {time.time()-summary_start:.2f}s): {conversation_summary}")
+    D, I = snapshot.search(query_vec, k * len(ALLOWED_ISO))
+    lang_id = next((lid for lid, code in _cached_language_map().items() if code == lang), None) if lang else None
+
+    best: Dict[Any, Tuple[float, float, int]] = {}  # qa_id -> (加点後, 類似度, 行)
+    for idx, sim in zip(I[0], D[0]):
+        if idx < 0:
+            continue
+        qa_id, _ = snapshot.get_meta(int(idx))
+        key = qa_id if qa_id is not None else ("row", int(idx))
+        boosted = float(sim) + (LANG_BOOST if lang_id is not None and snapshot.get_lang_id(int(idx)) == lang_id else 0.0)
+        if key not in best or boosted > best[key][0]:
+            best[key] = (boosted, float(sim), int(idx))
+
+    top = sorted(best.values(), key=lambda t: t[0], reverse=True)[:k]
+    return (
+        np.array([[t[1] for t in top]], dtype="float32").reshape(1, -1),
+        np.array([[t[2] for t in top]], dtype="int64").reshape(1, -1),
+    )
 
-    base_path = VECTOR_DIR / f"vectors_{lang}"
-    faiss_path = base_path.with_suffix(".faiss")
-    meta_path = base_path.with_suffix(".meta.pkl")
-    texts_path = base_path.with_suffix(".texts.pkl")
+def _fuse_with_lexical(
+    snapshot, query_vec: np.ndarray, search_query: str, ranked: List[Tuple[int, float]], k: int,
+) -> Tuple[List[Tuple[int, float]], set]:
+    """ベクトル検索の順位と BM25 の順位を RRF で統合する。
 
-    if not faiss_path.exists():
-        print(f"{faiss_path} が存在しません → 生成を試みます")
+    返す類似度はどの行もクエリとのコサイン類似度（BM25 だけで拾った行はここで計算する）なので、
+    呼び出し側の閾値判定はそのまま使える。2 つ目の戻り値は閾値を緩める（LEXICAL_MARGIN）BM25 上位の行。
+    """
+    vector_rows = [int(idx) for idx, _ in ranked if 0 <= idx < snapshot.ntotal]
+    sims = {int(idx): float(sim) for idx, sim in ranked}
+    lexical_hits = lexical.search(snapshot, search_query, k)
+    lexical_rows = [row for row, _ in lexical_hits]
+
+    fused = []
+    seen_qa = set()
+    for row, _ in lexical.reciprocal_rank_fusion([vector_rows, lexical_rows], k=RRF_K):
+        qa_id, _ = snapshot.get_meta(row)
+        if qa_id is not None:
+            # 統合ストアでは同じ QA の別言語の行が両方の順位に出ることがある
+            if qa_id in seen_qa:
+                continue
+            seen_qa.add(qa_id)
+        if row not in sims:
+            sims[row] = float(snapshot.get_vector(row) @ query_vec[0])
+        fused.append((row, sims[row]))
+    return fused[:k], set(lexical_rows[:LEXICAL_KEEP])
+
+def _rag_lang(question: str) -> Optional[str]:
+    # 言語検出（Linguaのみ、未対応/検出不可は例外）。統合ストアでは加点にしか使わないので失敗しても続ける
+    try:
+        return detect_lang(question)  # 'ja' / 'en' / 'vi' / 'zh' / 'ko'
+    except (LanguageDetectionError, UnsupportedLanguageError):
+        if not UNIFIED_INDEX:
+            raise
+    return None
+
+def _open_snapshot(lang: Optional[str]):
+    retire_legacy_ignore_lists()
+    store_name = vector_store.UNIFIED_STORE if UNIFIED_INDEX else lang
+    snapshot = vector_store.get_snapshot(store_name)
+    if snapshot is None:
+        print(f"vectors_{store_name} が存在しません → 生成を試みます")
         generate_and_save_vectors()
+        snapshot = vector_store.get_snapshot(store_name)
 
-    if not faiss_path.exists():
+    if snapshot is None:
         # インデックス未生成などの運用エラーは 500 に寄せたいのでここでは例外を投げず上位で処理
-        raise RuntimeError(f"ベクトルが見つかりません: {faiss_path}")
-
-    index = faiss.read_index(str(faiss_path))
-    with open(meta_path, "rb") as f:
-        meta = pickle.load(f)
-    with open(texts_path, "rb") as f:
-        texts = pickle.load(f)
-
-    # Load ignore lists
-    ignored_qa_ids = _load_global_qa_ignore()
-    ignored_hashes = _load_lang_hash_ignores(lang)
+        raise RuntimeError(f"ベクトルが見つかりません: {vector_store.manifest_path(store_name)}")
+    return snapshot
 
+def _search_query(question: str, conversation_summary: str) -> str:
     # 検索クエリを構築（要約がある場合は組み合わせ）
-    search_query = question
     if conversation_summary:
-        search_query = f"{question} {conversation_summary}"
-        print(f"[{time.time()-start_time:.2f}s] 拡張検索クエリ: {search_query}")
+        return f"{question} {conversation_summary}"
+    return question
+
+# 「それ」「その」「it」「what about」など前の会話を指す語。含まない十分長い質問は単独で検索できるとみなす
+_FOLLOWUP_MARKERS = re.compile(
+    r"(それ|その|これ|この|あれ|あの|そこ|ここ|他に|ほかに|さっき|先ほど|前の|上記|続き|詳しく|もっと|同じ"
+    r"|\b(it|its|that|this|these|those|they|them|there|else|also|more|same|above|previous)\b"
+    r"|what about|how about)",
+    re.IGNORECASE,
+)
+
+def _is_self_contained(question: str, history_qa: Optional[List[Tuple[str, str]]]) -> bool:
+    """会話要約なしで検索してよい質問か（安価なヒューリスティック。迷ったら False）"""
+    if not history_qa:
+        return True
+    if not SKIP_SELF_CONTAINED_SUMMARY:
+        return False
+    if _FOLLOWUP_MARKERS.search(question):
+        return False
+    # 短い質問（「費用は？」など）は前の話題に頼っていることが多い
+    return len(question.strip()) >= SELF_CONTAINED_MIN_CHARS
+
+def _search_ranked(snapshot, query_vec: np.ndarray, search_query: str, lang: Optional[str]) -> Tuple[List[Tuple[int, float]], set]:
+    """クエリベクトル（正規化前でよい）で検索し、(行, 類似度) の順位と閾値免除の行集合を返す"""
+    faiss.normalize_L2(query_vec)
+    if snapshot.unified:
+        D, I = _search_unified(snapshot, query_vec, lang, 10)
+    else:
+        D, I = snapshot.search(query_vec, 10)  # より多く取得して閾値でフィルタリング
+
+    # 検索結果は既にスコア順（統合ストアでは言語加点後の順）
+    ranked = [(int(idx), float(sim)) for idx, sim in zip(I[0], D[0])]
+    lexical_keep: set = set()
+    if HYBRID_RETRIEVAL:
+        lexical_start = time.time()
+        ranked, lexical_keep = _fuse_with_lexical(snapshot, query_vec, search_query, ranked, 10)
+        print(f"BM25 検索・RRF 統合完了 (所要時間: {time.time()-lexical_start:.3f}s)")
+    return ranked, lexical_keep
+
+def _merge_ranked(primary: Tuple[List[Tuple[int, float]], set], secondary: Tuple[List[Tuple[int, float]], set]) -> Tuple[List[Tuple[int, float]], set]:
+    """拡張クエリ（primary）と元の質問（secondary）の検索結果を RRF で統合する。類似度は高い方を採る"""
+    sims: Dict[int, float] = {}
+    for ranked, _ in (primary, secondary):
+        for idx, sim in ranked:
+            if idx >= 0:
+                sims[idx] = max(sim, sims.get(idx, sim))
+    fused = lexical.reciprocal_rank_fusion(
+        [[idx for idx, _ in primary[0] if idx >= 0], [idx for idx, _ in secondary[0] if idx >= 0]], k=RRF_K,
+    )
+    return [(idx, sims[idx]) for idx, _ in fused][:10], primary[1] | secondary[1]
+
+def _hydrate_hits(
+    snapshot, ranked: List[Tuple[int, float]], lexical_keep: set, similarity_threshold: float, start_time: float,
+) -> Dict[int, Dict[str, Any]]:
+    """閾値を超えた上位 5 件をサイドカーと DB のメタデータで組み立てる"""
+    results: Dict[int, Dict[str, Any]] = {}
+    hits = []
+    for idx, similarity in ranked:
+        # 類似度が閾値以上の場合のみ結果に含める（ハイブリッド時の BM25 上位は閾値 - LEXICAL_MARGIN まで残す）
+        if idx < 0 or idx >= snapshot.ntotal:
+            # 件数が k 未満のとき FAISS は -1 を返す
+            continue
+        if similarity >= similarity_threshold or (idx in lexical_keep and similarity >= similarity_threshold - LEXICAL_MARGIN):
+            # ヒットした行だけをサイドカーから読む（コーパス全体はデコードしない）
+            hits.append((snapshot.get_text(int(idx)), snapshot.get_meta(int(idx)), float(similarity)))
+            # 最大5件まで
+            if len(hits) >= 5:
+                break
+
+    # category_id と回答の最終編集時刻（answer.time）をまとめて 1 クエリで取得
+    hydrate_start = time.time()
+    by_qa_id, by_question_id = _fetch_hit_details(
+        [meta[0] for _, meta, _ in hits if meta[0] is not None],
+        [meta[1] for _, meta, _ in hits if meta[0] is None and meta[1] is not None],
+    )
+    print(f"[{time.time()-start_time:.2f}s] メタデータ取得完了 (所要時間: {time.time()-hydrate_start:.3f}s)")
+
+    for rank, ((question_text, answer_text, time_val), (qa_id, qid), similarity) in enumerate(hits, 1):
+        detail = by_qa_id.get(qa_id) if qa_id is not None else by_question_id.get(qid)
+        detail = detail or {}
+        cat_id = detail.get('category_id')
+        ans_time = detail.get('answer_time')
+        results[rank] = {
+            "answer": answer_text,
+            "question": question_text,
+            "time": time_val,
+            "similarity": similarity,
+            "question_id": qid,
+            "qa_id": qa_id,
+            "category_id": int(cat_id) if cat_id is not None else None,
+            "answer_time": ans_time.isoformat() if ans_time else None,
+        }
 
+    print(f"[{time.time()-start_time:.2f}s] RAG検索完了: 類似度閾値 {similarity_threshold} 以上の結果 {len(results)}件")
+    return results
+
+def _embed_and_search(snapshot, search_query: str, lang: Optional[str], start_time: float):
     embed_start = time.time()
-    query_vec = np.array(get_embedding(search_query)).astype("float32").reshape(1, -1)
+    query_vec = np.array(get_query_embedding(search_query), dtype="float32").reshape(1, -1)
     print(f"[{time.time()-start_time:.2f}s] Embedding生成完了 (所要時間: {time.time()-embed_start:.2f}s)")
-    
-    faiss.normalize_L2(query_vec)
     search_start = time.time()
-    D, I = index.search(query_vec, 10)  # より多く取得して閾値でフィルタリング
+    found = _search_ranked(snapshot, query_vec, search_query, lang)
     print(f"[{time.time()-start_time:.2f}s] ベクトル検索完了 (所要時間: {time.time()-search_start:.3f}s)")
+    return found
+
+def _usable_summary(cached_summary: Optional[Dict[str, str]], lang: Optional[str]) -> Optional[str]:
+    # 保存済みのスレッド要約は質問と同じ言語のときだけ使う（検索クエリの言語を揃える）
+    if not cached_summary or not cached_summary.get("summary"):
+        return None
+    if cached_summary.get("lang") != (lang or "ja"):
+        return None
+    return _clip_summary(cached_summary["summary"])
+
+def rag(
+    question: str,
+    similarity_threshold: float = 0.3,
+    history_qa: List[Tuple[str, str]] = None,
+    cached_summary: Optional[Dict[str, str]] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    言語検出に失敗/未対応の場合は例外を投げる（統合ストア使用時は投げずに全言語から検索する）
+    成功時は rank-> [answer, question, time, similarity] を返す。
+    similarity_threshold以下のスコアの結果は除外される。
+    history_qaが提供された場合、会話要約も検索クエリに含める。
 
-    results: Dict[int, Dict[str, Any]] = {}
-    ranked = sorted(zip(I[0], D[0]), key=lambda x: x[1], reverse=True)
+    要約が必要な質問では、要約の生成と並行して元の質問だけで 1 回目の検索を済ませておき、
+    要約が返ったら拡張クエリでも検索して統合する（SUMMARY_TIMEOUT を設定したときだけ、投入からその秒数で打ち切る）。
+    cached_summary（thread_summary.load_fresh() の戻り値）があれば要約を生成せずにそれを使う。
+    """
+    start_time = time.time()
+    lang = _rag_lang(question)
+    print(f"[{time.time()-start_time:.2f}s] 検出言語: {lang}")
 
-    rank = 1
-    # DB 接続（category 取得用）
-    ph = get_placeholder()
-    with get_db_cursor() as (cursor, conn):
-        for idx, similarity in ranked:
-            # 類似度が閾値以上の場合のみ結果に含める
-            if similarity >= similarity_threshold:
-                question_text, answer_text, time_val = texts[idx]
-                qa_meta = meta[idx] if idx < len(meta) else (None, None)
-                qa_id = None
-                qid = None
-                try:
-                    qa_id = int(qa_meta[0]) if qa_meta and qa_meta[0] is not None else None
-                    qid = int(qa_meta[1]) if qa_meta and qa_meta[1] is not None else None
-                except Exception:
-                    qa_id = None
-                    qid = None
-
-                # Check ignores
-                payload_hash = _payload_hash(f"Q: {question_text}\nA: {answer_text}")
-                if (qa_id is not None and qa_id in ignored_qa_ids) or (payload_hash in ignored_hashes):
-                    continue
+    snapshot = _open_snapshot(lang)
+    print(f"[{time.time()-start_time:.2f}s] ベクトルストア取得完了 ({snapshot.lang_code}: 第{snapshot.generation}世代 {snapshot.live_count}件)")
+
+    if _is_self_contained(question, history_qa):
+        if history_qa:
+            _count("summary_skipped")
+            print(f"[{time.time()-start_time:.2f}s] 単独で完結した質問のため会話要約を省略")
+        ranked = _embed_and_search(snapshot, question, lang, start_time)
+        return _hydrate_hits(snapshot, *ranked, similarity_threshold, start_time)
+
+    conversation_summary = _usable_summary(cached_summary, lang)
+    if conversation_summary is not None:
+        _count("summary_cached")
+        search_query = _search_query(question, conversation_summary)
+        print(f"[{time.time()-start_time:.2f}s] 保存済みのスレッド要約で検索: {search_query}")
+        ranked = _embed_and_search(snapshot, search_query, lang, start_time)
+        return _hydrate_hits(snapshot, *ranked, similarity_threshold, start_time)
+
+    if not SUMMARY_PIPELINE:
+        # 逐次: 要約 → 拡張クエリで検索
+        summary_start = time.time()
+        conversation_summary = _generate_conversation_summary(history_qa, lang or "ja")
+        print(f"[{time.time()-start_time:.2f}s] 会話要約完了 (所要時間: {time.time()-summary_start:.2f}s): {conversation_summary}")
+        ranked = _embed_and_search(snapshot, _search_query(question, conversation_summary), lang, start_time)
+        return _hydrate_hits(snapshot, *ranked, similarity_threshold, start_time)
 
-                # category_id 取得（存在しない場合は None）
-                cat_id = None
-                if qid is not None:
-                    try:
-                        cursor.execute(f"SELECT category_id FROM question WHERE question_id = {ph}", (qid,))
-                        row = cursor.fetchone()
-                        if row:
-                            cat_id = int(row['category_id'])
-                    except Exception:
-                        cat_id = None
-
-                # 回答の最終編集時刻（answer.time）を取得
-                ans_time = None
-                if qa_id is not None:
-                    try:
-                        cursor.execute(f"SELECT answer_id FROM QA WHERE id = {ph}", (qa_id,))
-                        qa_row = cursor.fetchone()
-                        if qa_row:
-                            ans_id_val = qa_row['answer_id']
-                            if ans_id_val is not None:
-                                ans_id = int(ans_id_val)
-                                cursor.execute(f"SELECT time FROM answer WHERE answer_id = {ph}", (ans_id,))
-                                arow = cursor.fetchone()
-                                if arow:
-                                    ans_time = arow['time']
-                    except Exception:
-                        ans_time = None
-
-                results[rank] = {
-                    "answer": answer_text,
-                    "question": question_text,
-                    "time": time_val.isoformat() if time_val else None,
-                    "similarity": float(similarity),
-                    "question_id": qid,
-                    "category_id": cat_id,
-                    "answer_time": ans_time.isoformat() if ans_time else None,
-                }
-                rank += 1
-
-                # 最大5件まで
-                if rank > 5:
-                    break
+    summary_submitted = time.time()
+    summary_future = _SUMMARY_POOL.submit(_generate_conversation_summary, history_qa, lang or "ja")
+    first = _embed_and_search(snapshot, question, lang, start_time)
+    try:
+        conversation_summary = summary_future.result(timeout=_summary_wait(summary_submitted))
+    except FuturesTimeoutError:
+        _count("summary_fallbacks")
+        print(f"[{time.time()-start_time:.2f}s] 会話要約が投入から {SUMMARY_TIMEOUT}s 以内に返らないため元の質問の検索結果を使用")
+        return _hydrate_hits(snapshot, *first, similarity_threshold, start_time)
+    print(f"[{time.time()-start_time:.2f}s] 会話要約完了: {conversation_summary}")
+    if not conversation_summary:
+        _count("summary_empty")
+        return _hydrate_hits(snapshot, *first, similarity_threshold, start_time)
+    _count("summary_generated")
+
+    search_query = _search_query(question, conversation_summary)
+    print(f"[{time.time()-start_time:.2f}s] 拡張検索クエリ: {search_query}")
+    expanded = _embed_and_search(snapshot, search_query, lang, start_time)
+    return _hydrate_hits(snapshot, *_merge_ranked(expanded, first), similarity_threshold, start_time)
+
+async def _aembed_and_search(snapshot, search_query: str, lang: Optional[str], start_time: float):
+    embed_start = time.time()
+    query_vec = np.array(await aget_query_embedding(search_query), dtype="float32").reshape(1, -1)
+    print(f"[{time.time()-start_time:.2f}s] Embedding生成完了 (所要時間: {time.time()-embed_start:.2f}s)")
+    search_start = time.time()
+    found = await asyncio.to_thread(_search_ranked, snapshot, query_vec, search_query, lang)
+    print(f"[{time.time()-start_time:.2f}s] ベクトル検索完了 (所要時間: {time.time()-search_start:.3f}s)")
+    return found
 
-    print(f"[{time.time()-start_time:.2f}s] RAG検索完了: 類似度閾値 {similarity_threshold} 以上の結果 {len(results)}件")
-    return results
+async def arag(
+    question: str,
+    similarity_threshold: float = 0.3,
+    history_qa: List[Tuple[str, str]] = None,
+    cached_summary: Optional[Dict[str, str]] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """rag() の非同期版。API 呼び出しは AsyncOpenAI で待ち、ストア読み込み・検索・DB はスレッドに逃がす"""
+    start_time = time.time()
+    lang = _rag_lang(question)
+    print(f"[{time.time()-start_time:.2f}s] 検出言語: {lang}")
+
+    snapshot = await asyncio.to_thread(_open_snapshot, lang)
+    print(f"[{time.time()-start_time:.2f}s] ベクトルストア取得完了 ({snapshot.lang_code}: 第{snapshot.generation}世代 {snapshot.live_count}件)")
+
+    if _is_self_contained(question, history_qa):
+        if history_qa:
+            _count("summary_skipped")
+            print(f"[{time.time()-start_time:.2f}s] 単独で完結した質問のため会話要約を省略")
+        ranked = await _aembed_and_search(snapshot, question, lang, start_time)
+        return await asyncio.to_thread(_hydrate_hits, snapshot, *ranked, similarity_threshold, start_time)
+
+    conversation_summary = _usable_summary(cached_summary, lang)
+    if conversation_summary is not None:
+        _count("summary_cached")
+        search_query = _search_query(question, conversation_summary)
+        print(f"[{time.time()-start_time:.2f}s] 保存済みのスレッド要約で検索: {search_query}")
+        ranked = await _aembed_and_search(snapshot, search_query, lang, start_time)
+        return await asyncio.to_thread(_hydrate_hits, snapshot, *ranked, similarity_threshold, start_time)
+
+    if not SUMMARY_PIPELINE:
+        summary_start = time.time()
+        conversation_summary = await _agenerate_conversation_summary(history_qa, lang or "ja")
+        print(f"[{time.time()-start_time:.2f}s] 会話要約完了 (所要時間: {time.time()-summary_start:.2f}s): {conversation_summary}")
+        ranked = await _aembed_and_search(snapshot, _search_query(question, conversation_summary), lang, start_time)
+        return await asyncio.to_thread(_hydrate_hits, snapshot, *ranked, similarity_threshold, start_time)
+
+    summary_submitted = time.time()
+    summary_task = asyncio.ensure_future(_agenerate_conversation_summary(history_qa, lang or "ja"))
+    first = await _aembed_and_search(snapshot, question, lang, start_time)
+    try:
+        # 打ち切っても要約タスク自体は止めない（完了を待って捨てるだけ。接続を途中で切らない）
+        conversation_summary = await asyncio.wait_for(
+            asyncio.shield(summary_task), timeout=_summary_wait(summary_submitted),
+        )
+    except asyncio.TimeoutError:
+        _BACKGROUND_TASKS.add(summary_task)
+        summary_task.add_done_callback(_BACKGROUND_TASKS.discard)
+        _count("summary_fallbacks")
+        print(f"[{time.time()-start_time:.2f}s] 会話要約が投入から {SUMMARY_TIMEOUT}s 以内に返らないため元の質問の検索結果を使用")
+        return await asyncio.to_thread(_hydrate_hits, snapshot, *first, similarity_threshold, start_time)
+    print(f"[{time.time()-start_time:.2f}s] 会話要約完了: {conversation_summary}")
+    if not conversation_summary:
+        _count("summary_empty")
+        return await asyncio.to_thread(_hydrate_hits, snapshot, *first, similarity_threshold, start_time)
+    _count("summary_generated")
+
+    search_query = _search_query(question, conversation_summary)
+    print(f"[{time.time()-start_time:.2f}s] 拡張検索クエリ: {search_query}")
+    expanded = await _aembed_and_search(snapshot, search_query, lang, start_time)
+    return await asyncio.to_thread(_hydrate_hits, snapshot, *_merge_ranked(expanded, first), similarity_threshold, start_time)
 
 # ----------------------------------------------------------------------------
 # Prompt builders
@@ -996,15 +1420,218 @@ def _responses_text(
         print(f"✗ API error: all methods failed. Last error: {e_resp}")
         return "", "none"
 
+async def _aresponses_text(
+    prompt: str,
+    *,
+    model: str = "gpt-5-nano",
+    max_output_tokens: int = 600,   # 互換性のため受け取るが未使用
+    timeout_s: int = 60,
+    response_schema: Optional[dict] = None,  # 互換性のため受け取るが未使用
+    reasoning_effort: str = "minimal",
+) -> Tuple[str, str]:
+    """_responses_text の非同期版（同じ順序でフォールバックする）"""
+    client_req = async_client.with_options(timeout=timeout_s)
+    try:
+        chat = await client_req.chat.completions.create(
+            model="gpt-5-nano",
+            messages=[{"role": "user", "content": prompt}],
+            reasoning_effort=reasoning_effort,
+        )
+        result = (chat.choices[0].message.content or "").strip()
+        print(f"✓ LLM回答生成成功: model=gpt-5-nano, reasoning_effort={reasoning_effort}")
+        return result, "gpt-5-nano"
+    except Exception as e:
+        print(f"✗ gpt-5-nano failed: {e}")
+
+    try:
+        resp = await client_req.responses.create(model=model, input=prompt)
+        result = (getattr(resp, "output_text", "") or "").strip()
+        print(f"✓ LLM回答生成成功: model={model} (Responses API fallback)")
+        return result, f"{model} (Responses API)"
+    except Exception as e_resp:
+        print(f"✗ API error: all methods failed. Last error: {e_resp}")
+        return "", "none"
+
 
 
 def _clip_history(history_qa: List[Tuple[str, str]], k: int) -> List[Tuple[str, str]]:
     return history_qa[-k:] if k > 0 else []
 
+# ----------------------------------------------------------------------------
+# Prompt budget
+# ----------------------------------------------------------------------------
+
+_ENCODING = None
+
+def _encoding():
+    """o200k_base（gpt-4.1 / gpt-5 系のトークナイザ）。読み込めなければ None（文字数から概算する）"""
+    global _ENCODING
+    if _ENCODING is None:
+        try:
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"tiktoken のエンコーディングを読み込めないため概算します: {e}")
+            _ENCODING = False
+    return _ENCODING or None
+
+def _count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is None:
+        # 日本語はほぼ 1 文字 1 トークン、英語は 4 文字 1 トークン程度なので多めに見積もる
+        return len(text) // 2 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    enc = _encoding()
+    if enc is None:
+        limit = max(0, max_tokens) * 2
+        return text if len(text) <= limit else text[:limit].rstrip() + "…"
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max(0, max_tokens)]).rstrip() + "…"
+
+def _shingles(text: str, n: int = 3) -> set:
+    t = re.sub(r"\s+", "", text or "").lower()
+    return {t[i:i + n] for i in range(max(1, len(t) - n + 1))}
+
+def _dedupe_references(rag_qa: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """回答文がほぼ同じ参照（同じ回答に付いた別の質問など）は類似度の高い方だけ残す（元の順序を保つ）"""
+    kept: List[Tuple[int, set]] = []
+    for i in sorted(range(len(rag_qa)), key=lambda i: rag_qa[i].get("similarity") or 0.0, reverse=True):
+        sh = _shingles(rag_qa[i].get("answer") or "")
+        if any(len(sh & other) / len(sh | other) >= REFERENCE_DEDUPE_JACCARD for _, other in kept):
+            continue
+        kept.append((i, sh))
+    return [rag_qa[i] for i in sorted(i for i, _ in kept)]
+
+def _reference_tokens(qa: Dict[str, Any]) -> int:
+    # 'S#: {question: "...", answer: "..."}' の 1 行分
+    return _count_tokens(qa.get("question") or "") + _count_tokens(qa.get("answer") or "") + 12
+
+def _fit_history(history_qa: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """新しいターンから HISTORY_TOKEN_BUDGET に収まる分だけ残す（各発話は HISTORY_TURN_MAX_TOKENS で切る）"""
+    fitted: List[Tuple[str, str]] = []
+    used = 0
+    for q, a in reversed(history_qa):
+        q = _truncate_tokens(q or "", HISTORY_TURN_MAX_TOKENS)
+        a = _truncate_tokens(a or "", HISTORY_TURN_MAX_TOKENS)
+        cost = _count_tokens(q) + _count_tokens(a) + 8
+        if fitted and used + cost > HISTORY_TOKEN_BUDGET:
+            break
+        fitted.append((q, a))
+        used += cost
+    return list(reversed(fitted))
+
+def _fit_references(rag_qa: List[Dict[str, Any]], budget: int) -> Tuple[List[Dict[str, Any]], int]:
+    """類似度の高い参照から budget に詰める。入りきらなければ回答を切り詰め、それでも無理なら落とす。
+    最上位の参照は必ず残す。
+
+    Returns (残した参照（元の順序、回答は切り詰め済みのコピー）, 切り詰めた件数)
+    """
+    chosen: Dict[int, Dict[str, Any]] = {}
+    truncated = 0
+    remaining = budget
+    for i in sorted(range(len(rag_qa)), key=lambda i: rag_qa[i].get("similarity") or 0.0, reverse=True):
+        qa = dict(rag_qa[i])
+        original = qa.get("answer") or ""
+        qa["answer"] = _truncate_tokens(original, REFERENCE_MAX_TOKENS)
+        cost = _reference_tokens(qa)
+        if cost > remaining:
+            room = remaining - (cost - _count_tokens(qa["answer"]))
+            if chosen and room < REFERENCE_MIN_TOKENS:
+                continue  # 下位の短い参照なら入るかもしれないので続ける
+            qa["answer"] = _truncate_tokens(qa["answer"], max(room, REFERENCE_MIN_TOKENS))
+            cost = _reference_tokens(qa)
+        if qa["answer"] != original:
+            truncated += 1
+        chosen[i] = qa
+        remaining -= cost
+    return [chosen[i] for i in sorted(chosen)], truncated
+
+
 # ----------------------------------------------------------------------------
 # Public API
 # ----------------------------------------------------------------------------
 
+_GENERATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        "used_source_ids": {
+            "type": "array",
+            "items": {"type": "string"}
+        },
+        "evidence": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source_id": {"type": "string"},
+                    "quotes": {
+                        "type": "array",
+                        "items": {"type": "string"}
+                    }
+                },
+                "required": ["source_id", "quotes"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["answer", "used_source_ids", "evidence"],
+    "additionalProperties": False
+}
+
+def _build_generation_prompt(
+    question_text: str,
+    rag_qa: List[Dict[str, Any]],
+    history_qa: List[Tuple[str, str]],
+    lang: str,
+    max_history_in_prompt: int,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """rag_qa へ sid（S1..Sn）を付与し、PROMPT_TOKEN_BUDGET に収めた言語別のプロンプトを組み立てる
+
+    sid は参照一覧（_format_references）と同じ番号を保つ。重複除去や予算超過で落とした参照は欠番になる。
+    """
+    numbered = [dict(qa, sid=qa.get("sid") or f"S{i}") for i, qa in enumerate(rag_qa, 1)]
+
+    builder = _PROMPT_BUILDERS.get(lang, _PROMPT_BUILDERS["ja"])
+    clipped_hist = _clip_history(history_qa, max_history_in_prompt)
+    fitted_hist = _fit_history(clipped_hist)
+    deduped = _dedupe_references(numbered)
+    # 指示文・履歴・質問を除いた残りを参照に割り当てる
+    base_tokens = _count_tokens(builder(question_text, [], fitted_hist))
+    rag_with_sid, truncated = _fit_references(deduped, PROMPT_TOKEN_BUDGET - base_tokens)
+
+    prompt = builder(question_text, rag_with_sid, fitted_hist)
+    print(
+        f"プロンプト: {_count_tokens(prompt)} トークン（予算 {PROMPT_TOKEN_BUDGET}）"
+        f" 参照 {len(rag_with_sid)}/{len(numbered)} 件（重複除去 {len(numbered) - len(deduped)}, 切り詰め {truncated}）"
+        f" 履歴 {len(fitted_hist)}/{len(clipped_hist)} ターン"
+    )
+    return prompt, rag_with_sid
+
+def _parse_generation(content: str, rag_with_sid: List[Dict[str, Any]], used_model: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(content)
+        answer_text = str(data.get("answer", "")).strip()
+        used_ids = [str(x) for x in (data.get("used_source_ids") or [])]
+        evidence = data.get("evidence") or []
+        return {
+            "answer": answer_text,
+            "used_source_ids": used_ids,
+            "evidence": evidence,
+            "model_used": used_model,
+        }
+    except Exception:
+        # フォールバック: そのままテキストを返し、全ての出典を使用扱い
+        return {
+            "answer": content,
+            "used_source_ids": [x["sid"] for x in rag_with_sid],
+            "evidence": [],
+            "model_used": used_model,
+        }
+
 def generate_answer_with_llm(
     question_text: str,
     rag_qa: List[Dict[str, Any]],
@@ -1022,98 +1649,47 @@ def generate_answer_with_llm(
         except Exception:
             lang = "ja"  # フォールバック
 
-    # rag_qa へ sid を付与（S1..Sn）
-    rag_with_sid: List[Dict[str, Any]] = []
-    for i, qa in enumerate(rag_qa, 1):
-        qa_copy = dict(qa)
-        qa_copy["sid"] = f"S{i}"
-        rag_with_sid.append(qa_copy)
-
-    builder = _PROMPT_BUILDERS.get(lang, _PROMPT_BUILDERS["ja"])
-    clipped_hist = _clip_history(history_qa, max_history_in_prompt)
+    prompt, rag_with_sid = _build_generation_prompt(question_text, rag_qa, history_qa, lang, max_history_in_prompt)
 
-    prompt = builder(question_text, rag_with_sid, clipped_hist)
-    
-    import time
     llm_start = time.time()
     # 期待するJSONのスキーマを指定して厳密出力を促す
-    response_schema = {
-        "type": "object",
-        "properties": {
-            "answer": {"type": "string"},
-            "used_source_ids": {
-                "type": "array",
-                "items": {"type": "string"}
-            },
-            "evidence": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "source_id": {"type": "string"},
-                        "quotes": {
-                            "type": "array",
-                            "items": {"type": "string"}
-                        }
-                    },
-                    "required": ["source_id", "quotes"],
-                    "additionalProperties": False
-                }
-            }
-        },
-        "required": ["answer", "used_source_ids", "evidence"],
-        "additionalProperties": False
-    }
     content, used_model = _responses_text(
         prompt,
         model=model,
         max_output_tokens=800,
         timeout_s=90,
-        response_schema=response_schema,
+        response_schema=_GENERATION_SCHEMA,
         reasoning_effort=reasoning_effort,
     )
     print(f"LLM回答生成完了 (所要時間: {time.time()-llm_start:.2f}s, 使用モデル: {used_model})")
+    return _parse_generation(content, rag_with_sid, used_model)
 
-    try:
-        data = json.loads(content)
-        answer_text = str(data.get("answer", "")).strip()
-        used_ids = [str(x) for x in (data.get("used_source_ids") or [])]
-        evidence = data.get("evidence") or []
-        return {
-            "answer": answer_text, 
-            "used_source_ids": used_ids, 
-            "evidence": evidence,
-            "model_used": used_model,
-        }
-    except Exception:
-        # フォールバック: そのままテキストを返し、全ての出典を使用扱い
-        return {
-            "answer": content, 
-            "used_source_ids": [x["sid"] for x in rag_with_sid], 
-            "evidence": [],
-            "model_used": used_model,
-        }
-
-
-def answer_with_rag(
+async def agenerate_answer_with_llm(
     question_text: str,
+    rag_qa: List[Dict[str, Any]],
     history_qa: List[Tuple[str, str]],
     *,
-    similarity_threshold: float = 0.3,
-    max_history_in_prompt: int = 6,
+    lang: str = "ja",
     model: str = "gpt-5-nano",
     reasoning_effort: str = "minimal",
+    max_history_in_prompt: int = 6,
 ) -> Dict[str, Any]:
-    """Retrieve → generate. 統一フォーマットで返す。"""
-    lang = "ja"
-    try:
-        lang = detect_lang(question_text)
-    except Exception:
-        pass
+    """generate_answer_with_llm の非同期版"""
+    prompt, rag_with_sid = _build_generation_prompt(question_text, rag_qa, history_qa, lang, max_history_in_prompt)
 
-    # 検索（会話履歴も含める）
-    results = rag(question_text, similarity_threshold=similarity_threshold, history_qa=history_qa)
+    llm_start = time.time()
+    content, used_model = await _aresponses_text(
+        prompt,
+        model=model,
+        max_output_tokens=800,
+        timeout_s=90,
+        response_schema=_GENERATION_SCHEMA,
+        reasoning_effort=reasoning_effort,
+    )
+    print(f"LLM回答生成完了 (所要時間: {time.time()-llm_start:.2f}s, 使用モデル: {used_model})")
+    return _parse_generation(content, rag_with_sid, used_model)
 
+def _format_references(results: Dict[int, Any]) -> List[Dict[str, Any]]:
     # 整形（UIで使いやすいよう辞書リスト化）。sid を振る
     references = []
     for i, (rank, item) in enumerate(results.items(), 1):
@@ -1126,6 +1702,7 @@ def answer_with_rag(
                 "time": item.get("time"),
                 "similarity": item.get("similarity"),
                 "question_id": item.get("question_id"),
+                "qa_id": item.get("qa_id"),
                 "category_id": item.get("category_id"),
                 "answer_time": item.get("answer_time"),
             })
@@ -1139,83 +1716,77 @@ def answer_with_rag(
                 "time": t,
                 "similarity": sim,
             })
+    return references
+
+def _fallback_prompt(lang: str, question_text: str) -> str:
+    # 言語に応じてフォールバック文面を切り替える
+    fallback_texts = {
+        "ja": (
+            "参照情報を見つけられませんでした。推測は避け、情報不足を明示しつつ、\n"
+            "わかっている範囲で簡潔に回答してください。\n"
+            "読みやすさのため、段落や箇条書き（- や 1.）を適宜用いてください。\n\n"
+            f"【質問】\n{question_text}\n"
+        ),
+        "en": (
+            "No reference information was found. Avoid guessing and clearly state the information gap.\n"
+            "Answer concisely only within what is known.\n"
+            "For readability, use paragraphs and bullet points (-, 1.) where helpful.\n\n"
+            f"Question:\n{question_text}\n"
+        ),
+        "vi": (
+            "Không tìm thấy thông tin tham chiếu. Tránh suy đoán và nêu rõ những phần còn thiếu thông tin.\n"
+            "Vui lòng trả lời ngắn gọn trong phạm vi điều đã biết.\n"
+            "Để dễ đọc, hãy dùng đoạn xuống dòng và gạch đầu dòng (-, 1.) khi phù hợp.\n\n"
+            f"Câu hỏi:\n{question_text}\n"
+        ),
+        "zh": (
+            "未找到可参考的信息。请避免猜测，明确说明信息不足之处。\n"
+            "请在已知范围内简洁作答。\n"
+            "为提高可读性，请使用段落/换行与项目符号（-、1.）。\n\n"
+            f"问题：\n{question_text}\n"
+        ),
+        "ko": (
+            "참고할 정보를 찾지 못했습니다. 추측은 피하고 정보 부족을 명확히 밝혀주세요.\n"
+            "아는 범위 내에서 간결하게 답변해주세요.\n"
+            "가독성을 위해 단락/줄바꿈과 글머리표(-, 1.)를 적절히 사용하세요.\n\n"
+            f"질문:\n{question_text}\n"
+        ),
+    }
+    return fallback_texts.get(lang, fallback_texts["ja"])  # 安全フォールバック
 
-    # 参照ゼロ → フォールバック応答（推測は避ける指示）
-    if not references:
-        # 言語に応じてフォールバック文面を切り替える
-        fallback_texts = {
-            "ja": (
-                "参照情報を見つけられませんでした。推測は避け、情報不足を明示しつつ、\n"
-                "わかっている範囲で簡潔に回答してください。\n"
-                "読みやすさのため、段落や箇条書き（- や 1.）を適宜用いてください。\n\n"
-                f"【質問】\n{question_text}\n"
-            ),
-            "en": (
-                "No reference information was found. Avoid guessing and clearly state the information gap.\n"
-                "Answer concisely only within what is known.\n"
-                "For readability, use paragraphs and bullet points (-, 1.) where helpful.\n\n"
-                f"Question:\n{question_text}\n"
-            ),
-            "vi": (
-                "Không tìm thấy thông tin tham chiếu. Tránh suy đoán và nêu rõ những phần còn thiếu thông tin.\n"
-                "Vui lòng trả lời ngắn gọn trong phạm vi điều đã biết.\n"
-                "Để dễ đọc, hãy dùng đoạn xuống dòng và gạch đầu dòng (-, 1.) khi phù hợp.\n\n"
-                f"Câu hỏi:\n{question_text}\n"
-            ),
-            "zh": (
-                "未找到可参考的信息。请避免猜测，明确说明信息不足之处。\n"
-                "请在已知范围内简洁作答。\n"
-                "为提高可读性，请使用段落/换行与项目符号（-、1.）。\n\n"
-                f"问题：\n{question_text}\n"
-            ),
-            "ko": (
-                "참고할 정보를 찾지 못했습니다. 추측은 피하고 정보 부족을 명확히 밝혀주세요.\n"
-                "아는 범위 내에서 간결하게 답변해주세요.\n"
-                "가독성을 위해 단락/줄바꿈과 글머리표(-, 1.)를 적절히 사용하세요.\n\n"
-                f"질문:\n{question_text}\n"
-            ),
-        }
-        fallback_prompt = fallback_texts.get(lang, fallback_texts["ja"])  # 安全フォールバック
-        text, used_model = _responses_text(fallback_prompt, model=model, max_output_tokens=400, timeout_s=60, reasoning_effort=reasoning_effort)
-        print(f"フォールバック回答生成: 使用モデル={used_model}")
-        return {
-            "type": "rag",
-            "text": text.strip(),
-            "meta": {
-                "lang": lang,
-                "references": [],
-                "similarity_threshold": similarity_threshold,
-                "model_used": used_model,
-            },
-        }
-
-    gen = generate_answer_with_llm(
-        question_text,
-        references,
-        history_qa,
-        lang=lang,
-        model=model,
-        reasoning_effort=reasoning_effort,
-        max_history_in_prompt=max_history_in_prompt,
-    )
-
-    answer_text = gen.get("answer", "").strip()
-    used_ids = set(gen.get("used_source_ids", []))
-    evidence = gen.get("evidence", [])
-    model_used = gen.get("model_used", "unknown")
-    used_references = [r for r in references if r.get("sid") in used_ids] if used_ids else references
+def _fallback_response(lang: str, text: str, similarity_threshold: float, used_model: str) -> Dict[str, Any]:
+    return {
+        "type": "rag",
+        "text": text.strip(),
+        "meta": {
+            "lang": lang,
+            "references": [],
+            "similarity_threshold": similarity_threshold,
+            "model_used": used_model,
+        },
+    }
 
+def _clean_answer_text(answer_text: str) -> str:
     # Strip inline citation tags like [S1], [S2] from the displayed answer
     # Preserve line breaks and normalize spaces without collapsing paragraphs
     text_no_cite = re.sub(r"\s*\[S\d+\]", "", answer_text)
     t = text_no_cite.replace("\r\n", "\n").replace("\r", "\n")
     t = re.sub(r"[ \t]{2,}", " ", t)             # collapse multiple spaces/tabs only
     t = "\n".join(line.rstrip() for line in t.split("\n"))  # trim end-of-line spaces
-    clean_text = re.sub(r"\n{3,}", "\n\n", t).strip()     # keep at most one blank line between paragraphs
+    return re.sub(r"\n{3,}", "\n\n", t).strip()     # keep at most one blank line between paragraphs
+
+def _rag_response(
+    lang: str, gen: Dict[str, Any], references: List[Dict[str, Any]], similarity_threshold: float,
+) -> Dict[str, Any]:
+    answer_text = gen.get("answer", "").strip()
+    used_ids = set(gen.get("used_source_ids", []))
+    evidence = gen.get("evidence", [])
+    model_used = gen.get("model_used", "unknown")
+    used_references = [r for r in references if r.get("sid") in used_ids] if used_ids else references
 
     return {
         "type": "rag",
-        "text": clean_text,
+        "text": _clean_answer_text(answer_text),
         "meta": {
             "lang": lang,
             "references": used_references,
@@ -1226,6 +1797,322 @@ def answer_with_rag(
         },
     }
 
+def _answer_cache_key(model: str, similarity_threshold: float) -> str:
+    # 閾値が違うと参照の集合（ひいては回答）が変わるので、キャッシュはモデルと閾値（0.01 刻み）ごとに分ける
+    return f"{model}@t{round(float(similarity_threshold), 2):.2f}"
+
+def _lookup_answer_cache(lang: str, model: str, question_text: str, history_qa) -> Tuple[Optional[np.ndarray], Optional[Dict[str, Any]]]:
+    """履歴なしの質問は意味的回答キャッシュを先に引く（クエリ埋め込みは rag() でもキャッシュから再利用される）。
+
+    Returns (保存用の質問ベクトル or None, キャッシュ済み応答 or None).
+    """
+    if not answer_cache.ENABLED or history_qa:
+        return None, None
+    try:
+        cache_vec = np.array(get_query_embedding(question_text), dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(cache_vec)
+        cached = answer_cache.lookup(lang, model, cache_vec)
+        if cached is not None:
+            print(f"回答キャッシュヒット: {cached['meta']['answer_cache']}")
+        return cache_vec, cached
+    except Exception as e:
+        print(f"回答キャッシュ参照エラー: {e}")
+        return None, None
+
+def _store_answer_cache(lang, model, question_text, cache_vec, response, references) -> None:
+    if cache_vec is None:
+        return
+    # 参照候補すべての QA.id で無効化できるようにする（採用されなかった参照も回答に影響しうる）
+    try:
+        answer_cache.store(lang, model, question_text, cache_vec, response, [r.get("qa_id") for r in references])
+    except Exception as e:
+        print(f"回答キャッシュ保存エラー: {e}")
+
+def answer_with_rag(
+    question_text: str,
+    history_qa: List[Tuple[str, str]],
+    *,
+    similarity_threshold: float = 0.3,
+    max_history_in_prompt: int = 6,
+    model: str = "gpt-5-nano",
+    reasoning_effort: str = "minimal",
+    cached_summary: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Retrieve → generate. 統一フォーマットで返す。"""
+    lang = "ja"
+    try:
+        lang = detect_lang(question_text)
+    except Exception:
+        pass
+
+    cache_key = _answer_cache_key(model, similarity_threshold)
+    cache_vec, cached = _lookup_answer_cache(lang, cache_key, question_text, history_qa)
+    if cached is not None:
+        return cached
+
+    # 検索（会話履歴も含める）
+    results = rag(question_text, similarity_threshold=similarity_threshold, history_qa=history_qa, cached_summary=cached_summary)
+    references = _format_references(results)
+
+    # 参照ゼロ → フォールバック応答（推測は避ける指示）
+    if not references:
+        text, used_model = _responses_text(_fallback_prompt(lang, question_text), model=model, max_output_tokens=400, timeout_s=60, reasoning_effort=reasoning_effort)
+        print(f"フォールバック回答生成: 使用モデル={used_model}")
+        return _fallback_response(lang, text, similarity_threshold, used_model)
+
+    gen = generate_answer_with_llm(
+        question_text,
+        references,
+        history_qa,
+        lang=lang,
+        model=model,
+        reasoning_effort=reasoning_effort,
+        max_history_in_prompt=max_history_in_prompt,
+    )
+    response = _rag_response(lang, gen, references, similarity_threshold)
+    _store_answer_cache(lang, cache_key, question_text, cache_vec, response, references)
+    return response
+
+async def _alookup_answer_cache(lang: str, model: str, question_text: str, history_qa) -> Tuple[Optional[np.ndarray], Optional[Dict[str, Any]]]:
+    """_lookup_answer_cache の非同期版（埋め込みは await、行列の照合はスレッドで行う）"""
+    if not answer_cache.ENABLED or history_qa:
+        return None, None
+    try:
+        cache_vec = np.array(await aget_query_embedding(question_text), dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(cache_vec)
+        cached = await asyncio.to_thread(answer_cache.lookup, lang, model, cache_vec)
+        if cached is not None:
+            print(f"回答キャッシュヒット: {cached['meta']['answer_cache']}")
+        return cache_vec, cached
+    except Exception as e:
+        print(f"回答キャッシュ参照エラー: {e}")
+        return None, None
+
+async def _aretrieve(
+    question_text: str,
+    history_qa: List[Tuple[str, str]],
+    similarity_threshold: float,
+    model: str,
+    cached_summary: Optional[Dict[str, str]],
+) -> Dict[str, Any]:
+    """answer_with_rag_async / answer_with_rag_stream_async 共通の前段（言語判定 → 回答キャッシュ → 検索）。
+
+    キャッシュヒット時は "cached" に応答が入り、検索は行わない（"references" は None）。
+    """
+    lang = "ja"
+    try:
+        lang = detect_lang(question_text)
+    except Exception:
+        pass
+
+    cache_key = _answer_cache_key(model, similarity_threshold)
+    cache_vec, cached = await _alookup_answer_cache(lang, cache_key, question_text, history_qa)
+    references = None
+    if cached is None:
+        results = await arag(question_text, similarity_threshold=similarity_threshold, history_qa=history_qa, cached_summary=cached_summary)
+        references = _format_references(results)
+    return {"lang": lang, "cache_key": cache_key, "cache_vec": cache_vec, "cached": cached, "references": references}
+
+async def answer_with_rag_async(
+    question_text: str,
+    history_qa: List[Tuple[str, str]],
+    *,
+    similarity_threshold: float = 0.3,
+    max_history_in_prompt: int = 6,
+    model: str = "gpt-5-nano",
+    reasoning_effort: str = "minimal",
+    cached_summary: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """answer_with_rag の非同期版。返す形式は同じ"""
+    r = await _aretrieve(question_text, history_qa, similarity_threshold, model, cached_summary)
+    if r["cached"] is not None:
+        return r["cached"]
+    lang, references = r["lang"], r["references"]
+
+    if not references:
+        text, used_model = await _aresponses_text(_fallback_prompt(lang, question_text), model=model, max_output_tokens=400, timeout_s=60, reasoning_effort=reasoning_effort)
+        print(f"フォールバック回答生成: 使用モデル={used_model}")
+        return _fallback_response(lang, text, similarity_threshold, used_model)
+
+    gen = await agenerate_answer_with_llm(
+        question_text,
+        references,
+        history_qa,
+        lang=lang,
+        model=model,
+        reasoning_effort=reasoning_effort,
+        max_history_in_prompt=max_history_in_prompt,
+    )
+    response = _rag_response(lang, gen, references, similarity_threshold)
+    await asyncio.to_thread(_store_answer_cache, lang, r["cache_key"], question_text, r["cache_vec"], response, references)
+    return response
+
+# ----------------------------------------------------------------------------
+# Streaming
+# ----------------------------------------------------------------------------
+
+async def _astream_chat_text(prompt: str, *, timeout_s: int = 90, reasoning_effort: str = "minimal"):
+    """AsyncOpenAI の Chat Completions（stream=True）で本文の差分を順に返す非同期ジェネレータ。
+
+    ストリームを開始できなかった場合は _aresponses_text の結果を 1 回で返す（同じ代替経路を通す）。
+    最後に ("model", 使用モデル名) を返す。
+    """
+    client_req = async_client.with_options(timeout=timeout_s)
+    try:
+        stream = await client_req.chat.completions.create(
+            model="gpt-5-nano",
+            messages=[{"role": "user", "content": prompt}],
+            reasoning_effort=reasoning_effort,
+            stream=True,
+        )
+    except Exception as e:
+        print(f"✗ gpt-5-nano stream failed: {e}")
+        text, used_model = await _aresponses_text(prompt, timeout_s=timeout_s, reasoning_effort=reasoning_effort)
+        if text:
+            yield ("text", text)
+        yield ("model", used_model)
+        return
+
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content
+        if piece:
+            yield ("text", piece)
+    print(f"✓ LLM回答ストリーム完了: model=gpt-5-nano, reasoning_effort={reasoning_effort}")
+    yield ("model", "gpt-5-nano")
+
+class _AnswerFieldStream:
+    """生成中の JSON から "answer" の文字列値だけを取り出し、表示用の差分として返す。
+
+    エスケープはその場で復号し、[S1] のような出典タグは閉じ括弧まで見てから取り除く
+    （最終的な本文は完了後に _clean_answer_text で整えたものを別途送る）。
+    """
+
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+    _KEY_RE = re.compile(r'"answer"\s*:\s*"')
+
+    def __init__(self):
+        self.raw = ""
+        self.pos = None       # answer 値の読み取り位置（キー未出現なら None）
+        self.done = False
+        self.pending = ""     # 出典タグかもしれないので保留中の文字
+
+    def feed(self, piece: str) -> str:
+        self.raw += piece
+        if self.done:
+            return ""
+        if self.pos is None:
+            m = self._KEY_RE.search(self.raw)
+            if not m:
+                return ""
+            self.pos = m.end()
+
+        out = []
+        raw = self.raw
+        while self.pos < len(raw):
+            ch = raw[self.pos]
+            if ch == '"':
+                self.done = True
+                self.pos += 1
+                break
+            if ch == "\\":
+                if self.pos + 1 >= len(raw):
+                    break  # エスケープの続きを待つ
+                esc = raw[self.pos + 1]
+                if esc == "u":
+                    if self.pos + 6 > len(raw):
+                        break
+                    try:
+                        out.append(chr(int(raw[self.pos + 2:self.pos + 6], 16)))
+                    except ValueError:
+                        pass
+                    self.pos += 6
+                    continue
+                out.append(self._ESCAPES.get(esc, esc))
+                self.pos += 2
+                continue
+            out.append(ch)
+            self.pos += 1
+        return self._strip_citations("".join(out))
+
+    def _strip_citations(self, text: str) -> str:
+        text = self.pending + text
+        self.pending = ""
+        text = re.sub(r"\s*\[S\d+\]", "", text)
+        # 末尾が "[S12" のように出典タグの途中（またはその前の空白）なら次の差分まで保留する
+        m = re.search(r"\s*(\[(S\d*)?)?$", text)
+        if m and not self.done:
+            self.pending = text[m.start():]
+            text = text[:m.start()]
+        elif self.done:
+            text = text.rstrip()
+        return text
+
+async def answer_with_rag_stream_async(
+    question_text: str,
+    history_qa: List[Tuple[str, str]],
+    *,
+    similarity_threshold: float = 0.3,
+    max_history_in_prompt: int = 6,
+    model: str = "gpt-5-nano",
+    reasoning_effort: str = "minimal",
+    cached_summary: Optional[Dict[str, str]] = None,
+):
+    """answer_with_rag_async のストリーミング版。(event, payload) を順に返す非同期ジェネレータ。
+
+    - ("references", {"lang", "references"}): 検索直後（生成開始前）に 1 回
+    - ("delta", str): 回答本文の差分（出典タグは除去済み）
+    - ("done", response): answer_with_rag と同じ形式の最終応答
+    """
+    r = await _aretrieve(question_text, history_qa, similarity_threshold, model, cached_summary)
+    lang, cached, references = r["lang"], r["cached"], r["references"]
+    if cached is not None:
+        yield ("references", {"lang": lang, "references": cached.get("meta", {}).get("references", [])})
+        yield ("delta", cached.get("text", ""))
+        yield ("done", cached)
+        return
+
+    yield ("references", {"lang": lang, "references": references})
+
+    if not references:
+        # フォールバックは JSON ではなく平文で返るのでそのまま流す
+        parts, used_model = [], "none"
+        async for kind, value in _astream_chat_text(_fallback_prompt(lang, question_text), timeout_s=60, reasoning_effort=reasoning_effort):
+            if kind == "text":
+                parts.append(value)
+                yield ("delta", value)
+            else:
+                used_model = value
+        print(f"フォールバック回答生成: 使用モデル={used_model}")
+        yield ("done", _fallback_response(lang, "".join(parts), similarity_threshold, used_model))
+        return
+
+    prompt, rag_with_sid = _build_generation_prompt(question_text, references, history_qa, lang, max_history_in_prompt)
+    llm_start = time.time()
+    first_token_at = None
+    extractor = _AnswerFieldStream()
+    used_model = "none"
+    async for kind, value in _astream_chat_text(prompt, timeout_s=90, reasoning_effort=reasoning_effort):
+        if kind == "model":
+            used_model = value
+            continue
+        delta = extractor.feed(value)
+        if delta:
+            if first_token_at is None:
+                first_token_at = time.time()
+                print(f"LLM最初のトークン (所要時間: {first_token_at-llm_start:.2f}s)")
+            yield ("delta", delta)
+    print(f"LLM回答生成完了 (所要時間: {time.time()-llm_start:.2f}s, 使用モデル: {used_model})")
+
+    gen = _parse_generation(extractor.raw, rag_with_sid, used_model)
+    if extractor.pos is None and gen.get("answer"):
+        # JSON で返らなかった（本文がそのまま返った）場合はここでまとめて送る
+        yield ("delta", _clean_answer_text(gen["answer"]))
+    response = _rag_response(lang, gen, references, similarity_threshold)
+    await asyncio.to_thread(_store_answer_cache, lang, r["cache_key"], question_text, r["cache_vec"], response, references)
+    yield ("done", response)
+
 # ----------------------------------------------------------------------------
 # Orchestrator (sequential flow)
 # ----------------------------------------------------------------------------
@@ -0,0 +1,191 @@
+"""
+意味的回答キャッシュ - 会話履歴なしの質問に対する RAG 回答を、質問の埋め込みで引けるように保存する
+
+同じ言語・同じキー（model 列。RAG 側でモデル名と検索の類似度閾値から作る）で、
+質問ベクトルのコサイン類似度が閾値以上のエントリがあれば生成を省略する。
+エントリは参照した QA.id を記録しておき、その QA がベクトルストアで更新/削除されたら無効化する。
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from api.utils.vector_store import VECTOR_DIR
+
+CACHE_PATH = os.getenv("RAG_ANSWER_CACHE_PATH", str(VECTOR_DIR / "answer_cache.sqlite3"))
+ENABLED = os.getenv("RAG_ANSWER_CACHE", "1") not in ("0", "false", "False")
+MIN_SIMILARITY = float(os.getenv("RAG_ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+TTL_SECONDS = int(os.getenv("RAG_ANSWER_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES_PER_LANG = int(os.getenv("RAG_ANSWER_CACHE_MAX", "2000"))
+
+_local = threading.local()
+_MATRIX: Dict[Tuple[str, str], Tuple[int, np.ndarray, List[int]]] = {}  # (lang, model) -> (version, vectors, entry ids)
+_MATRIX_LOCK = threading.Lock()
+_STATS = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def _conn() -> sqlite3.Connection:
+    """スレッドごと（fork 後はプロセスごと）に接続を持つ"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        return conn
+    conn = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lang TEXT NOT NULL,
+            model TEXT NOT NULL,
+            question TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_answer_cache_lang ON answer_cache (lang, model);
+        CREATE TABLE IF NOT EXISTS answer_cache_refs (
+            entry_id INTEGER NOT NULL,
+            qa_id INTEGER NOT NULL,
+            PRIMARY KEY (qa_id, entry_id)
+        ) WITHOUT ROWID;
+        -- 変更のたびに version を進め、各プロセスはそれを見て行列を読み直す
+        CREATE TABLE IF NOT EXISTS answer_cache_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO answer_cache_version (id, version) VALUES (1, 0);
+        """
+    )
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+def _count(name: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[name] += n
+
+def _version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("SELECT version FROM answer_cache_version WHERE id = 1").fetchone()[0])
+
+def _bump_version(conn: sqlite3.Connection) -> None:
+    conn.execute("UPDATE answer_cache_version SET version = version + 1 WHERE id = 1")
+
+def _delete_entries(conn: sqlite3.Connection, entry_ids: List[int]) -> int:
+    if not entry_ids:
+        return 0
+    marks = ",".join("?" * len(entry_ids))
+    conn.execute(f"DELETE FROM answer_cache_refs WHERE entry_id IN ({marks})", entry_ids)
+    return conn.execute(f"DELETE FROM answer_cache WHERE id IN ({marks})", entry_ids).rowcount
+
+def _load_matrix(conn: sqlite3.Connection, lang: str, model: str) -> Tuple[np.ndarray, List[int]]:
+    version = _version(conn)
+    with _MATRIX_LOCK:
+        cached = _MATRIX.get((lang, model))
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+    rows = conn.execute(
+        "SELECT id, vector FROM answer_cache WHERE lang = ? AND model = ? AND created_at >= ?",
+        (lang, model, time.time() - TTL_SECONDS),
+    ).fetchall()
+    ids = [int(r[0]) for r in rows]
+    vectors = np.vstack([np.frombuffer(r[1], dtype="float32") for r in rows]) if rows else np.zeros((0, 0), dtype="float32")
+    with _MATRIX_LOCK:
+        _MATRIX[(lang, model)] = (version, vectors, ids)
+    return vectors, ids
+
+def lookup(lang: str, model: str, query_vec: np.ndarray) -> Optional[Dict[str, Any]]:
+    """正規化済みの質問ベクトルに十分近いエントリがあれば、保存した応答（dict）を返す"""
+    conn = _conn()
+    vectors, ids = _load_matrix(conn, lang, model)
+    query_vec = np.asarray(query_vec, dtype="float32").reshape(-1)
+    if not ids or vectors.shape[1] != query_vec.shape[0]:
+        _count("misses")
+        return None
+
+    sims = vectors @ query_vec
+    best = int(np.argmax(sims))
+    if float(sims[best]) < MIN_SIMILARITY:
+        _count("misses")
+        return None
+    row = conn.execute("SELECT response FROM answer_cache WHERE id = ?", (ids[best],)).fetchone()
+    if row is None:
+        # 他のワーカーが直前に無効化した
+        _count("misses")
+        return None
+    _count("hits")
+    response = json.loads(row[0])
+    response.setdefault("meta", {})["answer_cache"] = {"hit": True, "similarity": round(float(sims[best]), 4)}
+    return response
+
+def store(lang: str, model: str, question: str, query_vec: np.ndarray, response: Dict[str, Any], qa_ids: List[int]) -> None:
+    """応答を保存する。参照した QA.id が無い応答は無効化できないので保存しない"""
+    qa_ids = sorted({int(q) for q in qa_ids if q is not None})
+    if not qa_ids:
+        return
+    vec = np.ascontiguousarray(query_vec, dtype="float32").reshape(-1)
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(
+            "INSERT INTO answer_cache (lang, model, question, vector, response, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (lang, model, question, vec.tobytes(), json.dumps(response, ensure_ascii=False), time.time()),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO answer_cache_refs (entry_id, qa_id) VALUES (?, ?)",
+            [(cur.lastrowid, q) for q in qa_ids],
+        )
+        # 期限切れと、言語ごとの上限を超えた古いエントリを削除
+        stale = [r[0] for r in conn.execute(
+            """
+            SELECT id FROM answer_cache WHERE lang = ? AND (created_at < ? OR id NOT IN (
+                SELECT id FROM answer_cache WHERE lang = ? ORDER BY id DESC LIMIT ?
+            ))
+            """,
+            (lang, time.time() - TTL_SECONDS, lang, MAX_ENTRIES_PER_LANG),
+        ).fetchall()]
+        _delete_entries(conn, stale)
+        _bump_version(conn)
+    _count("stores")
+
+def invalidate_qa_ids(qa_ids) -> int:
+    """指定 QA を参照しているエントリを削除する。Returns the number of entries removed."""
+    qa_ids = [int(q) for q in qa_ids if q is not None]
+    if not qa_ids:
+        return 0
+    conn = _conn()
+    marks = ",".join("?" * len(qa_ids))
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        entry_ids = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT entry_id FROM answer_cache_refs WHERE qa_id IN ({marks})", qa_ids
+        ).fetchall()]
+        removed = _delete_entries(conn, entry_ids)
+        if removed:
+            _bump_version(conn)
+    _count("invalidated", removed)
+    return removed
+
+def clear() -> None:
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM answer_cache_refs")
+        conn.execute("DELETE FROM answer_cache")
+        _bump_version(conn)
+
+def stats() -> Dict[str, Any]:
+    """このプロセスでの集計（ワーカーごとの値）"""
+    with _STATS_LOCK:
+        snapshot = dict(_STATS)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 4) if lookups else None
+    snapshot["enabled"] = ENABLED
+    snapshot["min_similarity"] = MIN_SIMILARITY
+    return snapshot
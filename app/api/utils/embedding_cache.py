@@ -0,0 +1,227 @@
+"""
+埋め込みキャッシュ - (model, sha256(payload)) をキーに埋め込みベクトルを永続化する
+
+同じ "Q: ...\nA: ..." を再構築や編集のたびに埋め込み直さないためのもの。
+SQLite（WAL）に float32 の生バイトで保存するので、uvicorn の複数ワーカーから同時に読み書きできる。
+
+ユーザーの質問文（検索クエリ）は別テーブルに保存する。表記ゆれ（全角/半角・大文字小文字・空白）を
+正規化したテキストをキーにし、TTL と件数上限を持たせる。プロセス内 LRU を前段に置く。
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from api.utils.vector_store import VECTOR_DIR
+
+CACHE_PATH = os.getenv("RAG_EMBED_CACHE_PATH", str(VECTOR_DIR / "embedding_cache.sqlite3"))
+
+# SQLite のバインド変数上限（古いビルドは 999）に収まるように分割する
+_CHUNK = 500
+
+QUERY_TTL_SECONDS = int(os.getenv("RAG_QUERY_CACHE_TTL", str(7 * 24 * 3600)))
+QUERY_MAX_ENTRIES = int(os.getenv("RAG_QUERY_CACHE_MAX", "20000"))
+QUERY_LOCAL_SIZE = int(os.getenv("RAG_QUERY_CACHE_LOCAL_SIZE", "1024"))
+# 共有テーブルの期限切れ削除・件数制限は書き込み N 回に 1 回だけ行う
+_QUERY_PRUNE_EVERY = 256
+
+_local = threading.local()
+_STATS = {
+    "hits": 0, "misses": 0, "writes": 0,
+    "query_hits_local": 0, "query_hits_shared": 0, "query_misses": 0, "query_writes": 0,
+}
+_STATS_LOCK = threading.Lock()
+
+
+def content_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _conn() -> sqlite3.Connection:
+    """スレッドごと（fork 後はプロセスごと）に接続を持つ"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        return conn
+    conn = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            key TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (model, key)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS query_embeddings (
+            model TEXT NOT NULL,
+            key TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (model, key)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_created ON query_embeddings (created_at)")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+def _count(name: str, n: int) -> None:
+    with _STATS_LOCK:
+        _STATS[name] += n
+
+def get_many(model: str, keys: List[str]) -> Dict[str, np.ndarray]:
+    """キャッシュ済みのものだけを {key: float32 vector} で返す"""
+    found: Dict[str, np.ndarray] = {}
+    unique = list(dict.fromkeys(keys))
+    conn = _conn()
+    for i in range(0, len(unique), _CHUNK):
+        chunk = unique[i:i + _CHUNK]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT key, dim, vector FROM embeddings WHERE model = ? AND key IN ({marks})",
+            [model, *chunk],
+        ).fetchall()
+        for key, dim, blob in rows:
+            vec = np.frombuffer(blob, dtype="float32")
+            if len(vec) == dim:
+                found[key] = vec
+    _count("hits", len(found))
+    _count("misses", len(unique) - len(found))
+    return found
+
+def get(model: str, key: str) -> Optional[np.ndarray]:
+    return get_many(model, [key]).get(key)
+
+def put_many(model: str, items: Dict[str, Any]) -> None:
+    if not items:
+        return
+    now = time.time()
+    rows = []
+    for key, vec in items.items():
+        arr = np.ascontiguousarray(vec, dtype="float32").reshape(-1)
+        rows.append((model, key, int(arr.shape[0]), arr.tobytes(), now))
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, key, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    _count("writes", len(rows))
+
+# ----------------------------------------------------------------------------
+# Query embeddings (TTL + 件数上限)
+# ----------------------------------------------------------------------------
+
+_QUERY_LRU: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+_QUERY_LRU_LOCK = threading.Lock()
+_query_writes_since_prune = 0  # _QUERY_LRU_LOCK で保護
+
+
+def normalize_query(text: str) -> str:
+    """NFKC（全角英数→半角など）+ casefold + 空白の正規化"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+def query_key(text: str) -> str:
+    return content_key(normalize_query(text))
+
+def _remember_local(model: str, key: str, created_at: float, vec: np.ndarray) -> None:
+    with _QUERY_LRU_LOCK:
+        _QUERY_LRU[(model, key)] = (created_at, vec)
+        _QUERY_LRU.move_to_end((model, key))
+        while len(_QUERY_LRU) > QUERY_LOCAL_SIZE:
+            _QUERY_LRU.popitem(last=False)
+
+def get_query(model: str, key: str) -> Optional[np.ndarray]:
+    now = time.time()
+    local_hit = None
+    with _QUERY_LRU_LOCK:
+        entry = _QUERY_LRU.get((model, key))
+        if entry is not None:
+            if now - entry[0] < QUERY_TTL_SECONDS:
+                _QUERY_LRU.move_to_end((model, key))
+                local_hit = entry[1]
+            else:
+                del _QUERY_LRU[(model, key)]
+    if local_hit is not None:
+        _count("query_hits_local", 1)
+        return local_hit
+
+    row = _conn().execute(
+        "SELECT dim, vector, created_at FROM query_embeddings WHERE model = ? AND key = ? AND created_at >= ?",
+        (model, key, now - QUERY_TTL_SECONDS),
+    ).fetchone()
+    if row is None or len(row[1]) != row[0] * 4:
+        _count("query_misses", 1)
+        return None
+    vec = np.frombuffer(row[1], dtype="float32")
+    _remember_local(model, key, row[2], vec)
+    _count("query_hits_shared", 1)
+    return vec
+
+def put_query(model: str, key: str, vec) -> None:
+    global _query_writes_since_prune
+    arr = np.ascontiguousarray(vec, dtype="float32").reshape(-1)
+    now = time.time()
+    conn = _conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO query_embeddings (model, key, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+        (model, key, int(arr.shape[0]), arr.tobytes(), now),
+    )
+    _remember_local(model, key, now, arr)
+    _count("query_writes", 1)
+
+    # 複数スレッドから呼ばれるので、数えてリセットするまでをロックの中で行う（削除自体はロックの外）
+    with _QUERY_LRU_LOCK:
+        _query_writes_since_prune += 1
+        due = _query_writes_since_prune >= _QUERY_PRUNE_EVERY
+        if due:
+            _query_writes_since_prune = 0
+    if due:
+        prune_queries()
+
+def prune_queries() -> int:
+    """期限切れと上限超過分（古い順）を削除する。Returns the number of rows deleted."""
+    conn = _conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        deleted = conn.execute(
+            "DELETE FROM query_embeddings WHERE created_at < ?", (time.time() - QUERY_TTL_SECONDS,)
+        ).rowcount
+        deleted += conn.execute(
+            """
+            DELETE FROM query_embeddings WHERE created_at <= (
+                SELECT created_at FROM query_embeddings ORDER BY created_at DESC LIMIT 1 OFFSET ?
+            )
+            """,
+            (QUERY_MAX_ENTRIES,),
+        ).rowcount
+    return deleted
+
+def stats() -> Dict[str, Any]:
+    """このプロセスでの集計（ワーカーごとの値）"""
+    with _STATS_LOCK:
+        snapshot = dict(_STATS)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 4) if lookups else None
+    query_hits = snapshot["query_hits_local"] + snapshot["query_hits_shared"]
+    query_lookups = query_hits + snapshot["query_misses"]
+    snapshot["query_hit_rate"] = round(query_hits / query_lookups, 4) if query_lookups else None
+    with _QUERY_LRU_LOCK:
+        snapshot["query_local_entries"] = len(_QUERY_LRU)
+    snapshot["pid"] = os.getpid()
+    return snapshot
@@ -0,0 +1,194 @@
+"""
+語彙検索 - ベクトルストアの質問/回答テキストに対する BM25 の転置インデックス（プロセス内）
+
+埋め込みでは拾いにくい固有名詞・制度名・番号などの完全一致を補うためのもの。
+日本語/中国語/韓国語は分かち書きせず文字 bigram、それ以外の言語は単語（+ 数字列）で索引する。
+
+インデックスはストアの世代ごとに持つ。新しい世代を見つけたら vector_store の変更ログで
+変わった QA.id だけを差し替え、追えない場合（再構築・コンパクション後など）は全件から作り直す。
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple, Any
+
+from api.utils import vector_store
+
+# BM25 パラメータ
+K1 = 1.2
+B = 0.75
+
+# 分かち書きしない文字（CJK 統合漢字・ひらがな・カタカナ・ハングル）
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯ᄀ-ᇿ㄰-㆏"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+", re.UNICODE)
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+_INDEXES: Dict[str, "BM25Index"] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    """NFKC + casefold した上で、CJK の連続は文字 bigram（1 文字なら unigram）、それ以外は単語に分ける"""
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text or "").casefold()):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+class BM25Index:
+    """文書キー（QA.id、統合ストアでは (QA.id, language.id)）→ 行番号を持つ BM25 インデックス"""
+
+    def __init__(self, lang_code: str):
+        self.lang_code = lang_code
+        self.generation = -1
+        self.postings: Dict[str, Dict[Any, int]] = defaultdict(dict)
+        self.doc_terms: Dict[Any, Counter] = {}
+        self.doc_len: Dict[Any, int] = {}
+        self.rows: Dict[Any, int] = {}
+        self.keys_by_qa: Dict[int, set] = defaultdict(set)
+        self.total_len = 0
+        self.lock = threading.RLock()
+
+    def add(self, key, row: int, text: str) -> None:
+        terms = Counter(tokenize(text))
+        self.remove(key)
+        self.doc_terms[key] = terms
+        self.doc_len[key] = sum(terms.values())
+        self.total_len += self.doc_len[key]
+        self.rows[key] = row
+        self.keys_by_qa[key[0] if isinstance(key, tuple) else key].add(key)
+        for term, tf in terms.items():
+            self.postings[term][key] = tf
+
+    def remove(self, key) -> None:
+        terms = self.doc_terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(key, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(key, 0)
+        self.rows.pop(key, None)
+        qa_id = key[0] if isinstance(key, tuple) else key
+        self.keys_by_qa.get(qa_id, set()).discard(key)
+
+    def remove_qa(self, qa_id: int) -> None:
+        for key in list(self.keys_by_qa.pop(qa_id, ())):
+            self.remove(key)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """(行番号, BM25 スコア) を降順で最大 k 件"""
+        n_docs = len(self.doc_len)
+        if not n_docs:
+            return []
+        avg_len = self.total_len / n_docs or 1.0
+        scores: Dict[Any, float] = defaultdict(float)
+        for term, qtf in Counter(tokenize(query)).items():
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for key, tf in docs.items():
+                norm = K1 * (1 - B + B * self.doc_len[key] / avg_len)
+                scores[key] += qtf * idf * tf * (K1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [(self.rows[key], score) for key, score in top]
+
+# ----------------------------------------------------------------------------
+# スナップショットとの同期
+# ----------------------------------------------------------------------------
+
+def _row_key(snapshot: "vector_store.VectorSnapshot", row: int):
+    qa_id, _ = snapshot.get_meta(row)
+    if qa_id is None:
+        return None  # QA.id を持たない古い行は差分更新できないので索引しない
+    if not snapshot.unified:
+        return qa_id
+    return (qa_id, snapshot.get_lang_id(row))
+
+def _doc_text(snapshot: "vector_store.VectorSnapshot", row: int) -> str:
+    question, answer, _ = snapshot.get_text(row)
+    return f"{question}\n{answer}"
+
+def _rebuild(index: BM25Index, snapshot: "vector_store.VectorSnapshot") -> None:
+    fresh = BM25Index(index.lang_code)
+    for row in snapshot.live_rows().tolist():
+        key = _row_key(snapshot, row)
+        if key is not None:
+            fresh.add(key, row, _doc_text(snapshot, row))
+    index.postings, index.doc_terms, index.doc_len = fresh.postings, fresh.doc_terms, fresh.doc_len
+    index.rows, index.keys_by_qa, index.total_len = fresh.rows, fresh.keys_by_qa, fresh.total_len
+
+def _apply_changes(index: BM25Index, snapshot: "vector_store.VectorSnapshot", qa_ids: set) -> None:
+    """変わった QA.id の文書だけ入れ替え、他の文書は行番号だけ新しい世代に合わせる"""
+    for qa_id in qa_ids:
+        index.remove_qa(qa_id)
+    rows = {}
+    for row in snapshot.live_rows().tolist():
+        key = _row_key(snapshot, row)
+        if key is not None:
+            rows[key] = row
+    for key, row in rows.items():
+        qa_id = key[0] if isinstance(key, tuple) else key
+        if qa_id in qa_ids:
+            index.add(key, row, _doc_text(snapshot, row))
+    index.rows = {key: rows[key] for key in index.doc_len if key in rows}
+
+def get_index(snapshot: "vector_store.VectorSnapshot") -> BM25Index:
+    """スナップショットの世代に追いついた BM25 インデックスを返す（古い世代には戻さない）"""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(snapshot.lang_code)
+        if index is None:
+            index = _INDEXES[snapshot.lang_code] = BM25Index(snapshot.lang_code)
+    with index.lock:
+        if index.generation >= snapshot.generation:
+            return index
+        changed = None
+        if 0 <= index.generation < snapshot.generation:
+            changed = vector_store.changes_between(snapshot.lang_code, index.generation, snapshot.generation)
+        if changed is None:
+            _rebuild(index, snapshot)
+        else:
+            _apply_changes(index, snapshot, changed)
+        index.generation = snapshot.generation
+        return index
+
+def search(snapshot: "vector_store.VectorSnapshot", query: str, k: int) -> List[Tuple[int, float]]:
+    """(行番号, BM25 スコア)。行番号は snapshot の行。インデックスが既に新しい世代に進んでいれば空"""
+    index = get_index(snapshot)
+    with index.lock:
+        if index.generation != snapshot.generation:
+            return []
+        return index.search(query, k)
+
+def refresh(lang_code: str) -> None:
+    """書き込んだワーカー自身は次の検索を待たずに差分を取り込む"""
+    snapshot = vector_store.get_snapshot(lang_code)
+    if snapshot is not None:
+        get_index(snapshot)
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """各ランキング（行番号の列）を RRF で統合する。(行番号, スコア) を降順で返す"""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+def stats() -> Dict[str, Any]:
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+    return {
+        index.lang_code: {"generation": index.generation, "docs": len(index.doc_len), "terms": len(index.postings)}
+        for index in indexes
+    }
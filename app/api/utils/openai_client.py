@@ -0,0 +1,39 @@
+"""
+OpenAI クライアント - プロセス内で共有する同期/非同期クライアント（HTTP コネクションプール付き）
+
+リクエストごとにクライアントを作るとコネクションプールも作り直され、毎回 TLS ハンドシェイクが走る。
+RAG / reactive / action はここのクライアントを使う。async def のハンドラからは async_client を
+await して、1 ワーカーのイベントループで多数の会話を同時に待てるようにする。
+"""
+import os
+from typing import List, Dict, Any
+
+import dotenv
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+dotenv.load_dotenv()
+
+API_KEY = os.getenv("OPENAI_API_KEY")
+# 1 ワーカーあたりの同時接続数と、使い回すために保持しておく接続数
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT", "90"))
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE)
+
+client = OpenAI(api_key=API_KEY, http_client=httpx.Client(limits=_limits(), timeout=TIMEOUT_S))
+async_client = AsyncOpenAI(api_key=API_KEY, http_client=httpx.AsyncClient(limits=_limits(), timeout=TIMEOUT_S))
+
+
+def chat_text(messages: List[Dict[str, Any]], *, model: str, timeout_s: float = 20, **kwargs) -> str:
+    """Chat Completions を 1 回呼んで本文だけを返す"""
+    resp = client.with_options(timeout=timeout_s).chat.completions.create(model=model, messages=messages, **kwargs)
+    return (resp.choices[0].message.content or "").strip()
+
+async def achat_text(messages: List[Dict[str, Any]], *, model: str, timeout_s: float = 20, **kwargs) -> str:
+    """chat_text の非同期版"""
+    resp = await async_client.with_options(timeout=timeout_s).chat.completions.create(model=model, messages=messages, **kwargs)
+    return (resp.choices[0].message.content or "").strip()
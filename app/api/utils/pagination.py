@@ -0,0 +1,38 @@
+"""
+キーセットページング用のカーソル - 一覧の最後の行の (時刻, id) を "2025-10-21T12:19:47,123" の形で受け渡す
+
+OFFSET と違い、何ページ目でもインデックスの範囲検索 1 回で次のページを引ける。
+並べ替えに使う時刻の列は NOT NULL にしてある（migrations の 010）。NULL の行があると
+`time < ?` にも `time = ?` にも当たらず、そこでページングが途切れるため。
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+# 時刻が NULL だった行の埋め値（TIMESTAMP の下限 1970-01-01 00:00:01 UTC をタイムゾーンによらず超える値）
+NULL_TIME = datetime(1970, 1, 2)
+
+def encode_cursor(time_value: Optional[datetime], row_id: int) -> str:
+    # 次ページがあるのにカーソルが None だと一覧がそこで終わって見えるので、NULL は埋め値で表す
+    return f"{(time_value or NULL_TIME).isoformat()},{int(row_id)}"
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """カーソル文字列を (時刻, id) に戻す。不正な形式は ValueError"""
+    if not cursor:
+        return None
+    time_part, _, id_part = cursor.rpartition(",")
+    if not time_part:
+        raise ValueError(f"不正なカーソルです: {cursor}")
+    return datetime.fromisoformat(time_part), int(id_part)
+
+def clamp_limit(limit: Optional[int], default: int, maximum: int) -> int:
+    if limit is None:
+        return default
+    return max(1, min(int(limit), maximum))
+
+# 一覧で本文の代わりに返す抜粋の長さ。SQL では LEFT(texts, SNIPPET_CHARS + 1) で取り、超えていたら省略記号を付ける
+SNIPPET_CHARS = 120
+
+def snippet(text: Optional[str]) -> Optional[str]:
+    if text and len(text) > SNIPPET_CHARS:
+        return text[:SNIPPET_CHARS] + "…"
+    return text
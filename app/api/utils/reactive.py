@@ -4,8 +4,7 @@ import re
 from dataclasses import dataclass
 from typing import List, Tuple, Optional, Dict
 
-from langchain_community.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage
+from api.utils.openai_client import chat_text, achat_text
 
 # ---- Intent classification (rule-first, conservative) ---------------------
 
@@ -271,11 +270,16 @@ def resolve_target_text(question_text: str, history_qa: List[Tuple[str, str]]) -
             return last_user.strip()
     return None
 
-# ---- Lightweight reactive actions via ChatOpenAI -------------------------
+# ---- Lightweight reactive actions via the shared OpenAI client ----------
 
-def _llm(model: str = "gpt-4.1-nano", timeout_s: int = 20) -> ChatOpenAI:
-    # Keep consistent with existing code style (RAG side uses LangChain as well)
-    return ChatOpenAI(model=model, temperature=0.2, request_timeout=timeout_s)
+REACTIVE_MODEL = "gpt-4.1-nano"
+
+def _complete(prompt: str, model: str = REACTIVE_MODEL, timeout_s: int = 20) -> str:
+    # Shared client (one connection pool per process) instead of a new ChatOpenAI per call
+    return chat_text([{"role": "user", "content": prompt}], model=model, timeout_s=timeout_s, temperature=0.2)
+
+async def _acomplete(prompt: str, model: str = REACTIVE_MODEL, timeout_s: int = 20) -> str:
+    return await achat_text([{"role": "user", "content": prompt}], model=model, timeout_s=timeout_s, temperature=0.2)
 
 
 _LANG_NAME = {
@@ -287,45 +291,55 @@ _LANG_NAME = {
 }
 
 
-def translate_text(text: str, target_lang_code: str) -> str:
+def _translate_prompt(text: str, target_lang_code: str) -> str:
     # If Q/A formatted, translate only the Answer portion
     _q, _a, has_qa = _extract_answer_block(text)
     if has_qa:
         text = _a
 
     lang_name = _LANG_NAME.get(target_lang_code, "Japanese")
-    prompt = (
+    return (
         f"Translate the following text into {lang_name} accurately and naturally.\n"
         f"- If the input seems to include a question and answer, translate only the answer content.\n"
         f"- Output only the translated text without any preface, quotes, labels, or extra lines.\n\n"
         f"Text:\n{text}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    out = resp.content.strip()
+
+def _strip_question_lines(out: str) -> str:
     # Final guard: drop any accidental leading 'Q:' lines
     if out.lower().startswith("q:"):
         out = "\n".join([ln for ln in out.splitlines() if not ln.lower().startswith("q:")]).strip()
     return out
 
+def translate_text(text: str, target_lang_code: str) -> str:
+    return _strip_question_lines(_complete(_translate_prompt(text, target_lang_code)))
 
-def summarize_text(text: str, output_lang_code: str) -> str:
+async def atranslate_text(text: str, target_lang_code: str) -> str:
+    return _strip_question_lines(await _acomplete(_translate_prompt(text, target_lang_code)))
+
+
+def _summarize_prompt(text: str, output_lang_code: str) -> str:
     # Summarize only the Answer portion if Q/A formatted
     _q, _a, has_qa = _extract_answer_block(text)
     if has_qa:
         text = _a
 
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
+    return (
         f"Summarize the following text in {lang_name}.\n"
         f"- Be concise and preserve key facts.\n"
         f"- Use bullet points if it helps clarity.\n\n"
         f"Text:\n{text}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
+def summarize_text(text: str, output_lang_code: str) -> str:
+    return _complete(_summarize_prompt(text, output_lang_code))
+
+async def asummarize_text(text: str, output_lang_code: str) -> str:
+    return await _acomplete(_summarize_prompt(text, output_lang_code))
 
-def rewrite_text(text: str, output_lang_code: str, style_hint: Optional[str] = None) -> str:
+
+def _rewrite_prompt(text: str, output_lang_code: str, style_hint: Optional[str] = None) -> str:
     # Rewrite only the Answer portion if Q/A formatted
     _q, _a, has_qa = _extract_answer_block(text)
     if has_qa:
@@ -333,28 +347,37 @@ def rewrite_text(text: str, output_lang_code: str, style_hint: Optional[str] = N
 
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
     style = style_hint or "more natural and polite"
-    prompt = (
+    return (
         f"Rewrite the following text in {lang_name}, {style}.\n"
         f"- Fix grammar and wording where needed.\n"
         f"- Keep original meaning.\n\n"
         f"Text:\n{text}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
+
+def rewrite_text(text: str, output_lang_code: str, style_hint: Optional[str] = None) -> str:
+    return _complete(_rewrite_prompt(text, output_lang_code, style_hint))
+
+async def arewrite_text(text: str, output_lang_code: str, style_hint: Optional[str] = None) -> str:
+    return await _acomplete(_rewrite_prompt(text, output_lang_code, style_hint))
 
 # ---- New helpers ---------------------------------------------------------
+# 各タスクはプロンプトを作る関数（_xxx_prompt）だけを持ち、同期版（xxx_text）と
+# 非同期版（areactive_handle 経由）が同じプロンプトを使う
 
-def simplify_text(text: str, output_lang_code: str) -> str:
+def _answer_part(text: str) -> str:
+    # Q/A 形式なら回答部分だけを対象にする
     _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+    return _a if has_qa else text
+
+def _simplify_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
+    return (
         f"Rewrite the text in {lang_name} using simpler words for a general audience.\n"
-        f"- Keep core facts correct.\n- Use short sentences.\n- Add a brief example if it helps.\n\nText:\n{text}"
+        f"- Keep core facts correct.\n- Use short sentences.\n- Add a brief example if it helps.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
+
+def simplify_text(text: str, output_lang_code: str) -> str:
+    return _complete(_simplify_prompt(text, output_lang_code))
 
 def _detect_target_length(question_text: str) -> Optional[int]:
     m = re.search(r"(\d{2,4})\s*(文字|字|chars?|characters?)", question_text, flags=re.IGNORECASE)
@@ -365,164 +388,141 @@ def _detect_target_length(question_text: str) -> Optional[int]:
             return None
     return None
 
-def shorten_text(text: str, output_lang_code: str, question_text: Optional[str] = None) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+def _shorten_prompt(text: str, output_lang_code: str, question_text: Optional[str] = None) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
     target_len = _detect_target_length(question_text or "")
     hint = f" in about {target_len} characters" if target_len else " concisely"
-    prompt = (
-        f"Summarize the following text in {lang_name}{hint}.\n- Keep key facts.\n- Remove repetitions and tangents.\n\nText:\n{text}"
+    return (
+        f"Summarize the following text in {lang_name}{hint}.\n- Keep key facts.\n- Remove repetitions and tangents.\n\nText:\n{_answer_part(text)}"
+    )
+
+def shorten_text(text: str, output_lang_code: str, question_text: Optional[str] = None) -> str:
+    return _complete(_shorten_prompt(text, output_lang_code, question_text))
+
+def _expand_prompt(text: str, output_lang_code: str) -> str:
+    lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
+    return (
+        f"Expand the following text in {lang_name}.\n- Add brief context and a concrete example.\n- Keep the original meaning.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
 def expand_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+    return _complete(_expand_prompt(text, output_lang_code))
+
+def _bullets_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Expand the following text in {lang_name}.\n- Add brief context and a concrete example.\n- Keep the original meaning.\n\nText:\n{text}"
+    return (
+        f"Convert the following into clear bullet points in {lang_name}.\n- Each bullet one idea.\n- Keep key facts and numbers.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
 def bullets_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+    return _complete(_bullets_prompt(text, output_lang_code))
+
+def _outline_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Convert the following into clear bullet points in {lang_name}.\n- Each bullet one idea.\n- Keep key facts and numbers.\n\nText:\n{text}"
+    return (
+        f"Create a hierarchical outline with headings in {lang_name}.\n- Use H1/H2/H3 style labels.\n- Keep sections short.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
 def outline_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+    return _complete(_outline_prompt(text, output_lang_code))
+
+def _title_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Create a hierarchical outline with headings in {lang_name}.\n- Use H1/H2/H3 style labels.\n- Keep sections short.\n\nText:\n{text}"
+    return (
+        f"Generate a single-line, informative title in {lang_name}.\n- ~20 characters if possible.\n- No quotes or prefixes.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
 def title_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+    return _complete(_title_prompt(text, output_lang_code))
+
+def _keywords_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Generate a single-line, informative title in {lang_name}.\n- ~20 characters if possible.\n- No quotes or prefixes.\n\nText:\n{text}"
+    return (
+        f"Extract 5-10 key terms in {lang_name}.\n- Output as a comma-separated list.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
 def keywords_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+    return _complete(_keywords_prompt(text, output_lang_code))
+
+def _sentiment_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Extract 5-10 key terms in {lang_name}.\n- Output as a comma-separated list.\n\nText:\n{text}"
+    return (
+        f"Classify the sentiment and tone in {lang_name}.\n- Output: label + brief reason (one line).\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
 def sentiment_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
-    lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Classify the sentiment and tone in {lang_name}.\n- Output: label + brief reason (one line).\n\nText:\n{text}"
-    )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
+    return _complete(_sentiment_prompt(text, output_lang_code))
 
-def convert_format(text: str, output_lang_code: str, question_text: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+def _format_prompt(text: str, output_lang_code: str, question_text: str) -> str:
+    text = _answer_part(text)
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
     fmt = "json" if re.search(r"json", question_text, re.IGNORECASE) else (
         "csv" if re.search(r"csv", question_text, re.IGNORECASE) else "markdown"
     )
     if fmt == "json":
-        prompt = (
+        return (
             f"Convert to well-formed JSON in {lang_name}.\n- Choose reasonable keys.\n- Output only JSON.\n\nText:\n{text}"
         )
-    elif fmt == "csv":
-        prompt = (
+    if fmt == "csv":
+        return (
             f"Convert to CSV in {lang_name}.\n- First line header.\n- Output only CSV.\n\nText:\n{text}"
         )
-    else:
-        prompt = (
-            f"Convert to a Markdown table in {lang_name}.\n- Include header.\n- Output only the table.\n\nText:\n{text}"
-        )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
+    return (
+        f"Convert to a Markdown table in {lang_name}.\n- Include header.\n- Output only the table.\n\nText:\n{text}"
+    )
 
-def proofread_only_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+def convert_format(text: str, output_lang_code: str, question_text: str) -> str:
+    return _complete(_format_prompt(text, output_lang_code, question_text))
+
+def _proofread_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"Fix only typos and grammar in {lang_name}.\n- Do not change meaning or style.\n- Output corrected text only.\n\nText:\n{text}"
+    return (
+        f"Fix only typos and grammar in {lang_name}.\n- Do not change meaning or style.\n- Output corrected text only.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
-def restyle_text(text: str, output_lang_code: str, question_text: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+def proofread_only_text(text: str, output_lang_code: str) -> str:
+    return _complete(_proofread_prompt(text, output_lang_code))
+
+def _restyle_prompt(text: str, output_lang_code: str, question_text: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
     style = "polite" if re.search(r"丁寧|polite", question_text, re.IGNORECASE) else (
         "casual" if re.search(r"カジュアル|casual", question_text, re.IGNORECASE) else (
         "business" if re.search(r"ビジネス|business", question_text, re.IGNORECASE) else (
         "academic" if re.search(r"学術|academic", question_text, re.IGNORECASE) else "polite")))
-    prompt = (
-        f"Rewrite in {lang_name} with a {style} tone.\n- Keep original meaning.\n\nText:\n{text}"
+    return (
+        f"Rewrite in {lang_name} with a {style} tone.\n- Keep original meaning.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
-def extract_entities_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+def restyle_text(text: str, output_lang_code: str, question_text: str) -> str:
+    return _complete(_restyle_prompt(text, output_lang_code, question_text))
+
+def _entities_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
+    return (
         f"Extract entities (dates, amounts, counts, places, proper nouns) in {lang_name}.\n"
-        f"- Output as bullet list: type: value.\n\nText:\n{text}"
+        f"- Output as bullet list: type: value.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
-def keypoints_text(text: str, output_lang_code: str) -> str:
-    _q, _a, has_qa = _extract_answer_block(text)
-    if has_qa:
-        text = _a
+def extract_entities_text(text: str, output_lang_code: str) -> str:
+    return _complete(_entities_prompt(text, output_lang_code))
+
+def _keypoints_prompt(text: str, output_lang_code: str) -> str:
     lang_name = _LANG_NAME.get(output_lang_code, "Japanese")
-    prompt = (
-        f"List 3-5 key points in {lang_name}.\n- If requested, order as conclusion -> reasons.\n\nText:\n{text}"
+    return (
+        f"List 3-5 key points in {lang_name}.\n- If requested, order as conclusion -> reasons.\n\nText:\n{_answer_part(text)}"
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
 
-def detect_language_text(text: str) -> str:
-    prompt = (
+def keypoints_text(text: str, output_lang_code: str) -> str:
+    return _complete(_keypoints_prompt(text, output_lang_code))
+
+def _detect_language_prompt(text: str) -> str:
+    return (
         "Detect the language (ISO-639-1 code and name).\n"
         "Output: code - name.\n\nText:\n" + text
     )
-    resp = _llm().invoke([HumanMessage(content=prompt)])
-    return resp.content.strip()
+
+def detect_language_text(text: str) -> str:
+    return _complete(_detect_language_prompt(text))
 
 # ---- Public entrypoint ---------------------------------------------------
 
@@ -532,6 +532,47 @@ class ReactiveConfig:
     enable_llm_intent: bool = False       # optional: set True if you later add LLM-based intent fallback
 
 
+def task_prompt(task_type: str, target_text: str, target_lang: str, question_text: str = "") -> str:
+    """classify_intent の種別に対応するプロンプト（未知の種別は ValueError）"""
+    builders = {
+        "translate": lambda: _translate_prompt(target_text, target_lang),
+        "summarize": lambda: _summarize_prompt(target_text, target_lang),
+        "rewrite": lambda: _rewrite_prompt(target_text, target_lang),
+        "simplify": lambda: _simplify_prompt(target_text, target_lang),
+        "shorten": lambda: _shorten_prompt(target_text, target_lang, question_text),
+        "expand": lambda: _expand_prompt(target_text, target_lang),
+        "bullets": lambda: _bullets_prompt(target_text, target_lang),
+        "outline": lambda: _outline_prompt(target_text, target_lang),
+        "title": lambda: _title_prompt(target_text, target_lang),
+        "keywords": lambda: _keywords_prompt(target_text, target_lang),
+        "entities": lambda: _entities_prompt(target_text, target_lang),
+        "keypoints": lambda: _keypoints_prompt(target_text, target_lang),
+        "sentiment": lambda: _sentiment_prompt(target_text, target_lang),
+        "format": lambda: _format_prompt(target_text, target_lang, question_text),
+        "proofread_strict": lambda: _proofread_prompt(target_text, target_lang),
+        "style": lambda: _restyle_prompt(target_text, target_lang, question_text),
+        "detect_lang": lambda: _detect_language_prompt(target_text),
+    }
+    if task_type not in builders:
+        raise ValueError(f"unknown reactive task: {task_type}")
+    return builders[task_type]()
+
+def run_task(task_type: str, target_text: str, target_lang: str, question_text: str = "") -> str:
+    """種別のタスクを実行して本文を返す"""
+    out = _complete(task_prompt(task_type, target_text, target_lang, question_text))
+    return _strip_question_lines(out) if task_type == "translate" else out
+
+async def arun_task(task_type: str, target_text: str, target_lang: str, question_text: str = "") -> str:
+    """run_task の非同期版（async def のハンドラから await する。イベントループを塞がない）"""
+    out = await _acomplete(task_prompt(task_type, target_text, target_lang, question_text))
+    return _strip_question_lines(out) if task_type == "translate" else out
+
+def _task_meta(task_type: str, target_text: str, target_lang: str) -> Dict[str, object]:
+    if task_type == "detect_lang":
+        return {"source_len": len(target_text)}
+    return {"target_lang": target_lang, "source_len": len(target_text)}
+
+
 def reactive_handle(
     question_text: str,
     history_qa: List[Tuple[str, str]],
@@ -540,7 +581,7 @@ def reactive_handle(
     """Main entrypoint for the reactive agent.
 
     Returns:
-      - {"type": "translate"|"summarize"|"rewrite", "text": str, "meta": {...}}
+      - {"type": "translate"|"summarize"|"rewrite"|..., "text": str, "meta": {...}}
       - {"type": "route_to_rag"}
     """
     intent = classify_intent(question_text)
@@ -553,74 +594,5 @@ def reactive_handle(
     ttype = intent["type"]
     target_text = resolve_target_text(question_text, history_qa) or question_text
     target_lang = _detect_target_lang(question_text, cfg.default_lang)
-
-    if ttype == "translate":
-        out = translate_text(target_text, target_lang)
-        return {"type": "translate", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "summarize":
-        out = summarize_text(target_text, target_lang)
-        return {"type": "summarize", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "rewrite":
-        out = rewrite_text(target_text, target_lang)
-        return {"type": "rewrite", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "simplify":
-        out = simplify_text(target_text, target_lang)
-        return {"type": "simplify", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "shorten":
-        out = shorten_text(target_text, target_lang, question_text)
-        return {"type": "shorten", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "expand":
-        out = expand_text(target_text, target_lang)
-        return {"type": "expand", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "bullets":
-        out = bullets_text(target_text, target_lang)
-        return {"type": "bullets", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "outline":
-        out = outline_text(target_text, target_lang)
-        return {"type": "outline", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "title":
-        out = title_text(target_text, target_lang)
-        return {"type": "title", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "keywords":
-        out = keywords_text(target_text, target_lang)
-        return {"type": "keywords", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "entities":
-        out = extract_entities_text(target_text, target_lang)
-        return {"type": "entities", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "keypoints":
-        out = keypoints_text(target_text, target_lang)
-        return {"type": "keypoints", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "sentiment":
-        out = sentiment_text(target_text, target_lang)
-        return {"type": "sentiment", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "format":
-        out = convert_format(target_text, target_lang, question_text)
-        return {"type": "format", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "proofread_strict":
-        out = proofread_only_text(target_text, target_lang)
-        return {"type": "proofread_strict", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "style":
-        out = restyle_text(target_text, target_lang, question_text)
-        return {"type": "style", "text": out, "meta": {"target_lang": target_lang, "source_len": len(target_text)}}
-
-    if ttype == "detect_lang":
-        out = detect_language_text(target_text)
-        return {"type": "detect_lang", "text": out, "meta": {"source_len": len(target_text)}}
-
-    # Fallback: route to RAG for anything else
-    return {"type": "route_to_rag"}
+    out = run_task(ttype, target_text, target_lang, question_text)
+    return {"type": ttype, "text": out, "meta": _task_meta(ttype, target_text, target_lang)}
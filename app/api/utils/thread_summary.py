@@ -0,0 +1,160 @@
+"""
+スレッド要約 - 会話の検索用要約をスレッドごとに MySQL（thread_summary、migrations.py で作成）へ保存し、1 ターンずつ更新する
+
+回答を保存した後に「前回の要約 + 新しいターン」だけを要約し直す（入力は常に数百文字程度）。
+次の質問では load_fresh() が最新ターンまで反映済みの要約を返すので、RAG は要約の LLM 呼び出しを省ける。
+反映が追いついていない（更新中・失敗・言語が違う）ときは None を返し、RAG は従来どおり履歴から要約する。
+"""
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from database_utils import get_db_cursor, get_placeholder
+from api.utils.openai_client import chat_text, achat_text
+
+SUMMARY_MODEL = os.getenv("THREAD_SUMMARY_MODEL", "gpt-4.1-nano")
+MAX_SUMMARY_CHARS = int(os.getenv("THREAD_SUMMARY_MAX_CHARS", "300"))
+# 1 回の更新で畳み込むターン数と、各ターンの切り詰め長（入力サイズを一定に保つ）
+MAX_NEW_TURNS = 3
+MAX_QUESTION_CHARS = 300
+MAX_ANSWER_CHARS = 600
+
+_LANG_NAME = {
+    "ja": "Japanese",
+    "en": "English",
+    "vi": "Vietnamese",
+    "zh": "Chinese (Simplified)",
+    "ko": "Korean",
+    "pt": "Portuguese",
+    "es": "Spanish",
+    "tl": "Tagalog",
+    "id": "Indonesian",
+}
+
+_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thread-summary")
+_BACKGROUND_TASKS: set = set()
+
+
+def _clip(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    return text[:limit] + "..." if len(text) > limit else text
+
+# ----------------------------------------------------------------------------
+# 読み出し
+# ----------------------------------------------------------------------------
+
+def load_fresh(thread_id: int) -> Optional[Dict[str, str]]:
+    """スレッドの最新ターンまで反映済みの要約を {"summary", "lang"} で返す（なければ None）"""
+    try:
+        ph = get_placeholder()
+        with get_db_cursor() as (cursor, conn):
+            cursor.execute(f"""
+                SELECT s.summary, s.lang
+                FROM thread_summary s
+                WHERE s.thread_id = {ph}
+                  AND s.last_qa_id = (SELECT MAX(id) FROM thread_qa WHERE thread_id = {ph})
+            """, (thread_id, thread_id))
+            row = cursor.fetchone()
+    except Exception as e:
+        print(f"スレッド要約の読み込みエラー: {e}")
+        return None
+    if not row or not row['summary']:
+        return None
+    return {"summary": row['summary'], "lang": row['lang']}
+
+# ----------------------------------------------------------------------------
+# 更新（前回の要約 + 新しいターン → 新しい要約）
+# ----------------------------------------------------------------------------
+
+def _pending(thread_id: int, lang: str) -> Tuple[str, List[dict]]:
+    """(前回の要約, 未反映のターン（古い順、最大 MAX_NEW_TURNS 件）) を返す"""
+    ph = get_placeholder()
+    with get_db_cursor() as (cursor, conn):
+        cursor.execute(f"SELECT summary, lang, last_qa_id FROM thread_summary WHERE thread_id = {ph}", (thread_id,))
+        row = cursor.fetchone()
+        last_qa_id = row['last_qa_id'] if row else 0
+        cursor.execute(f"""
+            SELECT id, question, answer FROM thread_qa
+            WHERE thread_id = {ph} AND id > {ph}
+            ORDER BY id DESC
+            LIMIT {MAX_NEW_TURNS}
+        """, (thread_id, last_qa_id))
+        turns = list(reversed(cursor.fetchall()))
+    # 言語が変わったら前の要約は引き継がない（検索クエリの言語を揃える）
+    previous = row['summary'] if row and row['lang'] == lang else ""
+    return previous, turns
+
+def _fold_prompt(previous: str, turns: List[dict], lang: str) -> str:
+    lang_name = _LANG_NAME.get(lang, "Japanese")
+    conversation = "\n".join(
+        f"Q: {_clip(t['question'], MAX_QUESTION_CHARS)}\nA: {_clip(t['answer'], MAX_ANSWER_CHARS)}" for t in turns
+    )
+    return (
+        f"Update the running summary of a conversation in {lang_name}.\n"
+        f"- Keep the topics, places, procedures and conditions the user is asking about.\n"
+        f"- It is used as a search query for follow-up questions, so write plain text, no bullets.\n"
+        f"- At most {MAX_SUMMARY_CHARS // 2} characters.\n\n"
+        f"Previous summary:\n{previous or '(none)'}\n\n"
+        f"New turns:\n{conversation}"
+    )
+
+def _save(thread_id: int, summary: str, lang: str, last_qa_id: int) -> None:
+    ph = get_placeholder()
+    with get_db_cursor() as (cursor, conn):
+        # 並行した更新では新しいターンまで反映した方を残す（last_qa_id は最後に更新する）
+        cursor.execute(f"""
+            INSERT INTO thread_summary (thread_id, summary, lang, last_qa_id)
+            VALUES ({ph}, {ph}, {ph}, {ph})
+            ON DUPLICATE KEY UPDATE
+                summary = IF(VALUES(last_qa_id) > last_qa_id, VALUES(summary), summary),
+                lang = IF(VALUES(last_qa_id) > last_qa_id, VALUES(lang), lang),
+                last_qa_id = GREATEST(last_qa_id, VALUES(last_qa_id))
+        """, (thread_id, summary, lang, last_qa_id))
+        conn.commit()
+
+def refresh(thread_id: int, lang: str) -> Optional[str]:
+    """未反映のターンを要約に畳み込んで保存し、新しい要約を返す"""
+    try:
+        previous, turns = _pending(thread_id, lang)
+        if not turns:
+            return previous or None
+        summary = _clip(chat_text(
+            [{"role": "user", "content": _fold_prompt(previous, turns, lang)}],
+            model=SUMMARY_MODEL, timeout_s=20, temperature=0.2,
+        ), MAX_SUMMARY_CHARS)
+        _save(thread_id, summary, lang, turns[-1]['id'])
+        return summary
+    except Exception as e:
+        print(f"スレッド要約の更新エラー: {e}")
+        return None
+
+async def arefresh(thread_id: int, lang: str) -> Optional[str]:
+    """refresh の非同期版（DB はスレッドで、LLM は AsyncOpenAI で待つ）"""
+    try:
+        previous, turns = await asyncio.to_thread(_pending, thread_id, lang)
+        if not turns:
+            return previous or None
+        summary = _clip(await achat_text(
+            [{"role": "user", "content": _fold_prompt(previous, turns, lang)}],
+            model=SUMMARY_MODEL, timeout_s=20, temperature=0.2,
+        ), MAX_SUMMARY_CHARS)
+        await asyncio.to_thread(_save, thread_id, summary, lang, turns[-1]['id'])
+        return summary
+    except Exception as e:
+        print(f"スレッド要約の更新エラー: {e}")
+        return None
+
+def schedule_refresh(thread_id: int, lang: Optional[str]) -> None:
+    """回答を保存した後に呼ぶ。応答を待たせないよう裏で更新する"""
+    if not lang:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 同期コンテキスト（SSE のジェネレータなど）
+        _POOL.submit(refresh, thread_id, lang)
+        return
+    task = loop.create_task(arefresh(thread_id, lang))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
@@ -0,0 +1,883 @@
+"""
+ベクトルストア - 言語ごとの埋め込みとサイドカーを世代（generation）単位で保存する
+
+レイアウト（lang ごと）:
+    vectors_{lang}.manifest.json          現在の世代・件数・次元
+    vectors_{lang}.g{N}.vectors.npy       正規化済み埋め込み (count, dim)。float32 または float16（RAG_VECTOR_DTYPE）
+    vectors_{lang}.g{N}.ids.npy           int64 (count, 2) = (qa_id, question_id)、欠損は -1
+                                          統合ストア vectors_all のみ 3 列目に language.id を持つ
+    vectors_{lang}.g{N}.{col}.bin/.off.npy  文字列列（question / answer / time）:
+                                          UTF-8 を連結した本体と、行ごとの開始位置 (count + 1)
+
+    vectors_{lang}.g{N}.index.faiss       flat 以外: ANN / 量子化インデックス（HNSW / IVF / SQ）。行番号 = ベクトルの行
+
+    vectors_{lang}.g{M}.delta.*           差分セグメント（ベース g{N} 以降に追加した行。列の形式はベースと同じ）
+    vectors_{lang}.g{M}.tomb.npy          削除済みの行番号（int64, 昇順。ベース・差分の通し番号）
+
+サイドカーは列ごとに mmap で開き、検索でヒットした行だけをデコードする（pickle は使わない）。
+
+管理画面からの 1 件の編集・削除はベースを書き直さない。追加した行は差分セグメントに足し、置き換えた・消した行は
+tombstone に載せるだけなので、書き込み量は差分の大きさに比例する（コーパス全体には比例しない）。行番号はベース
+→ 差分の通し番号で、同じベースの間は変わらない。ベース（と ANN インデックス）を作り直すのはコンパクション・
+全体の再構築のときだけ。差分の行は厳密検索し、ベースの検索結果とまとめて tombstone を除く。
+
+検索時は .npy を mmap で開くだけなので、uvicorn の全ワーカーが OS のページキャッシュ上の
+同じ 1 コピーを共有する（ワーカー数に比例してメモリが増えない）。書き込みは新しい世代の
+ファイルを作ってから manifest を os.replace で差し替えるため、読み手は常に一貫した世代を見る。
+"""
+import os
+import json
+import time
+import pickle
+import fcntl
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple, Any
+
+import numpy as np
+import faiss
+
+VECTOR_DIR = Path("./api/utils/vectors")
+VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+
+# 9言語すべてを保持できるサイズを既定にする（mmap なので 1 エントリは実質ファイルハンドル程度）
+STORE_CACHE_SIZE = max(1, int(os.getenv("RAG_INDEX_CACHE_SIZE", "9")))
+
+# 全言語の行を 1 つにまとめた統合ストアの名前（RAG_UNIFIED_INDEX=1 のとき使う）
+UNIFIED_STORE = "all"
+
+# 保存する埋め込みの型。float16 にするとディスク・ページキャッシュ上のサイズが半分になる
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32").lower()
+if VECTOR_DTYPE not in ("float32", "float16"):
+    VECTOR_DTYPE = "float32"
+
+# 検索インデックスの種類: auto（件数で選ぶ）/ flat / hnsw / ivf_flat / ivf_pq / sq8 / sq_fp16
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto").lower()
+ANN_MIN_ROWS = int(os.getenv("RAG_ANN_MIN_ROWS", "20000"))        # これ未満は厳密検索（flat）
+IVF_MIN_ROWS = int(os.getenv("RAG_IVF_MIN_ROWS", "500000"))       # これ以上は HNSW ではなく IVF
+IVFPQ_MIN_ROWS = int(os.getenv("RAG_IVFPQ_MIN_ROWS", "2000000"))  # これ以上は PQ で圧縮
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+
+# ----------------------------------------------------------------------------
+# Paths
+# ----------------------------------------------------------------------------
+
+def manifest_path(lang_code: str) -> Path:
+    return VECTOR_DIR / f"vectors_{lang_code}.manifest.json"
+
+def _generation_path(lang_code: str, generation: int, suffix: str) -> Path:
+    return VECTOR_DIR / f"vectors_{lang_code}.g{generation}.{suffix}"
+
+def _legacy_paths(lang_code: str) -> Tuple[Path, Path, Path]:
+    """世代管理導入前の単一ファイル形式（.faiss / .meta.pkl / .texts.pkl）"""
+    base_path = VECTOR_DIR / f"vectors_{lang_code}"
+    return (
+        base_path.with_suffix(".faiss"),
+        base_path.with_suffix(".meta.pkl"),
+        base_path.with_suffix(".texts.pkl"),
+    )
+
+def _atomic_write(path: Path, write_fn) -> None:
+    """Write via a temp file + os.replace so readers in other workers never see a partial file."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+def _npy_writer(arr: np.ndarray):
+    def _write(p: Path) -> None:
+        # ファイルオブジェクトを渡して np.save が .npy を付け足さないようにする
+        with open(p, "wb") as f:
+            np.save(f, arr)
+    return _write
+
+# ----------------------------------------------------------------------------
+# Columnar sidecars
+# ----------------------------------------------------------------------------
+
+SIDECAR_FORMAT = "columnar-v1"
+_STRING_COLUMNS = ("question", "answer", "time")
+
+
+def _to_text(value) -> str:
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def _write_string_column(lang_code: str, generation: int, name: str, values: List[str]) -> None:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = b"".join(encoded)
+    _atomic_write(_generation_path(lang_code, generation, f"{name}.bin"), lambda p: p.write_bytes(blob))
+    _atomic_write(_generation_path(lang_code, generation, f"{name}.off.npy"), _npy_writer(offsets))
+
+def _write_segment(lang_code: str, generation: int, prefix: str, vectors: np.ndarray, meta: list, texts: list) -> None:
+    """ベクトル・ID・文字列列を 1 つのセグメントとして書く（prefix: ベースは ""、差分は "delta."）"""
+    _atomic_write(
+        _generation_path(lang_code, generation, f"{prefix}vectors.npy"),
+        _npy_writer(np.asarray(vectors, dtype="float32").astype(VECTOR_DTYPE, copy=False)),
+    )
+    _atomic_write(_generation_path(lang_code, generation, f"{prefix}ids.npy"), _npy_writer(_ids_from_meta(meta)))
+    for col_idx, name in enumerate(_STRING_COLUMNS):
+        _write_string_column(lang_code, generation, f"{prefix}{name}", [_to_text(row[col_idx]) for row in texts])
+
+
+class _StringColumn:
+    """オフセット + UTF-8 連結本体の文字列列。要求された行だけをデコードする"""
+
+    __slots__ = ("offsets", "blob")
+
+    def __init__(self, lang_code: str, generation: int, name: str):
+        self.offsets = np.load(_generation_path(lang_code, generation, f"{name}.off.npy"), mmap_mode="r")
+        blob_path = _generation_path(lang_code, generation, f"{name}.bin")
+        # 空ファイルは mmap できないため、空の配列で代用する
+        if blob_path.stat().st_size:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+class _Segment:
+    """ベースまたは差分の 1 セグメント。配列はすべて mmap"""
+
+    __slots__ = ("vectors", "ids", "columns")
+
+    def __init__(self, lang_code: str, generation: int, prefix: str = ""):
+        self.vectors = np.load(_generation_path(lang_code, generation, f"{prefix}vectors.npy"), mmap_mode="r")
+        self.ids = np.load(_generation_path(lang_code, generation, f"{prefix}ids.npy"), mmap_mode="r")
+        self.columns = {name: _StringColumn(lang_code, generation, f"{prefix}{name}") for name in _STRING_COLUMNS}
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def meta_row(self, j: int) -> tuple:
+        """書き戻し用の meta 行 (qa_id, question_id[, language_id])。欠損は None"""
+        return tuple(int(x) if x >= 0 else None for x in self.ids[j])
+
+    def text(self, j: int) -> Tuple[str, str, Optional[str]]:
+        time_val = self.columns["time"][j]
+        return self.columns["question"][j], self.columns["answer"][j], (time_val or None)
+
+
+def _ids_from_meta(meta: list) -> np.ndarray:
+    """meta 行 (qa_id, question_id[, language_id]) を int64 の列に詰める"""
+    width = 3 if any(row and len(row) > 2 for row in meta) else 2
+    ids = np.full((len(meta), width), -1, dtype="int64")
+    for i, row in enumerate(meta):
+        for j, value in enumerate((row or ())[:width]):
+            if value is not None:
+                ids[i, j] = int(value)
+    return ids
+
+# ----------------------------------------------------------------------------
+# ANN index factory
+# ----------------------------------------------------------------------------
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "sq_fp16")
+# 距離が近似になる種別。候補を多めに取り、保存済みベクトルとの厳密な内積で並べ直す
+RERANK_TYPES = {"ivf_pq", "sq8", "sq_fp16"}
+RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+
+
+# 学習が必要な種別の最小行数（IVF はリストあたり 39 点、PQ は 256 セントロイド × 39 点）
+TRAIN_MIN_ROWS = {"ivf_flat": 39, "ivf_pq": 256 * 39}
+# 行数が足りないときに落とす先
+_FALLBACK = {"ivf_pq": "ivf_flat", "ivf_flat": "hnsw"}
+
+
+def choose_index_type(count: int, requested: str = None) -> str:
+    """行数に合った種別を返す。RAG_INDEX_TYPE で明示されていても ANN_MIN_ROWS 未満は flat にし、
+    学習に足りない IVF/PQ は一段ずつ軽い種別に落とす（小さなストアで build_index が失敗しないように）"""
+    requested = (requested or INDEX_TYPE).lower()
+    if count < max(ANN_MIN_ROWS, 1) or requested == "flat":
+        return "flat"
+    if requested in INDEX_TYPES:
+        chosen = requested
+    elif count < IVF_MIN_ROWS:
+        chosen = "hnsw"
+    elif count < IVFPQ_MIN_ROWS:
+        chosen = "ivf_flat"
+    else:
+        chosen = "ivf_pq"
+    while count < TRAIN_MIN_ROWS.get(chosen, 0):
+        chosen = _FALLBACK[chosen]
+    if requested in INDEX_TYPES and chosen != requested:
+        print(f"インデックス種別 {requested} は {count} 行では学習できないため {chosen} を使います")
+    return chosen
+
+def _factory_string(index_type: str, count: int, dim: int) -> Optional[str]:
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M},Flat"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # 学習にはリストあたり 39 点以上が必要
+        nlist = max(1, min(int(4 * np.sqrt(count)), count // 39))
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        m = next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if dim % m == 0)
+        return f"IVF{nlist},PQ{m}x8"
+    return None
+
+def build_index(vectors: np.ndarray, index_type: str) -> Optional["faiss.Index"]:
+    """正規化済みベクトルから ANN インデックスを作る（flat の場合は None = mmap 上で厳密検索）"""
+    count, dim = vectors.shape
+    spec = _factory_string(index_type, count, dim)
+    if spec is None:
+        return None
+    index = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        sample = vectors
+        if count > 100_000:
+            sample = vectors[np.sort(np.random.default_rng(0).choice(count, 100_000, replace=False))]
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+    # 大きなストアでも一度に全体をメモリへ展開しないよう分割して追加する
+    for start in range(0, count, 65_536):
+        index.add(np.ascontiguousarray(vectors[start:start + 65_536], dtype="float32"))
+    return index
+
+def search_params(index_type: str, ef_search: int = None, nprobe: int = None):
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search or HNSW_EF_SEARCH))
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe or IVF_NPROBE))
+    return None
+
+def flat_search(vectors: np.ndarray, query: np.ndarray, k: int, chunk_rows: int = 65_536) -> Tuple[np.ndarray, np.ndarray]:
+    """全件の厳密 k-NN（内積）。float32 はそのまま FAISS に渡し、float16 は分割して float32 に戻しながら走査する"""
+    if vectors.dtype == np.float32:
+        return faiss.knn(query, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+    best_D = np.full((query.shape[0], 0), -np.inf, dtype="float32")
+    best_I = np.full((query.shape[0], 0), -1, dtype="int64")
+    for start in range(0, len(vectors), chunk_rows):
+        chunk = np.asarray(vectors[start:start + chunk_rows], dtype="float32")
+        D, I = faiss.knn(query, chunk, min(k, len(chunk)), metric=faiss.METRIC_INNER_PRODUCT)
+        D, I = np.hstack([best_D, D]), np.hstack([best_I, np.where(I >= 0, I + start, -1)])
+        top = np.argsort(-D, axis=1)[:, :k]
+        best_D, best_I = np.take_along_axis(D, top, axis=1), np.take_along_axis(I, top, axis=1)
+    return best_D, best_I
+
+def rerank(vectors: np.ndarray, query: np.ndarray, candidates: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """候補行を保存済みベクトルとの厳密な内積（float32 で計算）で並べ直す（vectors は mmap でもよい）"""
+    D = np.full((query.shape[0], k), -np.inf, dtype="float32")
+    I = np.full((query.shape[0], k), -1, dtype="int64")
+    for row, cand in enumerate(candidates):
+        cand = cand[cand >= 0]
+        if not len(cand):
+            continue
+        # 候補行だけを読む（行番号順に読むとページアクセスが連続になる）
+        order = np.argsort(cand)
+        scores = np.empty(len(cand), dtype="float32")
+        scores[order] = np.asarray(vectors[cand[order]], dtype="float32") @ query[row]
+        top = np.argsort(-scores)[:k]
+        D[row, :len(top)] = scores[top]
+        I[row, :len(top)] = cand[top]
+    return D, I
+
+# ----------------------------------------------------------------------------
+# Manifest / write lock
+# ----------------------------------------------------------------------------
+
+def read_manifest(lang_code: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(lang_code), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        return None
+
+@contextmanager
+def write_lock(lang_code: str):
+    """言語ごとの排他ロック（ワーカー間で read-modify-write が競合しないように）
+
+    flock はオープンしたファイル記述子単位なので、同一プロセス内のスレッド同士でも効く。
+    ネストして取得しないこと。
+    """
+    lock_path = VECTOR_DIR / f"vectors_{lang_code}.lock"
+    with open(lock_path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _cleanup_generations(lang_code: str, keep: set) -> None:
+    prefix = f"vectors_{lang_code}.g"
+    for path in VECTOR_DIR.glob(f"{prefix}*"):
+        gen_part = path.name[len(prefix):].split(".", 1)[0]
+        try:
+            generation = int(gen_part)
+        except ValueError:
+            continue
+        if generation not in keep:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+def write_store(lang_code: str, vectors: np.ndarray, meta: list, texts: list, index_type: str = None) -> int:
+    """新しい世代としてストアを書き出し、manifest を差し替える。write_lock を保持して呼ぶこと。
+
+    件数に応じて（または index_type / RAG_INDEX_TYPE の指定で）ANN インデックスも作り直す。HNSW / IVF の構築は
+    コーパス全体に比例する（IVF は学習も含む）ので、呼ぶのは全体の再構築とコンパクションだけにする。
+    1 件の編集・削除は append_delta_locked を使う。
+    直前の世代は、manifest を読んだ直後の読み手のために 1 世代だけ残す。
+    Returns the new generation number.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    dtype = VECTOR_DTYPE
+    if not (len(vectors) == len(meta) == len(texts)):
+        raise ValueError(f"vector/sidecar length mismatch: {len(vectors)}, {len(meta)}, {len(texts)}")
+
+    current = read_manifest(lang_code) or {}
+    generation = int(current.get("generation", 0)) + 1
+
+    _write_segment(lang_code, generation, "", vectors, meta, texts)
+
+    index_type = choose_index_type(len(vectors), index_type)
+    index = build_index(vectors, index_type) if index_type != "flat" else None
+    if index is not None:
+        _atomic_write(
+            _generation_path(lang_code, generation, "index.faiss"),
+            lambda p: faiss.write_index(index, str(p)),
+        )
+
+    manifest = {
+        "generation": generation,
+        "base": generation,
+        "count": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "dtype": dtype,
+        "sidecars": SIDECAR_FORMAT,
+        "index": index_type,
+        "delta_rows": 0,
+        "tombstones": 0,
+        "updated_at": time.time(),
+    }
+    _publish(lang_code, manifest, current)
+    return generation
+
+def _publish(lang_code: str, manifest: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    """manifest を差し替え、今の世代と直前の世代（読み手がまだ開いているかもしれない）以外のファイルを消す"""
+    _atomic_write(
+        manifest_path(lang_code),
+        lambda p: p.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8"),
+    )
+    keep = {int(manifest["generation"]), int(manifest["base"])}
+    if previous.get("generation") is not None:
+        keep |= {int(previous["generation"]), int(previous.get("base", previous["generation"]))}
+    _cleanup_generations(lang_code, keep=keep)
+    invalidate(lang_code)
+
+def append_delta_locked(lang_code: str, snapshot: "VectorSnapshot", vectors: np.ndarray, meta: list, texts: list, dead_rows) -> int:
+    """差分セグメントに行を足し、dead_rows を tombstone に載せた新しい世代を書く。write_lock を保持して呼ぶこと。
+
+    snapshot はロックを取った後に開いた現在の世代。ベースは書き直さないので、書き込み量は
+    差分セグメント + tombstone の大きさ（前回のコンパクション以降の編集量）に比例する。
+    Returns the new generation number.
+    """
+    if not (len(vectors) == len(meta) == len(texts)):
+        raise ValueError(f"vector/sidecar length mismatch: {len(vectors)}, {len(meta)}, {len(texts)}")
+    current = read_manifest(lang_code) or {}
+    generation = int(current.get("generation", snapshot.generation)) + 1
+
+    delta_vectors, delta_meta, delta_texts = np.zeros((0, snapshot.dim), dtype="float32"), [], []
+    if snapshot.delta is not None:
+        # 行番号を変えないよう、tombstone 済みの行も含めて差分をそのまま引き継ぐ
+        delta = snapshot.delta
+        delta_vectors = np.asarray(delta.vectors, dtype="float32")
+        delta_meta = [delta.meta_row(j) for j in range(len(delta))]
+        delta_texts = [delta.text(j) for j in range(len(delta))]
+    if len(vectors):
+        delta_vectors = np.vstack([delta_vectors, np.asarray(vectors, dtype="float32").reshape(-1, snapshot.dim)])
+        delta_meta += list(meta)
+        delta_texts += list(texts)
+    tombstones = np.union1d(snapshot.tombstones, np.asarray(list(dead_rows), dtype="int64")).astype("int64")
+
+    if len(delta_meta):
+        _write_segment(lang_code, generation, "delta.", delta_vectors, delta_meta, delta_texts)
+    if len(tombstones):
+        _atomic_write(_generation_path(lang_code, generation, "tomb.npy"), _npy_writer(tombstones))
+
+    manifest = {
+        **current,
+        "generation": generation,
+        "base": snapshot.base_generation,
+        "count": snapshot.ntotal_base + len(delta_meta) - len(tombstones),
+        "delta_rows": len(delta_meta),
+        "tombstones": int(len(tombstones)),
+        "updated_at": time.time(),
+    }
+    _publish(lang_code, manifest, current)
+    return generation
+
+# ----------------------------------------------------------------------------
+# Snapshots (read side)
+# ----------------------------------------------------------------------------
+
+class VectorSnapshot:
+    """ある世代のストアを読み取り専用で開いたもの（ベース + 差分 + tombstone）。配列はすべて mmap（変更しないこと）
+
+    行番号はベースの行 → 差分の行の通し番号。tombstone に載った行は検索結果に出ないが、番号は欠番として残る。
+    """
+
+    __slots__ = (
+        "lang_code", "generation", "base_generation", "signature", "index_type", "index",
+        "base", "delta", "tombstones",
+    )
+
+    def __init__(self, lang_code: str, manifest: Dict[str, Any], signature: tuple, index: "faiss.Index" = None, load_index: bool = True):
+        self.lang_code = lang_code
+        self.generation = int(manifest["generation"])
+        self.base_generation = int(manifest.get("base", self.generation))
+        self.signature = signature
+        self.base = _Segment(lang_code, self.base_generation)
+        self.delta = _Segment(lang_code, self.generation, "delta.") if manifest.get("delta_rows") else None
+        if manifest.get("tombstones"):
+            self.tombstones = np.load(_generation_path(lang_code, self.generation, "tomb.npy"))
+        else:
+            self.tombstones = np.zeros(0, dtype="int64")
+        self.index_type = manifest.get("index", "flat")
+        # ANN インデックスはグラフ/転置リストを持つためメモリに読み込む（flat は mmap のまま）。対象はベースの行だけなので、
+        # 同じベースの前の世代が読み込んだもの（index）があればそれを使う（編集のたびに全ワーカーが読み直さない）。
+        # load_index=False（書き込み用）ではベースも厳密検索になる
+        self.index = index
+        if self.index is None and load_index and self.index_type != "flat":
+            self.index = faiss.read_index(str(_generation_path(lang_code, self.base_generation, "index.faiss")))
+
+    def _locate(self, i: int) -> Tuple[_Segment, int]:
+        base_n = len(self.base)
+        return (self.base, i) if i < base_n else (self.delta, i - base_n)
+
+    def get_meta(self, i: int) -> Tuple[Optional[int], Optional[int]]:
+        """(qa_id, question_id)。欠損は None"""
+        segment, j = self._locate(i)
+        qa_id, question_id = (int(x) for x in segment.ids[j, :2])
+        return (qa_id if qa_id >= 0 else None, question_id if question_id >= 0 else None)
+
+    @property
+    def unified(self) -> bool:
+        """行ごとに language.id を持つ統合ストアか"""
+        return self.base.ids.ndim == 2 and self.base.ids.shape[1] > 2
+
+    def get_lang_id(self, i: int) -> Optional[int]:
+        """行の language.id（統合ストアのみ。言語別ストアは None）"""
+        if not self.unified:
+            return None
+        segment, j = self._locate(i)
+        lang_id = int(segment.ids[j, 2])
+        return lang_id if lang_id >= 0 else None
+
+    def get_meta_row(self, i: int) -> tuple:
+        """書き戻し用の meta 行。統合ストアでは language.id を含む"""
+        segment, j = self._locate(i)
+        return segment.meta_row(j)
+
+    def get_text(self, i: int) -> Tuple[str, str, Optional[str]]:
+        """(question, answer, time)。time は ISO 8601 文字列（欠損は None）"""
+        segment, j = self._locate(i)
+        return segment.text(j)
+
+    def get_vector(self, i: int) -> np.ndarray:
+        segment, j = self._locate(i)
+        return np.asarray(segment.vectors[j], dtype="float32")
+
+    @property
+    def ntotal_base(self) -> int:
+        return len(self.base)
+
+    @property
+    def ntotal(self) -> int:
+        """行番号の範囲（tombstone 済みの欠番を含む）"""
+        return len(self.base) + (len(self.delta) if self.delta is not None else 0)
+
+    @property
+    def live_count(self) -> int:
+        return self.ntotal - len(self.tombstones)
+
+    @property
+    def dim(self) -> int:
+        return int(self.base.vectors.shape[1])
+
+    def live_rows(self) -> np.ndarray:
+        """tombstone 済みでない行番号（昇順）"""
+        rows = np.arange(self.ntotal, dtype="int64")
+        return np.setdiff1d(rows, self.tombstones, assume_unique=True) if len(self.tombstones) else rows
+
+    def live_vectors(self, rows: np.ndarray = None) -> np.ndarray:
+        """生きている行（または rows）のベクトルを float32 のメモリ上のコピーで返す"""
+        rows = self.live_rows() if rows is None else rows
+        base_n = len(self.base)
+        parts = [np.asarray(self.base.vectors[rows[rows < base_n]], dtype="float32")]
+        if self.delta is not None:
+            parts.append(np.asarray(self.delta.vectors[rows[rows >= base_n] - base_n], dtype="float32"))
+        return np.vstack(parts).reshape(len(rows), self.dim)
+
+    def rows_of(self, qa_ids: set, lang_id: Optional[int] = None) -> np.ndarray:
+        """qa_ids（lang_id 指定時はその言語）に該当する生きている行番号"""
+        qa_list = np.asarray(sorted(int(q) for q in qa_ids), dtype="int64")
+        found = []
+        offset = 0
+        for segment in (self.base, self.delta):
+            if segment is None:
+                continue
+            ids = np.asarray(segment.ids)
+            mask = np.isin(ids[:, 0], qa_list)
+            if lang_id is not None and ids.shape[1] > 2:
+                mask &= ids[:, 2] == int(lang_id)
+            found.append(np.nonzero(mask)[0].astype("int64") + offset)
+            offset += len(segment)
+        rows = np.concatenate(found) if found else np.zeros(0, dtype="int64")
+        return np.setdiff1d(rows, self.tombstones, assume_unique=True) if len(self.tombstones) else rows
+
+    def _search_base(self, query: np.ndarray, k: int, ef_search: int = None, nprobe: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        if self.index is None:
+            return flat_search(self.base.vectors, query, k)
+        params = search_params(self.index_type, ef_search, nprobe)
+        if self.index_type not in RERANK_TYPES:
+            return self.index.search(query, k, params=params)
+        _, candidates = self.index.search(query, min(k * RERANK_FACTOR, len(self.base)), params=params)
+        return rerank(self.base.vectors, query, candidates, k)
+
+    def search(self, query: np.ndarray, k: int, ef_search: int = None, nprobe: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """内積による k-NN。
+
+        flat は mmap 上の配列をそのまま走査する厳密検索。ANN の場合は ef_search（HNSW）/
+        nprobe（IVF）で精度と速度を調整できる（既定は環境変数）。PQ / SQ は距離が近似なので、
+        候補を RERANK_FACTOR 倍取り mmap 上の保存済みベクトルで厳密スコアに並べ直す。
+        差分セグメントは厳密検索し、tombstone の行を除いてからベースの結果とまとめる
+        （除く分だけ各セグメントから多めに取る）。
+        """
+        query = np.ascontiguousarray(query, dtype="float32").reshape(-1, self.dim)
+        if self.live_count <= 0:
+            return (
+                np.full((query.shape[0], k), -np.inf, dtype="float32"),
+                np.full((query.shape[0], k), -1, dtype="int64"),
+            )
+        k = min(k, self.live_count)
+        base_n = len(self.base)
+        base_dead = int(np.searchsorted(self.tombstones, base_n))
+        if self.delta is None and not base_dead:
+            return self._search_base(query, k, ef_search, nprobe)
+
+        parts = []
+        if base_n:
+            parts.append(self._search_base(query, min(k + base_dead, base_n), ef_search, nprobe))
+        if self.delta is not None:
+            delta_dead = len(self.tombstones) - base_dead
+            D, I = flat_search(self.delta.vectors, query, min(k + delta_dead, len(self.delta)))
+            parts.append((D, np.where(I >= 0, I + base_n, -1)))
+        D = np.hstack([p[0] for p in parts]).astype("float32", copy=False)
+        I = np.hstack([p[1] for p in parts]).astype("int64", copy=False)
+        if len(self.tombstones):
+            dead = np.isin(I, self.tombstones)
+            D, I = np.where(dead, -np.inf, D).astype("float32"), np.where(dead, -1, I)
+        top = np.argsort(-D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, top, axis=1), np.take_along_axis(I, top, axis=1)
+
+
+_CACHE: "OrderedDict[str, VectorSnapshot]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+# 言語ごとに最後に読み込んだ ANN インデックス (ベースの世代, index)。invalidate() しても残す
+_ANN_CACHE: Dict[str, Tuple[int, "faiss.Index"]] = {}
+_CACHE_STATS = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0, "migrations": 0, "index_reuses": 0}
+
+
+def _manifest_signature(lang_code: str) -> Optional[tuple]:
+    try:
+        st = manifest_path(lang_code).stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _load_legacy_pickle(path: Path) -> list:
+    # 旧形式（自前で書き出したファイル）からの一度きりの変換でのみ使う
+    with open(path, "rb") as f:
+        return pickle.load(f) or []
+
+def _migrate_legacy_locked(lang_code: str) -> bool:
+    """旧形式があれば現行形式へ一度だけ変換する。write_lock を保持して呼ぶこと。
+
+    対象は (1) 単一ファイルの .faiss/.meta.pkl/.texts.pkl と (2) pickle サイドカーの世代。
+    Returns True if a store in the current format exists afterwards.
+    """
+    manifest = read_manifest(lang_code)
+    if manifest is not None and manifest.get("sidecars") == SIDECAR_FORMAT:
+        return True
+
+    if manifest is not None:
+        generation = int(manifest["generation"])
+        vectors = np.load(_generation_path(lang_code, generation, "vectors.npy"))
+        meta_path = _generation_path(lang_code, generation, "meta.pkl")
+        texts_path = _generation_path(lang_code, generation, "texts.pkl")
+    else:
+        faiss_path, meta_path, texts_path = _legacy_paths(lang_code)
+        if not faiss_path.exists():
+            return False
+        index = faiss.read_index(str(faiss_path))
+        if index.ntotal:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        else:
+            vectors = np.zeros((0, index.d), dtype="float32")
+    meta = _load_legacy_pickle(meta_path) if meta_path.exists() else []
+    texts = _load_legacy_pickle(texts_path) if texts_path.exists() else []
+    write_store(lang_code, vectors, meta, texts)
+    _CACHE_STATS["migrations"] += 1
+    print(f"旧形式のベクトルを変換しました: vectors_{lang_code}（{len(texts)} 件）")
+    return True
+
+def invalidate(lang_code: str) -> None:
+    with _CACHE_LOCK:
+        _CACHE.pop(lang_code, None)
+
+def get_snapshot(lang_code: str) -> Optional[VectorSnapshot]:
+    """Return the current read-only snapshot for a language (None if no store exists).
+
+    Each call costs one stat() of the manifest; files are re-opened only when the
+    generation changed (e.g. another worker appended a QA).
+    """
+    for _attempt in range(3):
+        signature = _manifest_signature(lang_code)
+        manifest = read_manifest(lang_code) if signature is not None else None
+        if manifest is None or manifest.get("sidecars") != SIDECAR_FORMAT:
+            with write_lock(lang_code):
+                migrated = _migrate_legacy_locked(lang_code)
+            if not migrated:
+                invalidate(lang_code)
+                return None
+            continue
+
+        with _CACHE_LOCK:
+            entry = _CACHE.get(lang_code)
+            if entry is not None and entry.signature == signature:
+                _CACHE.move_to_end(lang_code)
+                _CACHE_STATS["hits"] += 1
+                return entry
+
+            # 差分だけが進んだ世代ではベースの ANN インデックスを引き継ぐ
+            base_generation = int(manifest.get("base", manifest["generation"]))
+            reuse = _ANN_CACHE.get(lang_code)
+            reuse = reuse[1] if reuse is not None and reuse[0] == base_generation else None
+            _CACHE_STATS["index_reuses"] += reuse is not None
+            try:
+                snapshot = VectorSnapshot(lang_code, manifest, signature, index=reuse)
+            except FileNotFoundError:
+                # manifest を読んだ直後に世代が入れ替わった。読み直す
+                continue
+            _CACHE_STATS["reloads" if entry is not None else "loads"] += 1
+
+            if snapshot.index is not None:
+                _ANN_CACHE[lang_code] = (snapshot.base_generation, snapshot.index)
+            else:
+                _ANN_CACHE.pop(lang_code, None)
+            _CACHE[lang_code] = snapshot
+            _CACHE.move_to_end(lang_code)
+            while len(_CACHE) > STORE_CACHE_SIZE:
+                evicted, _ = _CACHE.popitem(last=False)
+                _ANN_CACHE.pop(evicted, None)
+                _CACHE_STATS["evictions"] += 1
+            return snapshot
+    raise RuntimeError(f"ベクトルストアを開けませんでした: vectors_{lang_code}")
+
+def open_locked(lang_code: str) -> Optional[VectorSnapshot]:
+    """現在の世代を（キャッシュを通さずに）開く。write_lock を保持して呼ぶこと。ストアが無ければ None"""
+    if not _migrate_legacy_locked(lang_code):
+        return None
+    return VectorSnapshot(lang_code, read_manifest(lang_code), signature=(), load_index=False)
+
+def load_for_update(lang_code: str) -> Tuple[Optional[np.ndarray], list, list]:
+    """現在の世代の生きている行を書き換え用に読み込む（vectors はメモリ上のコピー）。write_lock を保持して呼ぶこと。
+
+    ベースと差分を通し番号順に連結し、tombstone 済みの行は含めない。
+    ストアが存在しない場合は (None, [], []) を返す。
+    """
+    snapshot = open_locked(lang_code)
+    if snapshot is None:
+        return None, [], []
+    rows = snapshot.live_rows()
+    meta = [snapshot.get_meta_row(int(i)) for i in rows]
+    texts = [snapshot.get_text(int(i)) for i in rows]
+    return snapshot.live_vectors(rows), meta, texts
+
+# ----------------------------------------------------------------------------
+# Change log（どの世代でどの QA.id が変わったか。派生インデックスの差分更新用）
+# ----------------------------------------------------------------------------
+
+def _changes_path(lang_code: str) -> Path:
+    return VECTOR_DIR / f"vectors_{lang_code}.changes.log"
+
+def _log_changes(lang_code: str, generation: int, qa_ids) -> None:
+    lines = "".join(f"{generation}\t{int(q)}\n" for q in qa_ids if q is not None)
+    with open(_changes_path(lang_code), "a", encoding="utf-8") as f:
+        f.write(lines or f"{generation}\t-\n")
+
+def changes_between(lang_code: str, from_generation: int, to_generation: int) -> Optional[set]:
+    """from_generation より後 to_generation までに変わった QA.id の集合。
+
+    途中に全体の書き直し（再構築・コンパクションなど）が挟まっていて差分では追えない場合は None。
+    """
+    touched, seen = set(), set()
+    try:
+        with open(_changes_path(lang_code), "r", encoding="utf-8") as f:
+            for line in f:
+                gen_part, _, qa_part = line.strip().partition("\t")
+                try:
+                    generation = int(gen_part)
+                except ValueError:
+                    continue
+                if from_generation < generation <= to_generation:
+                    seen.add(generation)
+                    if qa_part and qa_part != "-":
+                        touched.add(int(qa_part))
+    except FileNotFoundError:
+        return None
+    if seen != set(range(from_generation + 1, to_generation + 1)):
+        return None
+    return touched
+
+# ----------------------------------------------------------------------------
+# ID-keyed updates (QA.id を行のキーとして扱う。IndexIDMap2 の remove_ids / add_with_ids 相当を
+# 差分セグメント + tombstone で行い、compact_locked でベースに統合する)
+# ----------------------------------------------------------------------------
+
+def _row_lang_id(row) -> Optional[int]:
+    return row[2] if row and len(row) > 2 else None
+
+def upsert_locked(
+    lang_code: str, qa_id: Optional[int], vectors: np.ndarray, meta: list, texts: list, lang_id: Optional[int] = None,
+) -> bool:
+    """qa_id の既存行をすべて（lang_id 指定時はその言語の行だけ）tombstone に載せ、新しい行を差分に追加する。
+    write_lock を保持して呼ぶこと。
+
+    Returns False if the existing store has an incompatible dimension (likely model changed).
+    """
+    snapshot = open_locked(lang_code)
+    if snapshot is not None and snapshot.live_count and snapshot.dim != vectors.shape[1]:
+        return False
+    if snapshot is None or not snapshot.live_count:
+        generation = write_store(lang_code, vectors, meta, texts)
+        _log_changes(lang_code, generation, [qa_id])
+        return True
+
+    dead = snapshot.rows_of({int(qa_id)}, lang_id) if qa_id is not None else []
+    generation = append_delta_locked(lang_code, snapshot, vectors, meta, texts, dead)
+    _log_changes(lang_code, generation, [qa_id])
+    return True
+
+def remove_locked(lang_code: str, qa_ids) -> int:
+    """qa_ids に該当する行を tombstone に載せる（ファイルからの物理削除は compact_locked で行う）。
+    write_lock を保持して呼ぶこと。
+
+    Returns the number of rows removed (0 の場合は新しい世代を作らない).
+    """
+    qa_ids = {int(q) for q in qa_ids if q is not None}
+    if not qa_ids:
+        return 0
+    snapshot = open_locked(lang_code)
+    if snapshot is None:
+        return 0
+    dead = snapshot.rows_of(qa_ids)
+    if len(dead):
+        generation = append_delta_locked(
+            lang_code, snapshot, np.zeros((0, snapshot.dim), dtype="float32"), [], [], dead,
+        )
+        _log_changes(lang_code, generation, qa_ids)
+    return int(len(dead))
+
+def compact_locked(lang_code: str, live_qa_ids: set) -> Dict[str, Any]:
+    """生きている QA.id の行だけを残して新しい世代に詰め直す（埋め込みは再計算しない）。
+    差分セグメントをベースに統合して tombstone 済みの行を物理削除し、ANN インデックスも作り直す。
+    同じ qa_id（統合ストアでは qa_id × 言語）の重複行は最後に追加されたものだけを残す。
+    write_lock を保持して呼ぶこと。
+    """
+    manifest = read_manifest(lang_code) or {}
+    pending = bool(manifest.get("delta_rows") or manifest.get("tombstones"))
+    vectors, meta, texts = load_for_update(lang_code)
+    before = {"rows": len(meta), "bytes": disk_usage(lang_code)}
+    if vectors is None:
+        return {"before": before, "after": before, "removed": 0}
+
+    last_row: Dict[tuple, int] = {}
+    for i, row in enumerate(meta):
+        if row and row[0] is not None and int(row[0]) in live_qa_ids:
+            last_row[(int(row[0]), _row_lang_id(row))] = i
+    keep_idx = sorted(last_row.values())
+    if len(keep_idx) != len(meta) or pending:
+        write_store(
+            lang_code,
+            vectors[np.asarray(keep_idx, dtype="int64")].reshape(len(keep_idx), vectors.shape[1]),
+            [meta[i] for i in keep_idx],
+            [texts[i] for i in keep_idx],
+        )
+    # 直前の世代と書き込み途中で残った一時ファイルも回収する
+    manifest = read_manifest(lang_code) or {}
+    _cleanup_generations(lang_code, keep={int(manifest.get("generation", 0))})
+    _changes_path(lang_code).unlink(missing_ok=True)  # 以降の読み手は全体を読み直す
+    for legacy_path in _legacy_paths(lang_code):  # 変換済みの旧形式ファイル
+        if legacy_path.exists():
+            legacy_path.unlink()
+    for tmp_path in VECTOR_DIR.glob(f".vectors_{lang_code}.*.tmp"):
+        try:
+            if time.time() - tmp_path.stat().st_mtime > 3600:
+                tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+    after = {"rows": len(keep_idx), "bytes": disk_usage(lang_code)}
+    return {"before": before, "after": after, "removed": len(meta) - len(keep_idx)}
+
+def disk_usage(lang_code: str) -> int:
+    """言語ストアが使っているバイト数（全世代・旧形式ファイルを含む）"""
+    total = 0
+    for path in VECTOR_DIR.glob(f"vectors_{lang_code}.*"):
+        try:
+            total += path.stat().st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+def stored_languages() -> List[str]:
+    """ストア（現行形式または旧形式）が存在する言語コードの一覧"""
+    langs = set()
+    for pattern, suffix in (("vectors_*.manifest.json", ".manifest.json"), ("vectors_*.faiss", ".faiss")):
+        for path in VECTOR_DIR.glob(pattern):
+            langs.add(path.name[len("vectors_"):-len(suffix)])
+    return sorted(langs)
+
+def cache_stats() -> Dict[str, Any]:
+    with _CACHE_LOCK:
+        return {
+            **_CACHE_STATS,
+            "cached_languages": {lang: snap.generation for lang, snap in _CACHE.items()},
+            # 差分・tombstone が大きくなったらコンパクション（/admin/compact_vectors）でベースに統合する
+            "stores": {
+                lang: {
+                    "base": snap.base_generation,
+                    "index": snap.index_type,
+                    "delta_rows": snap.ntotal - snap.ntotal_base,
+                    "tombstones": int(len(snap.tombstones)),
+                }
+                for lang, snap in _CACHE.items()
+            },
+            "capacity": STORE_CACHE_SIZE,
+        }
@@ -0,0 +1,128 @@
+"""
+チャット負荷試験 - 1 ワーカーの uvicorn に同時リクエストを送り、並行して捌けている数を測る
+
+同時実行数 C で合計 N 件の質問を /question/get_answer（または /chat/respond）に投げ、
+スループット・レイテンシ（p50 / p95 / p99）と「実効並行数」= Σレイテンシ / 経過時間 を表示する。
+イベントループが API 待ちで塞がれていると実効並行数はほぼ 1 に張り付き、非同期化後は C に近づく。
+
+比較の手順（app/ ディレクトリで、同じ DB・ベクトルストアを使う）:
+
+    uvicorn main:app --workers 1 --port 8000           # 変更前のコミットと変更後のコミットでそれぞれ起動
+    python -m bench.chat_load --user bench --password ... --concurrency 1,4,16,32 --requests 64
+
+回答キャッシュに当たると生成を測れないので、既定では質問文に連番を付けて毎回ずらす（--same-question で無効化）。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List, Any
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "在留カードの更新はどこでできますか？",
+    "日本語教室はありますか？",
+    "病院で通訳をお願いできますか？",
+    "How can I find an apartment in Shiga?",
+]
+
+
+async def _login(client: httpx.AsyncClient, base_url: str, user: str, password: str) -> str:
+    resp = await client.post(f"{base_url}/user/token", data={"username": user, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return round(ordered[index], 3)
+
+async def _run_level(client: httpx.AsyncClient, args, token: str, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        question = args.questions[i % len(args.questions)]
+        if not args.same_question:
+            question = f"{question} ({i})"
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                resp = await client.post(
+                    f"{args.base_url}{args.endpoint}",
+                    json={"text": question},
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=args.timeout,
+                )
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                if args.verbose:
+                    print(f"  #{i} 失敗: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    wall = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "req_per_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "p50_s": _percentile(latencies, 50),
+        "p95_s": _percentile(latencies, 95),
+        "p99_s": _percentile(latencies, 99),
+        "mean_s": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        # 同時に処理中だったリクエスト数の平均
+        "effective_concurrency": round(sum(latencies) / wall, 2) if wall else 0.0,
+    }
+
+async def _main(args) -> None:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(limits=limits) as client:
+        token = await _login(client, args.base_url, args.user, args.password)
+        rows = []
+        for concurrency in args.concurrency:
+            print(f"同時実行 {concurrency} で {args.requests} 件送信中...")
+            rows.append(await _run_level(client, args, token, concurrency))
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'conc':>6}{'ok':>6}{'err':>6}{'req/s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'eff.conc':>10}")
+    for r in rows:
+        print(f"{r['concurrency']:>6}{r['ok']:>6}{r['errors']:>6}{r['req_per_s']:>9}{r['p50_s']:>9}{r['p95_s']:>9}{r['p99_s']:>9}{r['effective_concurrency']:>10}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/question/get_answer", help="/question/get_answer または /chat/respond")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", default="1,4,16", help="同時実行数の候補（カンマ区切り）")
+    parser.add_argument("--requests", type=int, default=32, help="同時実行数ごとの総リクエスト数")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--questions-file", help="1 行 1 質問のファイル（省略時は組み込みの質問）")
+    parser.add_argument("--same-question", action="store_true", help="連番を付けず同じ質問を送る（キャッシュ込みで測る）")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    if args.questions_file:
+        with open(args.questions_file, "r", encoding="utf-8") as f:
+            args.questions = [line.strip() for line in f if line.strip()]
+    else:
+        args.questions = DEFAULT_QUESTIONS
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+DB 読み取り負荷試験 - 1 ワーカーの uvicorn に読み取り系エンドポイントを同時に投げ、ワーカーあたりの req/s を測る
+
+一覧・スレッド・カテゴリ・通知の GET を順番に混ぜて同時実行数 C で合計 N 件送り、
+スループット・レイテンシ（p50 / p95 / p99）・実効並行数を表示する（指標の意味は bench.chat_load と同じ）。
+
+ローカルの MySQL コンテナで比較する手順（app/ ディレクトリで）:
+
+    docker run -d --name shigachat-bench-mysql -p 3306:3306 \\
+        -e MYSQL_ROOT_PASSWORD=root -e MYSQL_DATABASE=ShigaChat \\
+        -e MYSQL_USER=shigachat -e MYSQL_PASSWORD=shigachatpass \\
+        mysql:8.0 --character-set-server=utf8mb4 --collation-server=utf8mb4_unicode_ci
+    docker exec -i shigachat-bench-mysql mysql -ushigachat -pshigachatpass ShigaChat \\
+        < ../mysql/migrate/shigachat_full_20251021_121947.sql
+
+    # aiomysql（既定）と、同期プールをスレッドで使う場合をそれぞれ起動して測る
+    MYSQL_HOST=127.0.0.1 MYSQL_ASYNC=1 uvicorn main:app --workers 1 --port 8000
+    MYSQL_HOST=127.0.0.1 MYSQL_ASYNC=0 uvicorn main:app --workers 1 --port 8000
+
+    python -m bench.db_load --user bench --password ... --concurrency 1,8,32,64 --requests 500
+
+サーバ側の接続プールの待ち時間は /admin/runtime_stats の db_pool で確認できる。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List, Any
+
+import httpx
+
+from bench.chat_load import _login, _percentile
+
+DEFAULT_PATHS = [
+    "/question/get_qa_list",
+    "/question/get_user_threads",
+    "/category/category/1",
+    "/notification/notifications",
+    "/notification/notifications/global",
+]
+
+
+async def _thread_path(client: httpx.AsyncClient, base_url: str, headers: Dict[str, str]) -> List[str]:
+    # ユーザーにスレッドがあれば get_thread_messages も混ぜる
+    resp = await client.get(f"{base_url}/question/get_user_threads", headers=headers)
+    if resp.status_code != 200:
+        return []
+    threads = resp.json().get("threads") or []
+    return [f"/question/get_thread_messages/{threads[0]['thread_id']}"] if threads else []
+
+async def _run_level(client: httpx.AsyncClient, args, headers: Dict[str, str], paths: List[str], concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        path = paths[i % len(paths)]
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                resp = await client.get(f"{args.base_url}{path}", headers=headers, timeout=args.timeout)
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                if args.verbose:
+                    print(f"  {path} 失敗: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    wall = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "req_per_s": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_s": _percentile(latencies, 50),
+        "p95_s": _percentile(latencies, 95),
+        "p99_s": _percentile(latencies, 99),
+        "mean_s": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "effective_concurrency": round(sum(latencies) / wall, 2) if wall else 0.0,
+    }
+
+async def _main(args) -> None:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(limits=limits) as client:
+        token = await _login(client, args.base_url, args.user, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+        paths = args.paths + await _thread_path(client, args.base_url, headers)
+        print(f"対象: {', '.join(paths)}")
+        # 接続プールとキャッシュを温めてから測る
+        await _run_level(client, args, headers, paths, min(args.concurrency))
+        rows = []
+        for concurrency in args.concurrency:
+            print(f"同時実行 {concurrency} で {args.requests} 件送信中...")
+            rows.append(await _run_level(client, args, headers, paths, concurrency))
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'conc':>6}{'ok':>6}{'err':>6}{'req/s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'eff.conc':>10}")
+    for r in rows:
+        print(f"{r['concurrency']:>6}{r['ok']:>6}{r['errors']:>6}{r['req_per_s']:>9}{r['p50_s']:>9}{r['p95_s']:>9}{r['p99_s']:>9}{r['effective_concurrency']:>10}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--paths", default=",".join(DEFAULT_PATHS), help="GET するパス（カンマ区切り、順番に混ぜる）")
+    parser.add_argument("--concurrency", default="1,8,32", help="同時実行数の候補（カンマ区切り）")
+    parser.add_argument("--requests", type=int, default=300, help="同時実行数ごとの総リクエスト数")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    args.paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
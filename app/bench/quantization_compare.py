@@ -0,0 +1,95 @@
+"""
+量子化比較ツール - float16 保存 / SQfp16 / SQ8 の検索結果を、現行の flat float32 と比べる
+
+各方式について、flat float32 の上位 k 件とのランキング一致度とサイズを表示する:
+    recall@k     上位 k 件の集合としての一致率
+    top1         1 位が一致したクエリの割合
+    same_order   上位 k 件が順序まで完全一致したクエリの割合
+    max_dscore   一致した行の類似度の最大誤差（類似度閾値への影響の目安）
+
+app/ ディレクトリで実行する:
+
+    python -m bench.quantization_compare --lang ja
+    python -m bench.quantization_compare --lang en --queries 500 --no-rerank
+"""
+import argparse
+import json
+from typing import Dict, Any
+
+import numpy as np
+import faiss
+
+from api.utils import vector_store
+from bench.vector_bench import _make_queries
+
+
+def _agreement(D: np.ndarray, I: np.ndarray, base_D: np.ndarray, base_I: np.ndarray, k: int) -> Dict[str, Any]:
+    recall_hits, top1, same_order, max_dscore = 0, 0, 0, 0.0
+    for row in range(len(base_I)):
+        base = base_I[row].tolist()
+        got = I[row].tolist()
+        recall_hits += len(set(base) & set(got))
+        top1 += int(got[0] == base[0])
+        same_order += int(got == base)
+        base_scores = dict(zip(base, base_D[row].tolist()))
+        for idx, score in zip(got, D[row].tolist()):
+            if idx in base_scores:
+                max_dscore = max(max_dscore, abs(score - base_scores[idx]))
+    n = len(base_I)
+    return {
+        "recall": round(recall_hits / (n * k), 4),
+        "top1": round(top1 / n, 4),
+        "same_order": round(same_order / n, 4),
+        "max_dscore": round(max_dscore, 5),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lang", default="ja", help="比較対象の言語ストア")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-rerank", action="store_true", help="SQ の並べ直しなしの結果も表示する")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args()
+
+    snapshot = vector_store.get_snapshot(args.lang)
+    if snapshot is None:
+        raise SystemExit(f"vectors_{args.lang} が存在しません")
+    base = snapshot.live_vectors()
+    queries = _make_queries(base, args.queries, args.seed)
+    k = min(args.k, len(base))
+    base_D, base_I = faiss.knn(queries, base, k, metric=faiss.METRIC_INNER_PRODUCT)
+    print(f"vectors_{args.lang}: {base.shape[0]} 件 × {base.shape[1]} 次元, クエリ {len(queries)} 件, k={k}")
+
+    rows = [{"variant": "flat float32 (現行)", "bytes": base.nbytes, **_agreement(base_D, base_I, base_D, base_I, k)}]
+
+    half = base.astype("float16")
+    D, I = vector_store.flat_search(half, queries, k)
+    rows.append({"variant": "flat float16", "bytes": half.nbytes, **_agreement(D, I, base_D, base_I, k)})
+
+    for index_type in ("sq_fp16", "sq8"):
+        index = vector_store.build_index(base, index_type)
+        size = len(faiss.serialize_index(index))
+        if args.no_rerank:
+            D, I = index.search(queries, k)
+            rows.append({"variant": f"{index_type}", "bytes": size, **_agreement(D, I, base_D, base_I, k)})
+        # 本番と同じ: 候補を多めに取り、float16 で保存したベクトルで並べ直す
+        _, cand = index.search(queries, k * vector_store.RERANK_FACTOR)
+        D, I = vector_store.rerank(half, queries, cand, k)
+        rows.append({
+            "variant": f"{index_type} + rerank(float16)",
+            "bytes": size + half.nbytes,
+            **_agreement(D, I, base_D, base_I, k),
+        })
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'variant':<28}{'MB':>9}{'recall@' + str(k):>11}{'top1':>8}{'same_order':>12}{'max_dscore':>12}")
+    for r in rows:
+        print(f"{r['variant']:<28}{r['bytes'] / 2**20:>9.1f}{r['recall']:>11}{r['top1']:>8}{r['same_order']:>12}{r['max_dscore']:>12}")
+
+
+if __name__ == "__main__":
+    main()
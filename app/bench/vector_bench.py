@@ -0,0 +1,119 @@
+"""
+ベクトル検索ベンチマーク - ANN インデックス（HNSW / IVF-Flat / IVF-PQ）を flat（厳密検索）と比較する
+
+recall@k（flat の上位 k 件との一致率）と 1 クエリあたりの検索レイテンシ（p50 / p99）を、
+efSearch / nprobe を振りながら表示する。app/ ディレクトリで実行する:
+
+    python -m bench.vector_bench --lang ja
+    python -m bench.vector_bench --synthetic 200000 --types hnsw,ivf_flat,ivf_pq --ef 32,64,128
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Any
+
+import numpy as np
+import faiss
+
+from api.utils import vector_store
+
+
+def _load_corpus(args) -> np.ndarray:
+    if args.synthetic:
+        # 実データに近づけるためクラスタ構造を持たせた乱数（一様乱数だと ANN が不当に難しくなる）
+        rng = np.random.default_rng(args.seed)
+        centers = rng.standard_normal((max(1, args.synthetic // 500), args.dim)).astype("float32")
+        assign = rng.integers(0, len(centers), args.synthetic)
+        vectors = centers[assign] + 0.5 * rng.standard_normal((args.synthetic, args.dim)).astype("float32")
+    else:
+        snapshot = vector_store.get_snapshot(args.lang)
+        if snapshot is None:
+            raise SystemExit(f"vectors_{args.lang} が存在しません")
+        vectors = snapshot.live_vectors()
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def _make_queries(corpus: np.ndarray, n: int, seed: int) -> np.ndarray:
+    # コーパスの行にノイズを加えたものをクエリにする（自分自身との完全一致だけを測らないように）
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.choice(len(corpus), min(n, len(corpus)), replace=False)
+    queries = corpus[rows] + 0.05 * rng.standard_normal((len(rows), corpus.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+def _percentile_ms(latencies: List[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000, 3)
+
+def _run(search_fn, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, Any]:
+    latencies, hits = [], 0
+    for i, q in enumerate(queries):
+        started = time.perf_counter()
+        _, I = search_fn(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(I[0][I[0] >= 0].tolist()) & set(truth[i].tolist()))
+    return {
+        "recall": round(hits / (len(queries) * k), 4),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p99_ms": _percentile_ms(latencies, 99),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lang", default="ja", help="ベンチ対象の言語ストア")
+    parser.add_argument("--synthetic", type=int, default=0, help="実データの代わりに N 件の合成ベクトルを使う")
+    parser.add_argument("--dim", type=int, default=1536, help="合成ベクトルの次元")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="hnsw,ivf_flat,ivf_pq")
+    parser.add_argument("--ef", default="16,32,64,128", help="HNSW efSearch の候補")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF nprobe の候補")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args)
+    queries = _make_queries(corpus, args.queries, args.seed)
+    k = min(args.k, len(corpus))
+    print(f"コーパス {corpus.shape[0]} 件 × {corpus.shape[1]} 次元, クエリ {len(queries)} 件, k={k}")
+
+    _, truth = faiss.knn(queries, corpus, k, metric=faiss.METRIC_INNER_PRODUCT)
+    rows = [{"type": "flat", "param": "-", "build_s": 0.0, "size_mb": round(corpus.nbytes / 2**20, 1),
+             **_run(lambda q, kk: faiss.knn(q, corpus, kk, metric=faiss.METRIC_INNER_PRODUCT), queries, truth, k)}]
+
+    for index_type in [t.strip() for t in args.types.split(",") if t.strip()]:
+        if index_type not in vector_store.INDEX_TYPES or index_type == "flat":
+            print(f"不明なインデックス種別をスキップ: {index_type}")
+            continue
+        started = time.time()
+        index = vector_store.build_index(corpus, index_type)
+        build_s = round(time.time() - started, 2)
+        size_mb = round(len(faiss.serialize_index(index)) / 2**20, 1)
+
+        param_name = "ef_search" if index_type == "hnsw" else "nprobe"
+        values = args.ef if index_type == "hnsw" else args.nprobe
+        if index_type in ("sq8", "sq_fp16"):
+            # 全件走査なので調整パラメータは無い
+            param_name, values = "-", "0"
+        for value in [int(v) for v in values.split(",") if v.strip()]:
+            params = vector_store.search_params(index_type, **({} if param_name == "-" else {param_name: value}))
+            if index_type in vector_store.RERANK_TYPES:
+                # 本番と同じく候補を多めに取り元ベクトルで並べ直す
+                def search_fn(q, kk):
+                    _, cand = index.search(q, kk * vector_store.RERANK_FACTOR, params=params)
+                    return vector_store.rerank(corpus, q, cand, kk)
+            else:
+                def search_fn(q, kk):
+                    return index.search(q, kk, params=params)
+            result = _run(search_fn, queries, truth, k)
+            rows.append({"type": index_type, "param": "-" if param_name == "-" else f"{param_name}={value}", "build_s": build_s, "size_mb": size_mb, **result})
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'type':<10}{'param':<16}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}{'size MB':>10}")
+    for r in rows:
+        print(f"{r['type']:<10}{r['param']:<16}{r['recall']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['build_s']:>10}{r['size_mb']:>10}")
+
+
+if __name__ == "__main__":
+    main()
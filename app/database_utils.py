@@ -4,8 +4,12 @@
 データベースユーティリティ - MySQL専用
 """
 import os
+import time
+import asyncio
+import threading
 import pymysql
-from contextlib import contextmanager
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
 from typing import Optional, Tuple, Any
 from dotenv import load_dotenv
 
@@ -18,37 +22,406 @@ MYSQL_CONFIG = {
     'password': os.getenv('MYSQL_PASSWORD', 'shigachatpass'),
     'database': os.getenv('MYSQL_DATABASE', 'ShigaChat'),
     'charset': 'utf8mb4',
+    # 文字コードは接続時に一度だけ設定する（プールした接続はそのまま使い回す）
+    'init_command': 'SET NAMES utf8mb4',
     'cursorclass': pymysql.cursors.DictCursor,
     'autocommit': False
 }
 
+# 接続プール（ワーカープロセスごと）。12 ワーカー × (POOL_SIZE + POOL_MAX_OVERFLOW) が
+# MySQL の max_connections（既定 151）を超えないようにすること
+POOL_ENABLED = os.getenv('MYSQL_POOL', '1').lower() in ('1', 'true', 'yes')
+POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', 5))              # 常に保持しておく接続数
+POOL_MAX_OVERFLOW = int(os.getenv('MYSQL_POOL_MAX_OVERFLOW', 5))  # 混雑時に一時的に追加で開ける接続数
+POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', 30))     # 空きを待つ最大秒数
+POOL_IDLE_TIMEOUT = float(os.getenv('MYSQL_POOL_IDLE_TIMEOUT', 300))  # これ以上使われていない接続は閉じる
+POOL_PING_AFTER = float(os.getenv('MYSQL_POOL_PING_AFTER', 30))  # これ以上空いていた接続は貸し出し前に ping する
+
+
+def _connect():
+    return pymysql.connect(**MYSQL_CONFIG)
+
+
+class ConnectionPool:
+    """
+    pymysql 接続のスレッドセーフなプール
+
+    空き接続は LIFO で貸し出す（直近に使った接続ほど生きている可能性が高く、古い接続は自然に idle 切れで閉じる）。
+    返却時は rollback してトランザクションを閉じる（未コミットの変更や REPEATABLE READ のスナップショットを持ち越さない）。
+    """
+
+    def __init__(self, size: int, max_overflow: int, timeout: float, idle_timeout: float, ping_after: float):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self._idle = deque()  # (conn, 返却時刻)
+        self._open = 0        # 貸し出し中 + 空き
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "connects": 0,
+            "waits": 0,
+            "wait_time_s": 0.0,
+            "max_wait_s": 0.0,
+            "timeouts": 0,
+            "pings": 0,
+            "ping_failures": 0,
+            "discarded": 0,
+            "idle_closed": 0,
+        }
+
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def checkout(self):
+        """接続を 1 本借りる。空きがなく上限に達していれば POOL_TIMEOUT 秒まで待つ"""
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    conn, returned_at = self._idle.pop()
+                    if now - returned_at > self.idle_timeout:
+                        self._open -= 1
+                        self._stats["idle_closed"] += 1
+                        self._close(conn)
+                        continue
+                    break
+                else:
+                    conn = None
+                if conn is not None or self._open < self.size + self.max_overflow:
+                    if conn is None:
+                        self._open += 1  # 接続は枠を確保してからロックの外で作る
+                    break
+                remaining = self.timeout - (now - started)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise pymysql.err.OperationalError(
+                        2013, f"DB接続プールが枯渇しました（{self.size + self.max_overflow} 本すべて使用中, {self.timeout}s 待機）"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+            if waited:
+                wait_s = time.monotonic() - started
+                self._stats["waits"] += 1
+                self._stats["wait_time_s"] += wait_s
+                self._stats["max_wait_s"] = max(self._stats["max_wait_s"], wait_s)
+
+        if conn is None:
+            try:
+                conn = _connect()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._stats["connects"] += 1
+            return conn
+
+        if time.monotonic() - returned_at > self.ping_after:
+            # しばらく使っていない接続は wait_timeout などで切られている可能性があるので確認する
+            try:
+                conn.ping(reconnect=True)
+                with self._cond:
+                    self._stats["pings"] += 1
+            except Exception:
+                self._close(conn)
+                with self._cond:
+                    self._stats["ping_failures"] += 1
+                try:
+                    conn = _connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+        return conn
+
+    def checkin(self, conn, discard: bool = False) -> None:
+        """接続を返す。壊れている（discard=True / rollback 失敗）か枠を超えた分は閉じる"""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            if discard or len(self._idle) >= self.size:
+                self._open -= 1
+                if discard:
+                    self._stats["discarded"] += 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                **self._stats,
+                "wait_time_s": round(self._stats["wait_time_s"], 3),
+                "max_wait_s": round(self._stats["max_wait_s"], 3),
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """プロセスごとのプール（fork 後の子プロセスは親の接続を引き継がずに作り直す）"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT, POOL_IDLE_TIMEOUT, POOL_PING_AFTER)
+                _pool_pid = pid
+    return _pool
+
+
+def pool_stats() -> dict:
+    """接続プールの統計（admin の runtime_stats 用）"""
+    if not POOL_ENABLED:
+        return {"enabled": False, "async": async_pool_stats()}
+    return {"enabled": True, "pid": os.getpid(), **get_pool().stats(), "async": async_pool_stats()}
+
 
 @contextmanager
 def get_db_cursor():
     """
-    MySQLデータベースカーソルを取得するコンテキストマネージャー
+    MySQLデータベースカーソルを取得するコンテキストマネージャー（接続はプールから借りて返す）
     
     使用例:
         with get_db_cursor() as (cur, conn):
             cur.execute("SELECT * FROM user WHERE id = %s", (user_id,))
             result = cur.fetchone()
             conn.commit()
+
+    commit しなかった変更はブロックを抜けるときに rollback される（従来の close と同じ）。
     """
-    # MySQL接続
-    conn = pymysql.connect(**MYSQL_CONFIG)
-    # 文字コードを明示的に設定
-    with conn.cursor() as setup_cur:
-        setup_cur.execute("SET NAMES utf8mb4")
-        setup_cur.execute("SET CHARACTER SET utf8mb4")
-        setup_cur.execute("SET character_set_connection=utf8mb4")
-    conn.commit()
-    
+    if not POOL_ENABLED:
+        conn = _connect()
+        cur = conn.cursor()
+        try:
+            yield cur, conn
+        finally:
+            cur.close()
+            conn.close()
+        return
+
+    pool = get_pool()
+    conn = pool.checkout()
     cur = conn.cursor()
+    broken = False
     try:
         yield cur, conn
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        # 接続断などは接続ごと捨てる
+        broken = True
+        raise
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            broken = True
+        pool.checkin(conn, discard=broken)
+
+
+# ---------------------------------------------------------------------------
+# 非同期（aiomysql）: async def のハンドラから await で使う
+# ---------------------------------------------------------------------------
+
+try:
+    import aiomysql
+except ImportError:  # aiomysql がない環境では同期プールをスレッドで使う
+    aiomysql = None
+
+# 0 にすると aiomysql を使わず、同期プールの接続をスレッドで操作する（ベンチマークの比較用）
+ASYNC_ENABLED = os.getenv('MYSQL_ASYNC', '1').lower() in ('1', 'true', 'yes') and aiomysql is not None
+ASYNC_POOL_SIZE = int(os.getenv('MYSQL_ASYNC_POOL_SIZE', 10))
+
+_apool = None
+_apool_loop = None
+_apool_lock: Optional[asyncio.Lock] = None
+_astats = {"checkouts": 0, "waits": 0, "wait_time_s": 0.0, "max_wait_s": 0.0}
+
+
+async def _get_async_pool():
+    """イベントループ（= ワーカープロセス）ごとの aiomysql プール"""
+    global _apool, _apool_loop, _apool_lock
+    loop = asyncio.get_running_loop()
+    if _apool is not None and _apool_loop is loop:
+        return _apool
+    if _apool_lock is None or _apool_loop is not loop:
+        _apool_lock = asyncio.Lock()
+        _apool_loop = loop
+        _apool = None
+    async with _apool_lock:
+        if _apool is None:
+            _apool = await aiomysql.create_pool(
+                host=MYSQL_CONFIG['host'],
+                port=MYSQL_CONFIG['port'],
+                user=MYSQL_CONFIG['user'],
+                password=MYSQL_CONFIG['password'],
+                db=MYSQL_CONFIG['database'],
+                charset=MYSQL_CONFIG['charset'],
+                init_command=MYSQL_CONFIG['init_command'],
+                cursorclass=aiomysql.DictCursor,
+                autocommit=False,
+                minsize=1,
+                maxsize=ASYNC_POOL_SIZE,
+                pool_recycle=int(POOL_IDLE_TIMEOUT),
+            )
+    return _apool
+
+
+_threaded_sem: Optional[asyncio.Semaphore] = None
+_threaded_sem_loop = None
+
+
+def _threaded_slots() -> asyncio.Semaphore:
+    global _threaded_sem, _threaded_sem_loop
+    loop = asyncio.get_running_loop()
+    if _threaded_sem is None or _threaded_sem_loop is not loop:
+        _threaded_sem = asyncio.Semaphore(POOL_SIZE + POOL_MAX_OVERFLOW)
+        _threaded_sem_loop = loop
+    return _threaded_sem
+
+
+class _ThreadedCursor:
+    """同期カーソルを aiomysql のカーソルと同じ await 形式で使うためのラッパー"""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    async def execute(self, query: str, params: Tuple = ()):
+        return await asyncio.to_thread(self._cur.execute, query, params)
+
+    async def fetchone(self):
+        return await asyncio.to_thread(self._cur.fetchone)
+
+    async def fetchall(self):
+        return await asyncio.to_thread(self._cur.fetchall)
+
+
+class _ThreadedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def commit(self):
+        await asyncio.to_thread(self._conn.commit)
+
+    async def rollback(self):
+        await asyncio.to_thread(self._conn.rollback)
+
+
+@asynccontextmanager
+async def get_async_db_cursor():
+    """
+    get_db_cursor() の非同期版。execute / fetch / commit を await する
+
+    使用例:
+        async with get_async_db_cursor() as (cur, conn):
+            await cur.execute("SELECT * FROM user WHERE id = %s", (user_id,))
+            result = await cur.fetchone()
+            await conn.commit()
+
+    aiomysql が使えない（MYSQL_ASYNC=0 を含む）場合は同期プールの接続をスレッドで操作する。
+    """
+    if not ASYNC_ENABLED:
+        pool = get_pool() if POOL_ENABLED else None
+        # 空きを待つ checkout でスレッドを使い切ると、返却（rollback）用のスレッドが取れず詰まる。
+        # 同時に借りに行く数をプールの上限までに抑える
+        async with _threaded_slots():
+            conn = await asyncio.to_thread(pool.checkout) if pool else await asyncio.to_thread(_connect)
+            cur = conn.cursor()
+            broken = False
+            try:
+                yield _ThreadedCursor(cur), _ThreadedConnection(conn)
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+                broken = True
+                raise
+            finally:
+                cur.close()
+                if pool:
+                    await asyncio.to_thread(pool.checkin, conn, broken)
+                else:
+                    conn.close()
+        return
+
+    apool = await _get_async_pool()
+    started = time.monotonic()
+    conn = await apool.acquire()
+    wait_s = time.monotonic() - started
+    _astats["checkouts"] += 1
+    if wait_s > 0.001:
+        _astats["waits"] += 1
+        _astats["wait_time_s"] += wait_s
+        _astats["max_wait_s"] = max(_astats["max_wait_s"], wait_s)
+    broken = False
+    try:
+        async with conn.cursor() as cur:
+            yield cur, conn
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        broken = True
+        raise
     finally:
-        cur.close()
-        conn.close()
+        if not broken:
+            try:
+                # 同期プールと同じく、未コミットのトランザクションは持ち越さない
+                await conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            conn.close()
+        apool.release(conn)
+
+
+def async_pool_stats() -> dict:
+    if not ASYNC_ENABLED:
+        return {"enabled": False, "reason": "aiomysql not installed" if aiomysql is None else "MYSQL_ASYNC=0"}
+    stats = {
+        "enabled": True,
+        **_astats,
+        "wait_time_s": round(_astats["wait_time_s"], 3),
+        "max_wait_s": round(_astats["max_wait_s"], 3),
+    }
+    if _apool is not None:
+        stats.update({"size": _apool.size, "free": _apool.freesize, "in_use": _apool.size - _apool.freesize, "maxsize": _apool.maxsize})
+    return stats
+
+
+async def close_async_pool() -> None:
+    """アプリ終了時に aiomysql プールを閉じる"""
+    global _apool
+    if _apool is not None:
+        _apool.close()
+        await _apool.wait_closed()
+        _apool = None
 
 
 def get_placeholder() -> str:
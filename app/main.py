@@ -1,9 +1,13 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+import os
 from api.routes import user, question, category, keyword, notification, history, admin
 from api.routes import action as action_routes
 from api.routes import chat
+from database_utils import close_async_pool
+from migrations import run_migrations
 
 # ログ設定を改善
 logging.basicConfig(
@@ -21,6 +25,17 @@ uvicorn_logger.setLevel(logging.INFO)
 
 app= FastAPI()
 
+# スキーマのマイグレーションは起動時に一度だけ（ワーカー間は GET_LOCK で排他）。
+# デプロイ手順で python -m migrations を実行する場合は RUN_MIGRATIONS=0 にする
+@app.on_event("startup")
+async def _apply_migrations():
+    if os.getenv("RUN_MIGRATIONS", "1") != "0":
+        await run_in_threadpool(run_migrations)
+
+@app.on_event("shutdown")
+async def _close_db_pools():
+    await close_async_pool()
+
 # 🚨 CORS の設定（必ず FastAPIインスタンスに対して）
 app.add_middleware(
     CORSMiddleware,
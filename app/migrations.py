@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+スキーマのマイグレーション - 起動時（またはデプロイ時に python -m migrations）に一度だけ適用する
+
+適用済みのバージョンは schema_migrations に記録し、未適用のものだけを番号順に実行する。
+ワーカーが同時に起動しても MySQL の GET_LOCK で 1 プロセスだけが適用する。
+各マイグレーションは既に手で変更済みの DB でも失敗しないよう、存在を確認してから変更する。
+
+リクエスト処理中にスキーマ（information_schema）を確認したり ALTER TABLE したりしないこと。
+スキーマの変更はここに新しいバージョンとして追加する。
+"""
+import os
+from typing import Callable, List, Tuple
+
+from database_utils import get_db_cursor, get_placeholder
+from api.utils.pagination import NULL_TIME
+
+LOCK_NAME = "shigachat_schema_migrations"
+LOCK_TIMEOUT_S = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "300"))
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _column_exists(cur, table_name: str, column_name: str) -> bool:
+    ph = get_placeholder()
+    cur.execute(f"""
+        SELECT COUNT(*) AS cnt FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = {ph} AND COLUMN_NAME = {ph}
+    """, (table_name, column_name))
+    return int(cur.fetchone()['cnt']) > 0
+
+def _index_exists(cur, table_name: str, index_name: str) -> bool:
+    ph = get_placeholder()
+    cur.execute(f"""
+        SELECT COUNT(*) AS cnt FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = {ph} AND INDEX_NAME = {ph}
+    """, (table_name, index_name))
+    return int(cur.fetchone()['cnt']) > 0
+
+def _add_column(cur, table_name: str, column_name: str, column_type: str) -> None:
+    if not _column_exists(cur, table_name, column_name):
+        cur.execute(f"ALTER TABLE `{table_name}` ADD COLUMN `{column_name}` {column_type}")
+
+def _add_index(cur, table_name: str, index_name: str, definition: str) -> None:
+    # definition 例: "INDEX `idx` (a, b)" / "FULLTEXT INDEX `ft` (texts) WITH PARSER ngram"
+    if not _index_exists(cur, table_name, index_name):
+        cur.execute(f"ALTER TABLE `{table_name}` ADD {definition}")
+
+
+# ---------------------------------------------------------------------------
+# Migrations（番号は増やす一方。適用済みのものは書き換えない）
+# ---------------------------------------------------------------------------
+
+def _m001_thread_qa_columns(cur) -> None:
+    # 回答の参照（JSON）とアクション種別（rag / action など）
+    _add_column(cur, "thread_qa", "rag_qa", "TEXT")
+    _add_column(cur, "thread_qa", "type", "TEXT")
+
+def _m002_notifications_question_id(cur) -> None:
+    _add_column(cur, "notifications", "question_id", "INT")
+
+def _m003_question_editor_columns(cur) -> None:
+    _add_column(cur, "question", "last_editor_id", "INT")
+    _add_column(cur, "question", "last_edited_at", "DATETIME")
+
+def _m004_answer_translation_history(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS answer_translation_history (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            answer_id INT NOT NULL,
+            language_id INT NOT NULL,
+            texts TEXT NOT NULL,
+            edited_at DATETIME NOT NULL,
+            editor_user_id INT,
+            editor_name TEXT,
+            INDEX idx_ath_answer_lang (answer_id, language_id)
+        )
+    """)
+
+def _m005_question_grammar_check(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_grammar_check (
+            question_id INT NOT NULL,
+            language_id INT NOT NULL,
+            grammar_check_enabled BOOLEAN DEFAULT FALSE,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (question_id, language_id),
+            FOREIGN KEY (question_id) REFERENCES question (question_id),
+            FOREIGN KEY (language_id) REFERENCES language (id)
+        )
+    """)
+
+def _m006_system_user(cur) -> None:
+    # 全体通知は user_id = -1 で登録する（notifications.user_id の外部キーを満たすため）
+    ph = get_placeholder()
+    cur.execute(f"SELECT id FROM user WHERE id = {ph}", (-1,))
+    if cur.fetchone():
+        return
+    try:
+        cur.execute(
+            f"INSERT INTO user (id, name, password, spoken_language) VALUES ({ph}, {ph}, {ph}, {ph})",
+            (-1, "__system__", "", "English"),
+        )
+    except Exception as e:
+        # スキーマが違う環境では作れない。通知の登録側が投稿者の user_id で代替する
+        print(f"システムユーザーを作成できませんでした: {e}")
+
+def _m007_thread_summary(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS thread_summary (
+            thread_id INT NOT NULL PRIMARY KEY,
+            summary TEXT NOT NULL,
+            lang VARCHAR(8) NOT NULL,
+            last_qa_id INT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (thread_id) REFERENCES threads(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+def _m008_list_indexes(cur) -> None:
+    # スレッド一覧（user_id で絞って last_updated, id の降順）と各スレッドの最初の質問・履歴
+    _add_index(cur, "threads", "idx_threads_user_updated", "INDEX `idx_threads_user_updated` (user_id, last_updated, id)")
+    _add_index(cur, "thread_qa", "idx_thread_qa_thread_created", "INDEX `idx_thread_qa_thread_created` (thread_id, created_at, id)")
+    # カテゴリ一覧のページ（category_id = ? AND public = ? ORDER BY time DESC をインデックスだけで読む）。
+    # 等値で絞る列を並べ替えの列より前に置く
+    _add_index(cur, "question", "idx_question_category_public_time",
+               "INDEX `idx_question_category_public_time` (category_id, public, time)")
+    _add_index(cur, "question", "idx_question_user_time", "INDEX `idx_question_user_time` (user_id, time)")
+
+def _m009_translation_fulltext(cur) -> None:
+    # キーワード検索（api/routes/keyword.py）用。CJK も引けるよう ngram パーサを使う。
+    # ストップワードはインデックスを作った時点の設定で固定される。ngram では "a" "i" "to" などを含むトークンが
+    # すべて捨てられ、"visa" "tax" のような英字のキーワードが引けなくなるので、このセッションでは無効にして作る
+    # （mysql/my.cnf でもサーバ全体で無効にしている）
+    cur.execute("SET SESSION innodb_ft_enable_stopword = 0")
+    try:
+        _add_index(cur, "question_translation", "ft_question_translation_texts",
+                   "FULLTEXT INDEX `ft_question_translation_texts` (texts) WITH PARSER ngram")
+        _add_index(cur, "answer_translation", "ft_answer_translation_texts",
+                   "FULLTEXT INDEX `ft_answer_translation_texts` (texts) WITH PARSER ngram")
+    finally:
+        cur.execute("SET SESSION innodb_ft_enable_stopword = DEFAULT")
+
+def _m010_list_times_not_null(cur) -> None:
+    # 一覧のキーセットページングは (時刻, id) で比較するので、時刻が NULL の行があるとそこで途切れる。
+    # NULL を埋めてから NOT NULL にする（COALESCE で並べるとインデックスで並べ替えられなくなる）
+    ph = get_placeholder()
+    cur.execute(f"UPDATE question SET time = {ph} WHERE time IS NULL", (NULL_TIME,))
+    cur.execute("ALTER TABLE `question` MODIFY `time` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP")
+    cur.execute(f"UPDATE threads SET last_updated = {ph} WHERE last_updated IS NULL", (NULL_TIME,))
+    cur.execute("ALTER TABLE `threads` MODIFY `last_updated` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "thread_qa_columns", _m001_thread_qa_columns),
+    (2, "notifications_question_id", _m002_notifications_question_id),
+    (3, "question_editor_columns", _m003_question_editor_columns),
+    (4, "answer_translation_history", _m004_answer_translation_history),
+    (5, "question_grammar_check", _m005_question_grammar_check),
+    (6, "system_user", _m006_system_user),
+    (7, "thread_summary", _m007_thread_summary),
+    (8, "list_indexes", _m008_list_indexes),
+    (9, "translation_fulltext", _m009_translation_fulltext),
+    (10, "list_times_not_null", _m010_list_times_not_null),
+]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def run_migrations() -> List[int]:
+    """未適用のマイグレーションを番号順に適用し、適用したバージョンを返す。失敗したらそこで止めて例外を投げる"""
+    ph = get_placeholder()
+    applied_now: List[int] = []
+    with get_db_cursor() as (cur, conn):
+        cur.execute(f"SELECT GET_LOCK({ph}, {ph}) AS locked", (LOCK_NAME, LOCK_TIMEOUT_S))
+        if not cur.fetchone()['locked']:
+            raise RuntimeError(f"マイグレーションのロックを {LOCK_TIMEOUT_S}s 以内に取得できませんでした")
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT NOT NULL PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {int(r['version']) for r in cur.fetchall()}
+            conn.commit()
+
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"マイグレーション適用: {version:03d}_{name}")
+                # DDL は MySQL では暗黙にコミットされるので、記録は各マイグレーションの後に行う
+                migrate(cur)
+                cur.execute(
+                    f"INSERT INTO schema_migrations (version, name) VALUES ({ph}, {ph})",
+                    (version, name),
+                )
+                conn.commit()
+                applied_now.append(version)
+        finally:
+            cur.execute(f"SELECT RELEASE_LOCK({ph})", (LOCK_NAME,))
+    if applied_now:
+        print(f"マイグレーション完了: {len(applied_now)} 件適用")
+    return applied_now
+
+
+if __name__ == "__main__":
+    applied = run_migrations()
+    print(f"適用したバージョン: {applied or 'なし（最新）'}")
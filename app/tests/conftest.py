@@ -0,0 +1,67 @@
+import importlib.util
+import os
+import sys
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+# app/ をインポートパスに入れる（アプリは app/ をカレントにして起動する前提）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "requires(*modules): 指定したモジュールが入っていなければそのテストだけ skip する"
+    )
+
+def pytest_runtest_setup(item):
+    # 重い依存（numpy / faiss / openai など）はモジュール単位ではなくテスト単位で確認する。
+    # テストモジュールはそれらを先頭で import せず、fixture やテストの中で import すること
+    for marker in item.iter_markers("requires"):
+        missing = [name for name in marker.args if importlib.util.find_spec(name) is None]
+        if missing:
+            pytest.skip(f"未インストール: {', '.join(missing)}")
+
+
+class FakeCursor:
+    """execute された SQL（空白を詰めたもの）と引数を記録し、responder(sql, params) が返す行を fetch で返す"""
+
+    def __init__(self):
+        self.executed = []
+        self.responder = lambda sql, params: []
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.executed.append((sql, tuple(params or ())))
+        self._rows = list(self.responder(sql, tuple(params or ())) or [])
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+class FakeConn:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+@pytest.fixture
+def fake_db():
+    """get_db_cursor() の代わりに、同じ FakeCursor / FakeConn を返すコンテキストマネージャを持つ"""
+    cursor, conn = FakeCursor(), FakeConn()
+
+    @contextmanager
+    def get_db_cursor():
+        yield cursor, conn
+
+    return SimpleNamespace(cursor=cursor, conn=conn, get_db_cursor=get_db_cursor)
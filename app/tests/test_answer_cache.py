@@ -0,0 +1,55 @@
+"""意味的回答キャッシュ（api/utils/answer_cache.py）と RAG 側のキャッシュキー。SQLite は tmp_path に作る"""
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.requires("numpy", "faiss")
+
+RAG_DEPS = ("openai", "lingua", "tiktoken", "tqdm", "dotenv", "pymysql")
+
+
+@pytest.fixture
+def ac(tmp_path, monkeypatch):
+    from api.utils import answer_cache
+    monkeypatch.setattr(answer_cache, "CACHE_PATH", str(tmp_path / "answer_cache.sqlite3"))
+    monkeypatch.setattr(answer_cache, "_local", threading.local())
+    monkeypatch.setattr(answer_cache, "_MATRIX", {})
+    return answer_cache
+
+def _unit(*values):
+    import numpy as np
+    vec = np.asarray(values, dtype="float32")
+    return vec / np.linalg.norm(vec)
+
+def _response(text):
+    return {"type": "rag", "text": text, "meta": {"references": []}}
+
+def test_lookup_hits_near_duplicate_question(ac):
+    ac.store("ja", "m", "在留カードの更新", _unit(1, 0, 0), _response("市役所で"), [7])
+    hit = ac.lookup("ja", "m", _unit(1, 0.05, 0))
+    assert hit["text"] == "市役所で" and hit["meta"]["answer_cache"]["hit"] is True
+    assert ac.lookup("ja", "m", _unit(1, 1, 0)) is None       # 類似度 0.71 < MIN_SIMILARITY
+    assert ac.lookup("en", "m", _unit(1, 0, 0)) is None       # 言語ごと
+    assert ac.lookup("ja", "other", _unit(1, 0, 0)) is None   # キー（モデル@閾値）ごと
+
+def test_answer_without_references_is_not_stored(ac):
+    ac.store("ja", "m", "q", _unit(1, 0), _response("a"), [None])
+    assert ac.lookup("ja", "m", _unit(1, 0)) is None
+
+def test_invalidate_removes_entries_referencing_qa(ac):
+    ac.store("ja", "m", "q1", _unit(1, 0, 0), _response("a1"), [7, 8])
+    ac.store("ja", "m", "q2", _unit(0, 1, 0), _response("a2"), [9])
+    assert ac.lookup("ja", "m", _unit(1, 0, 0)) is not None   # 行列を読み込んでおく
+    assert ac.invalidate_qa_ids([8]) == 1
+    # version が進むので読み込み済みの行列も読み直される
+    assert ac.lookup("ja", "m", _unit(1, 0, 0)) is None
+    assert ac.lookup("ja", "m", _unit(0, 1, 0))["text"] == "a2"
+    assert ac.invalidate_qa_ids([8]) == 0
+
+@pytest.mark.requires(*RAG_DEPS)
+def test_cache_key_separates_similarity_thresholds():
+    from api.utils import RAG
+    # 閾値が違えば参照の集合が変わるので別のエントリにする（0.01 刻みでまとめる）
+    assert RAG._answer_cache_key("gpt-5-nano", 0.3) == RAG._answer_cache_key("gpt-5-nano", 0.301)
+    assert RAG._answer_cache_key("gpt-5-nano", 0.3) != RAG._answer_cache_key("gpt-5-nano", 0.35)
+    assert RAG._answer_cache_key("gpt-5-nano", 0.3) != RAG._answer_cache_key("gpt-5-mini", 0.3)
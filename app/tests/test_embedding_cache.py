@@ -0,0 +1,96 @@
+"""埋め込みキャッシュ（api/utils/embedding_cache.py）。SQLite は tmp_path に作る"""
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.requires("numpy", "faiss")
+
+RAG_DEPS = ("openai", "lingua", "tiktoken", "tqdm", "dotenv", "pymysql")
+
+
+@pytest.fixture
+def ec(tmp_path, monkeypatch):
+    from api.utils import embedding_cache
+    monkeypatch.setattr(embedding_cache, "CACHE_PATH", str(tmp_path / "embedding_cache.sqlite3"))
+    monkeypatch.setattr(embedding_cache, "_local", threading.local())
+    return embedding_cache
+
+
+# ----------------------------------------------------------------------------
+# (model, sha256(payload)) キーの埋め込みキャッシュ（user-007）
+# ----------------------------------------------------------------------------
+
+def test_put_many_round_trips_per_model(ec):
+    import numpy as np
+    key = ec.content_key("Q: 在留カード\nA: 市役所")
+    ec.put_many("m1", {key: [0.5, 0.25, 1.0]})
+    found = ec.get_many("m1", [key, ec.content_key("other"), key])
+    assert list(found) == [key]
+    assert found[key].dtype == np.float32 and found[key].tolist() == [0.5, 0.25, 1.0]
+    assert ec.get("m2", key) is None
+
+@pytest.mark.requires(*RAG_DEPS)
+def test_get_embeddings_requests_only_misses(ec, monkeypatch):
+    from api.utils import RAG
+    requested = []
+
+    def fake_request(texts, retries=3):
+        requested.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    monkeypatch.setattr(RAG, "embedding_cache", ec)
+    monkeypatch.setattr(RAG, "_request_embeddings", fake_request)
+    ec.put_many(RAG.EMBEDDING_MODEL, {ec.content_key("cached"): [9.0, 9.0]})
+
+    out = RAG.get_embeddings(["cached", "new", "new", "x"])
+    assert requested == [["new", "x"]]
+    assert out == [[9.0, 9.0], [3.0, 1.0], [3.0, 1.0], [1.0, 1.0]]
+    # 2 回目は API を呼ばない
+    assert RAG.get_embeddings(["x", "new"]) == [[1.0, 1.0], [3.0, 1.0]]
+    assert len(requested) == 1
+
+
+# ----------------------------------------------------------------------------
+# クエリ埋め込み（TTL・件数上限・プロセス内 LRU）（user-008）
+# ----------------------------------------------------------------------------
+
+@pytest.fixture
+def qc(ec, monkeypatch):
+    from collections import OrderedDict
+    monkeypatch.setattr(ec, "_QUERY_LRU", OrderedDict())
+    monkeypatch.setattr(ec, "_query_writes_since_prune", 0)
+    return ec
+
+def test_query_key_ignores_width_case_and_spaces(qc):
+    assert qc.query_key("ＶＩＳＡ  の 更新") == qc.query_key("visa の　更新")
+    assert qc.query_key("visa の更新") != qc.query_key("visa の 更新")
+
+def test_query_is_shared_across_workers(qc):
+    qc.put_query("m", "k", [1.0, 2.0])
+    qc._QUERY_LRU.clear()  # 別ワーカー（ローカル LRU が空）を想定
+    assert qc.get_query("m", "k").tolist() == [1.0, 2.0]
+    assert ("m", "k") in qc._QUERY_LRU
+
+def test_expired_query_misses(qc, monkeypatch):
+    qc.put_query("m", "k", [1.0])
+    monkeypatch.setattr(qc, "QUERY_TTL_SECONDS", 0)
+    assert qc.get_query("m", "k") is None
+    assert ("m", "k") not in qc._QUERY_LRU
+
+def test_prune_runs_every_n_writes(qc, monkeypatch):
+    calls = []
+    monkeypatch.setattr(qc, "_QUERY_PRUNE_EVERY", 3)
+    monkeypatch.setattr(qc, "prune_queries", lambda: calls.append(1) or 0)
+    for i in range(7):
+        qc.put_query("m", f"k{i}", [float(i)])
+    assert len(calls) == 2
+
+def test_prune_keeps_newest_entries(qc, monkeypatch):
+    monkeypatch.setattr(qc, "QUERY_MAX_ENTRIES", 2)
+    for i in range(5):
+        qc.put_query("m", f"k{i}", [float(i)])
+        qc._conn().execute("UPDATE query_embeddings SET created_at = ? WHERE key = ?", (1e9 + i, f"k{i}"))
+    monkeypatch.setattr(qc, "QUERY_TTL_SECONDS", 10 ** 10)
+    assert qc.prune_queries() == 3
+    keys = [r[0] for r in qc._conn().execute("SELECT key FROM query_embeddings ORDER BY key")]
+    assert keys == ["k3", "k4"]
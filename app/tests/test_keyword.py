@@ -0,0 +1,59 @@
+"""キーワード検索（api/routes/keyword.py）。DB は conftest の fake_db で置き換え、組み立てた SQL を確かめる"""
+import pytest
+
+pytestmark = pytest.mark.requires("fastapi", "jose", "pymysql", "dotenv", "openai")
+
+
+def _row(qa_id):
+    return {
+        "question_id": qa_id, "question_text": f"q{qa_id}", "answer_id": qa_id + 100, "answer_text": f"a{qa_id}",
+        "time": None, "category_id": 1, "category_description": "c", "title": "", "score": 1.0,
+    }
+
+@pytest.fixture
+def keyword(fake_db, monkeypatch):
+    from api.routes import keyword
+    monkeypatch.setattr(keyword, "get_db_cursor", fake_db.get_db_cursor)
+    monkeypatch.setattr(keyword, "_fulltext_available", True)
+    return keyword
+
+def _search_sql(fake_db):
+    return fake_db.cursor.executed[-1]
+
+def test_no_limit_returns_every_hit(keyword, fake_db):
+    # フロントエンドはページングしないので、limit を省略したら全件返す（50 件で切らない）
+    fake_db.cursor.responder = lambda sql, params: [_row(i) for i in range(1, 121)]
+    results = keyword.search_keywords_in_language(["在留"], 1)
+    sql, params = _search_sql(fake_db)
+    assert "LIMIT" not in sql
+    assert len(results) == 120
+
+def test_limit_pages_with_offset(keyword, fake_db):
+    keyword.search_keywords_in_language(["在留"], 1, limit=20, offset=40)
+    sql, params = _search_sql(fake_db)
+    assert sql.endswith("LIMIT %s OFFSET %s")
+    assert params[-2:] == (20, 40)
+
+def test_latin_keyword_uses_fulltext(keyword, fake_db):
+    # 英字のキーワードも FULLTEXT（ストップワード無効で作ったインデックス。test_migrations 参照）で引く
+    fake_db.cursor.responder = lambda sql, params: [dict(_row(1), question_text="Visa renewal", answer_text="visa office")]
+    results = keyword.search_keywords_in_language(["visa"], 2)
+    sql, params = _search_sql(fake_db)
+    assert "MATCH(qtr.texts) AGAINST" in sql and "LIKE" not in sql
+    assert '"visa"' in params
+    assert [r["question_text"] for r in results] == ["Visa renewal"]
+
+def test_single_character_keyword_falls_back_to_like(keyword, fake_db):
+    keyword.search_keywords_in_language(["税"], 1)
+    sql, params = _search_sql(fake_db)
+    assert "MATCH" not in sql and "%税%" in params
+
+def test_missing_fulltext_index_falls_back_to_like(keyword, fake_db):
+    def responder(sql, params):
+        if "MATCH" in sql:
+            raise Exception(keyword.ER_FT_MATCHING_KEY_NOT_FOUND, "Can't find FULLTEXT index matching the column list")
+        return [_row(1)]
+    fake_db.cursor.responder = responder
+    assert len(keyword.search_keywords_in_language(["visa"], 2)) == 1
+    assert "LIKE" in _search_sql(fake_db)[0]
+    assert keyword._fulltext_available is False
@@ -0,0 +1,37 @@
+"""BM25 の分かち書き・索引の差し替えと RRF（api/utils/lexical.py）"""
+import pytest
+
+pytestmark = pytest.mark.requires("numpy", "faiss")
+
+
+@pytest.fixture
+def lexical():
+    from api.utils import lexical
+    return lexical
+
+
+def test_tokenize_cjk_bigrams_and_words(lexical):
+    # CJK は文字 bigram、それ以外は NFKC + casefold した単語（全角英数も半角になる）
+    assert lexical.tokenize("在留カード") == ["在留", "留カ", "カー", "ード"]
+    assert lexical.tokenize("Ｖｉｓａ 2025") == ["visa", "2025"]
+    assert lexical.tokenize("税") == ["税"]
+
+def test_search_ranks_exact_term_first(lexical):
+    index = lexical.BM25Index("ja")
+    index.add(1, 0, "在留カードの更新手続き")
+    index.add(2, 1, "ごみの出し方")
+    index.add(3, 2, "病院の予約")
+    assert [row for row, _ in index.search("在留カード", 3)] == [0]
+
+def test_remove_qa_drops_every_language_row(lexical):
+    index = lexical.BM25Index("unified")
+    index.add((1, 1), 0, "visa renewal")
+    index.add((1, 2), 1, "visa 更新")
+    index.add((2, 1), 2, "garbage day")
+    index.remove_qa(1)
+    assert index.search("visa", 5) == []
+    assert index.total_len == sum(index.doc_len.values())
+
+def test_reciprocal_rank_fusion_rewards_agreement(lexical):
+    fused = lexical.reciprocal_rank_fusion([[1, 2, 3], [3, 1]])
+    assert [row for row, _ in fused][:2] == [1, 3]
@@ -0,0 +1,82 @@
+"""スキーマのマイグレーション（migrations.py）。DB は conftest の fake_db で置き換え、実行された SQL を確かめる"""
+import pytest
+
+pytestmark = pytest.mark.requires("pymysql", "dotenv")
+
+
+@pytest.fixture
+def migrations():
+    import migrations
+    return migrations
+
+def test_fulltext_indexes_are_built_without_stopwords(migrations, fake_db):
+    # 既定のストップワードが有効なまま ngram インデックスを作ると "visa" などの英字キーワードが引けない
+    fake_db.cursor.responder = lambda sql, params: [{"cnt": 0}] if "information_schema" in sql else []
+    migrations._m009_translation_fulltext(fake_db.cursor)
+    statements = [sql for sql, _ in fake_db.cursor.executed if "information_schema" not in sql]
+    assert statements[0] == "SET SESSION innodb_ft_enable_stopword = 0"
+    assert all("FULLTEXT" in sql for sql in statements[1:3])
+    assert statements[-1] == "SET SESSION innodb_ft_enable_stopword = DEFAULT"
+
+
+# ----------------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------------
+
+@pytest.fixture
+def runner(migrations, fake_db, monkeypatch):
+    """MIGRATIONS を 1〜3 の偽物に差し替える。applied / failing / locked を書き換えて状況を作る"""
+    from types import SimpleNamespace
+    state = SimpleNamespace(ran=[], applied=[], failing=set(), locked=1)
+
+    def step(version):
+        def migrate(cur):
+            state.ran.append(version)
+            if version in state.failing:
+                raise RuntimeError(f"migration {version} failed")
+        return migrate
+
+    def responder(sql, params):
+        if sql.startswith("SELECT GET_LOCK"):
+            return [{"locked": state.locked}]
+        if sql == "SELECT version FROM schema_migrations":
+            return [{"version": v} for v in state.applied]
+        return []
+
+    monkeypatch.setattr(migrations, "get_db_cursor", fake_db.get_db_cursor)
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(v, f"m{v}", step(v)) for v in (1, 2, 3)])
+    fake_db.cursor.responder = responder
+    return state
+
+def _recorded(fake_db):
+    return [params[0] for sql, params in fake_db.cursor.executed if sql.startswith("INSERT INTO schema_migrations")]
+
+def _released(fake_db):
+    return fake_db.cursor.executed[-1][0].startswith("SELECT RELEASE_LOCK")
+
+def test_runner_applies_only_pending_versions(migrations, runner, fake_db):
+    runner.applied = [1]
+    assert migrations.run_migrations() == [2, 3]
+    assert runner.ran == [2, 3]
+    assert _recorded(fake_db) == [2, 3]
+    assert _released(fake_db)
+
+def test_runner_is_a_noop_when_up_to_date(migrations, runner, fake_db):
+    runner.applied = [1, 2, 3]
+    assert migrations.run_migrations() == []
+    assert runner.ran == [] and _recorded(fake_db) == []
+    assert _released(fake_db)
+
+def test_failed_migration_stops_and_is_not_recorded(migrations, runner, fake_db):
+    runner.failing = {2}
+    with pytest.raises(RuntimeError, match="migration 2 failed"):
+        migrations.run_migrations()
+    assert runner.ran == [1, 2]
+    assert _recorded(fake_db) == [1]
+    assert _released(fake_db)
+
+def test_runner_raises_when_lock_is_not_acquired(migrations, runner, fake_db):
+    runner.locked = 0
+    with pytest.raises(RuntimeError):
+        migrations.run_migrations()
+    assert runner.ran == [] and len(fake_db.cursor.executed) == 1
@@ -0,0 +1,39 @@
+"""キーセットページングのカーソルと件数の扱い（api/utils/pagination.py）"""
+from datetime import datetime
+
+import pytest
+
+from api.utils.pagination import NULL_TIME, SNIPPET_CHARS, clamp_limit, encode_cursor, parse_cursor, snippet
+
+
+def test_cursor_round_trip():
+    t = datetime(2025, 10, 21, 12, 19, 47, 123456)
+    assert parse_cursor(encode_cursor(t, 123)) == (t, 123)
+
+def test_null_time_still_yields_a_cursor():
+    # 最後の行の時刻が NULL でも次ページのカーソルを返す（None だとクライアントはそこで止まる）
+    cursor = encode_cursor(None, 7)
+    assert cursor is not None
+    assert parse_cursor(cursor) == (NULL_TIME, 7)
+
+def test_no_cursor_means_first_page():
+    assert parse_cursor(None) is None
+    assert parse_cursor("") is None
+
+@pytest.mark.parametrize("cursor", ["123", "not-a-time,5", "2025-10-21T12:19:47,abc"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        parse_cursor(cursor)
+
+def test_clamp_limit():
+    assert clamp_limit(None, 0, 500) == 0  # 省略時は既定値（0 = 全件）
+    assert clamp_limit(None, 50, 500) == 50
+    assert clamp_limit(10_000, 50, 500) == 500
+    assert clamp_limit(0, 50, 500) == 1
+    assert clamp_limit(-3, 50, 500) == 1
+
+def test_snippet():
+    assert snippet(None) is None
+    assert snippet("短い") == "短い"
+    long_text = "あ" * (SNIPPET_CHARS + 1)
+    assert snippet(long_text) == "あ" * SNIPPET_CHARS + "…"
@@ -0,0 +1,57 @@
+"""ハイブリッド検索（RAG_HYBRID）で BM25 上位の行が類似度閾値をどこまで免除されるか"""
+import pytest
+
+pytestmark = pytest.mark.requires("numpy", "faiss", "openai", "lingua", "tiktoken", "tqdm", "dotenv", "pymysql")
+
+
+class _Snapshot:
+    """行 i の正規化済みベクトルとクエリ [1, 0] のコサイン類似度が sims[i] になるストア"""
+
+    def __init__(self, sims):
+        import numpy as np
+        self.vectors = np.array([[s, (1 - s * s) ** 0.5] for s in sims], dtype="float32")
+        self.ntotal = len(sims)
+        self.unified = False
+
+    def get_vector(self, row):
+        return self.vectors[row]
+
+    def get_meta(self, row):
+        return row + 100, row + 1000
+
+    def get_text(self, row):
+        return f"q{row}", f"a{row}", None
+
+
+@pytest.fixture
+def query_vec():
+    import numpy as np
+    return np.array([[1.0, 0.0]], dtype="float32")
+
+@pytest.fixture
+def RAG(monkeypatch):
+    from api.utils import RAG
+    monkeypatch.setattr(RAG, "_fetch_hit_details", lambda qa_ids, question_ids: ({}, {}))
+    return RAG
+
+def _search(RAG, monkeypatch, snapshot, query_vec, vector_ranked, lexical_rows, threshold=0.3):
+    monkeypatch.setattr(RAG.lexical, "search", lambda snap, query, k: [(row, 5.0) for row in lexical_rows])
+    ranked, keep = RAG._fuse_with_lexical(snapshot, query_vec, "それの費用は", vector_ranked, 10)
+    return RAG._hydrate_hits(snapshot, ranked, keep, threshold, 0.0)
+
+def test_unrelated_lexical_hit_is_not_kept(RAG, monkeypatch, query_vec):
+    # 文字 bigram が偶然一致しただけの行（類似度 0.05）は BM25 の 1 位でも参照に入れない
+    snapshot = _Snapshot([0.1, 0.08, 0.05])
+    results = _search(RAG, monkeypatch, snapshot, query_vec, [(0, 0.1), (1, 0.08)], [2])
+    assert results == {}
+
+def test_lexical_hit_near_threshold_is_kept(RAG, monkeypatch, query_vec):
+    # 閾値 - LEXICAL_MARGIN 以上なら BM25 上位は閾値を下回っていても残す
+    snapshot = _Snapshot([0.1, 0.08, 0.3 - RAG.LEXICAL_MARGIN + 0.02])
+    results = _search(RAG, monkeypatch, snapshot, query_vec, [(0, 0.1), (1, 0.08)], [2])
+    assert [r["qa_id"] for r in results.values()] == [102]
+
+def test_vector_only_rows_still_use_threshold(RAG, monkeypatch, query_vec):
+    snapshot = _Snapshot([0.25, 0.5])
+    results = _search(RAG, monkeypatch, snapshot, query_vec, [(1, 0.5), (0, 0.25)], [])
+    assert [r["qa_id"] for r in results.values()] == [101]
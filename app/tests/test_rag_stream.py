@@ -0,0 +1,101 @@
+"""SSE 用の非同期ストリーミング（RAG.answer_with_rag_stream_async）。検索と LLM は偽物に置き換える"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytestmark = pytest.mark.requires("numpy", "faiss", "openai", "lingua", "tiktoken", "tqdm", "dotenv", "pymysql")
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class _FakeAsyncClient:
+    """chat.completions.create(stream=True) で pieces を 1 つずつ返す AsyncOpenAI の代わり"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **kwargs):
+        return self
+
+    async def _create(self, **kwargs):
+        self.calls.append(kwargs)
+
+        async def stream():
+            for piece in self.pieces:
+                await asyncio.sleep(0)
+                yield _chunk(piece)
+        return stream()
+
+@pytest.fixture
+def RAG(monkeypatch):
+    from api.utils import RAG
+    stored = []
+
+    async def fake_arag(question, similarity_threshold=0.3, history_qa=None, cached_summary=None):
+        return {1: {"question": "在留カードの更新は？", "answer": "市役所で更新します", "qa_id": 7, "similarity": 0.9}}
+
+    async def no_cache(lang, model, question_text, history_qa):
+        return None, None
+
+    def blocking(*args, **kwargs):
+        raise AssertionError("ストリーミングの経路から同期の検索・クライアントを呼んでいる")
+
+    monkeypatch.setattr(RAG, "_ENCODING", False)
+    monkeypatch.setattr(RAG, "detect_lang", lambda text: "ja")
+    monkeypatch.setattr(RAG, "arag", fake_arag)
+    monkeypatch.setattr(RAG, "rag", blocking)
+    monkeypatch.setattr(RAG, "client", SimpleNamespace(with_options=blocking))
+    monkeypatch.setattr(RAG, "_alookup_answer_cache", no_cache)
+    monkeypatch.setattr(RAG, "_store_answer_cache", lambda *args: stored.append(args))
+    RAG.stored = stored
+    return RAG
+
+def _collect(RAG, question="在留カードはどこで更新しますか"):
+    async def run():
+        return [event async for event in RAG.answer_with_rag_stream_async(question, [])]
+    return asyncio.run(run())
+
+def test_stream_yields_references_deltas_then_done(RAG, monkeypatch):
+    body = json.dumps({"answer": "市役所で更新します [S1]", "used_source_ids": ["S1"], "evidence": []}, ensure_ascii=False)
+    fake = _FakeAsyncClient([body[i:i + 5] for i in range(0, len(body), 5)])
+    monkeypatch.setattr(RAG, "async_client", fake)
+
+    events = _collect(RAG)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "references" and kinds[-1] == "done"
+    assert events[0][1]["references"][0]["qa_id"] == 7
+    assert "".join(value for kind, value in events if kind == "delta") == "市役所で更新します"
+    assert events[-1][1]["text"] == "市役所で更新します"
+    assert fake.calls[0]["stream"] is True
+    assert len(RAG.stored) == 1
+
+def test_stream_shares_retrieval_with_answer_with_rag_async(RAG, monkeypatch):
+    calls = []
+    original = RAG._aretrieve
+
+    async def spy(*args, **kwargs):
+        calls.append(args)
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(RAG, "_aretrieve", spy)
+    monkeypatch.setattr(RAG, "async_client", _FakeAsyncClient(['{"answer": "はい"}']))
+    _collect(RAG)
+    assert len(calls) == 1
+
+def test_cached_answer_is_streamed_without_generation(RAG, monkeypatch):
+    cached = {"type": "rag", "text": "キャッシュ済み", "meta": {"references": [{"sid": "S1"}]}}
+
+    async def hit(lang, model, question_text, history_qa):
+        return None, cached
+
+    monkeypatch.setattr(RAG, "_alookup_answer_cache", hit)
+    fake = _FakeAsyncClient([])
+    monkeypatch.setattr(RAG, "async_client", fake)
+    events = _collect(RAG)
+    assert events == [("references", {"lang": "ja", "references": [{"sid": "S1"}]}), ("delta", "キャッシュ済み"), ("done", cached)]
+    assert fake.calls == []
@@ -0,0 +1,79 @@
+"""reactive タスク（api/utils/reactive.py）と /chat/respond のルーティング。LLM は asyncio.sleep の偽物に置き換える"""
+import asyncio
+import time
+
+import pytest
+
+REACTIVE_DEPS = ("openai", "httpx", "dotenv")
+CHAT_DEPS = REACTIVE_DEPS + ("fastapi", "jose", "pymysql", "numpy", "faiss", "lingua", "tiktoken", "tqdm")
+LLM_LATENCY_S = 0.2
+
+TASK_TYPES = [
+    "translate", "summarize", "rewrite", "simplify", "shorten", "expand", "bullets", "outline", "title",
+    "keywords", "entities", "keypoints", "sentiment", "format", "proofread_strict", "style", "detect_lang",
+]
+
+
+@pytest.fixture
+def reactive(monkeypatch):
+    from api.utils import reactive
+    prompts = []
+
+    async def fake_achat_text(messages, *, model, timeout_s=20, **kwargs):
+        prompts.append(messages[-1]["content"])
+        await asyncio.sleep(LLM_LATENCY_S)
+        return "ok"
+
+    def blocking_chat_text(*args, **kwargs):
+        raise AssertionError("async の経路から同期クライアントを呼んでいる")
+
+    monkeypatch.setattr(reactive, "achat_text", fake_achat_text)
+    monkeypatch.setattr(reactive, "chat_text", blocking_chat_text)
+    reactive.prompts = prompts
+    return reactive
+
+@pytest.mark.requires(*REACTIVE_DEPS)
+@pytest.mark.parametrize("task_type", TASK_TYPES)
+def test_every_task_type_has_a_prompt(reactive, task_type):
+    prompt = reactive.task_prompt(task_type, "Q: 質問\nA: 回答本文", "en", "JSON にして")
+    assert "回答本文" in prompt
+
+@pytest.mark.requires(*REACTIVE_DEPS)
+def test_arun_task_awaits_the_async_client(reactive):
+    out = asyncio.run(reactive.arun_task("bullets", "本文", "ja"))
+    assert out == "ok"
+    assert reactive.prompts[0].startswith("Convert the following into clear bullet points")
+
+
+@pytest.fixture
+def chat(reactive, monkeypatch):
+    from api.routes import chat
+    saved = []
+    monkeypatch.setattr(chat, "_resolve_thread", lambda user_id, thread_id: 1)
+    monkeypatch.setattr(chat, "_get_last_5_history", lambda thread_id: [])
+    monkeypatch.setattr(chat, "_save_reactive_answer", lambda *args: saved.append(args))
+    chat.saved = saved
+    return chat
+
+def _respond(chat, text):
+    from models.schemas import Question
+    return chat.respond(Question(text=text), current_user={"id": 1, "spoken_language": "ja"})
+
+@pytest.mark.requires(*CHAT_DEPS)
+def test_respond_uses_the_task_specific_prompt(chat, reactive):
+    # 以前は translate / summarize 以外の種別がすべて rewrite として処理されていた
+    result = asyncio.run(_respond(chat, "タイトルをつけて：在留カードは市役所で更新します"))
+    assert result["task_type"] == "title"
+    assert reactive.prompts[0].startswith("Generate a single-line, informative title")
+
+@pytest.mark.requires(*CHAT_DEPS)
+def test_concurrent_responds_overlap_llm_waits(chat):
+    # LLM 待ちでイベントループが塞がれていれば 16 件で 16 × 0.2s かかる
+    async def run_all():
+        return await asyncio.gather(*[_respond(chat, f"英語に翻訳して：こんにちは {i}") for i in range(16)])
+
+    started = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+    assert all(r["route"] == "frontend" for r in results)
+    assert elapsed < LLM_LATENCY_S * 4
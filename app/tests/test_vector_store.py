@@ -0,0 +1,157 @@
+"""世代管理のベクトルストア（api/utils/vector_store.py）。ファイルは tmp_path に書く"""
+import pytest
+
+pytestmark = pytest.mark.requires("numpy", "faiss")
+
+DIM = 8
+
+
+@pytest.fixture
+def vs(tmp_path, monkeypatch):
+    from api.utils import vector_store
+    monkeypatch.setattr(vector_store, "VECTOR_DIR", tmp_path)
+    vector_store._CACHE.clear()
+    vector_store._ANN_CACHE.clear()
+    yield vector_store
+    vector_store._CACHE.clear()
+    vector_store._ANN_CACHE.clear()
+
+def _vectors(n, seed=0):
+    import faiss
+    import numpy as np
+    vectors = np.random.default_rng(seed).standard_normal((n, DIM)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def _rows(qa_ids):
+    meta = [(qa_id, qa_id + 1000) for qa_id in qa_ids]
+    texts = [(f"q{qa_id}", f"a{qa_id}", None) for qa_id in qa_ids]
+    return meta, texts
+
+def _write(vs, qa_ids, index_type=None, seed=0):
+    meta, texts = _rows(qa_ids)
+    with vs.write_lock("ja"):
+        return vs.write_store("ja", _vectors(len(qa_ids), seed), meta, texts, index_type=index_type)
+
+
+# ----------------------------------------------------------------------------
+# インデックス種別の選択（user-011）
+# ----------------------------------------------------------------------------
+
+def test_requested_type_below_ann_min_rows_is_flat(vs, monkeypatch):
+    monkeypatch.setattr(vs, "ANN_MIN_ROWS", 1000)
+    assert vs.choose_index_type(999, "hnsw") == "flat"
+    assert vs.choose_index_type(1000, "hnsw") == "hnsw"
+    assert vs.choose_index_type(0, "ivf_pq") == "flat"
+
+def test_requested_type_is_capped_by_training_rows(vs, monkeypatch):
+    monkeypatch.setattr(vs, "ANN_MIN_ROWS", 1)
+    assert vs.choose_index_type(20, "ivf_flat") == "hnsw"
+    assert vs.choose_index_type(500, "ivf_pq") == "ivf_flat"
+    assert vs.choose_index_type(20, "ivf_pq") == "hnsw"
+    assert vs.choose_index_type(vs.TRAIN_MIN_ROWS["ivf_pq"], "ivf_pq") == "ivf_pq"
+    assert vs.choose_index_type(20, "sq8") == "sq8"
+
+def test_small_store_with_requested_ivf_pq_writes(vs, monkeypatch):
+    # 以前は学習点が足りず build_index が例外になり、その QA がストアに入らなかった
+    monkeypatch.setattr(vs, "ANN_MIN_ROWS", 1)
+    _write(vs, list(range(1, 51)), index_type="ivf_pq")
+    snapshot = vs.get_snapshot("ja")
+    assert snapshot.index_type == "ivf_flat"
+    D, I = snapshot.search(_vectors(50)[:1], 1)
+    assert int(I[0, 0]) == 0
+
+def test_ann_index_is_reused_across_delta_generations(vs, monkeypatch):
+    monkeypatch.setattr(vs, "ANN_MIN_ROWS", 1)
+    _write(vs, list(range(1, 101)), index_type="hnsw")
+    first = vs.get_snapshot("ja")
+    meta, texts = _rows([500])
+    with vs.write_lock("ja"):
+        assert vs.upsert_locked("ja", 500, _vectors(1, seed=9), meta, texts)
+    second = vs.get_snapshot("ja")
+    assert second.generation > first.generation
+    assert second.index is first.index
+
+
+# ----------------------------------------------------------------------------
+# QA.id をキーにした差分追加と tombstone（user-004）
+# ----------------------------------------------------------------------------
+
+def _qa_ids(snapshot, I):
+    return [snapshot.get_meta(int(i))[0] for i in I[0] if i >= 0]
+
+def test_upsert_appends_delta_and_tombstones_old_row(vs):
+    _write(vs, list(range(1, 11)))
+    new_vec = _vectors(1, seed=5)
+    meta, texts = _rows([3])
+    with vs.write_lock("ja"):
+        assert vs.upsert_locked("ja", 3, new_vec, meta, texts)
+
+    snapshot = vs.get_snapshot("ja")
+    assert (snapshot.ntotal, snapshot.live_count) == (11, 10)
+    assert snapshot.delta is not None and list(snapshot.tombstones) == [2]
+    assert list(snapshot.rows_of({3})) == [10]
+    D, I = snapshot.search(new_vec, 1)
+    assert int(I[0, 0]) == 10 and snapshot.get_meta(10) == (3, 1003)
+    # 古い行は欠番になり、元のベクトルで引いても出てこない
+    old_vec = _vectors(10)[2:3]
+    _, I = snapshot.search(old_vec, 10)
+    assert 2 not in I[0]
+
+def test_remove_hides_rows_from_search(vs):
+    _write(vs, list(range(1, 11)))
+    with vs.write_lock("ja"):
+        assert vs.remove_locked("ja", [3, 5, 99]) == 2
+        assert vs.remove_locked("ja", [99]) == 0
+
+    snapshot = vs.get_snapshot("ja")
+    assert snapshot.live_count == 8
+    assert list(snapshot.live_rows()) == [0, 1, 3, 5, 6, 7, 8, 9]
+    _, I = snapshot.search(_vectors(10)[[2, 4]], 10)
+    assert all(qa not in (3, 5) for row in I for qa in [snapshot.get_meta(int(i))[0] for i in row if i >= 0])
+    assert len(_qa_ids(snapshot, I[:1])) == 8
+
+def test_remove_everything_returns_empty_results(vs):
+    _write(vs, [1, 2])
+    with vs.write_lock("ja"):
+        vs.remove_locked("ja", [1, 2])
+    snapshot = vs.get_snapshot("ja")
+    D, I = snapshot.search(_vectors(1), 3)
+    assert snapshot.live_count == 0 and (I == -1).all()
+
+
+# ----------------------------------------------------------------------------
+# コンパクション（user-005）
+# ----------------------------------------------------------------------------
+
+def test_compaction_merges_delta_and_drops_dead_rows(vs):
+    _write(vs, list(range(1, 11)))
+    new_vec = _vectors(1, seed=5)
+    meta, texts = _rows([3])
+    with vs.write_lock("ja"):
+        vs.upsert_locked("ja", 3, new_vec, meta, texts)
+        vs.remove_locked("ja", [5])
+        # QA テーブルから消えた 7 もここで落とす
+        stats = vs.compact_locked("ja", set(range(1, 11)) - {5, 7})
+
+    # rows は生きている行の数。tombstone 済みの 2 行（古い 3 と 5）は数えずに物理削除される
+    assert (stats["before"]["rows"], stats["after"]["rows"], stats["removed"]) == (9, 8, 1)
+    manifest = vs.read_manifest("ja")
+    assert not manifest.get("delta_rows") and not manifest.get("tombstones")
+    snapshot = vs.get_snapshot("ja")
+    assert snapshot.delta is None and snapshot.ntotal == snapshot.live_count == 8
+    assert sorted(snapshot.get_meta(i)[0] for i in range(8)) == [1, 2, 3, 4, 6, 8, 9, 10]
+    # 3 は差分に追加した新しいベクトルが残る
+    _, I = snapshot.search(new_vec, 1)
+    assert snapshot.get_meta(int(I[0, 0]))[0] == 3
+    # 前の世代のファイルは回収される
+    generations = {p.name.split(".")[1] for p in vs.VECTOR_DIR.glob("vectors_ja.*.npy")}
+    assert generations == {f"g{snapshot.generation}"}
+
+def test_compaction_without_changes_keeps_generation(vs):
+    _write(vs, [1, 2, 3])
+    before = vs.read_manifest("ja")["generation"]
+    with vs.write_lock("ja"):
+        stats = vs.compact_locked("ja", {1, 2, 3})
+    assert stats["removed"] == 0
+    assert vs.read_manifest("ja")["generation"] == before
@@ -27,6 +27,9 @@ import {
   ArrowLeft
 } from "lucide-react";
 
+// /category/category/{id} の 1 ページの件数（サーバ側の上限は 500）
+const CATEGORY_PAGE_SIZE = 200;
+
 // カテゴリアイコンのマッピング（Q_List.jsと同じ）
 const categoryIcons = {
   "category-zairyu": IdCard,
@@ -157,31 +160,38 @@ function CategoryDetail() {
             
             setCategoryName(categoryNameText);
 
-            const response = await fetch(`${API_BASE_URL}/category/category/${categoryId}?lang=${lang}`, {
-                headers: {
-                    Authorization: `Bearer ${token}`,
-                },
-            });
+            // 質問は新しい順に CATEGORY_PAGE_SIZE 件ずつ返るので、next_cursor がなくなるまで続きを取得する
+            const allQuestions = [];
+            let after = null;
+            do {
+                const params = new URLSearchParams({ lang, limit: String(CATEGORY_PAGE_SIZE) });
+                if (after) params.set("after", after);
+                const response = await fetch(`${API_BASE_URL}/category/category/${categoryId}?${params}`, {
+                    headers: {
+                        Authorization: `Bearer ${token}`,
+                    },
+                });
 
-            if (response.status === 401) {
-                console.warn("トークンが期限切れです。ログインページへ移動します。");
-                redirectToLogin(navigate);
-                return;
-            }
+                if (response.status === 401) {
+                    console.warn("トークンが期限切れです。ログインページへ移動します。");
+                    redirectToLogin(navigate);
+                    return;
+                }
 
-            if (!response.ok) {
-                throw new Error("サーバーからデータを取得できませんでした");
-            }
+                if (!response.ok) {
+                    throw new Error("サーバーからデータを取得できませんでした");
+                }
+
+                const data = await response.json();
+                allQuestions.push(...(data.questions || []));
+                after = data.next_cursor;
+            } while (after);
 
-            const data = await response.json();
-            console.log("📊 取得したデータ:", data);
-            console.log("📊 質問データ:", data.questions);
-            if (data.questions && data.questions.length > 0) {
-                console.log("📊 最初の質問:", data.questions[0]);
-                console.log("📊 質問フィールドの型:", typeof data.questions[0].質問);
-                console.log("📊 回答フィールドの型:", typeof data.questions[0].回答);
+            console.log("📊 質問データ:", allQuestions.length, "件");
+            if (allQuestions.length > 0) {
+                console.log("📊 最初の質問:", allQuestions[0]);
             }
-            setQuestions(data.questions);
+            setQuestions(allQuestions);
         } catch (error) {
             console.error("エラー:", error);
             setQuestions([]);